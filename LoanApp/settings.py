@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,7 +44,8 @@ INSTALLED_APPS = [
     'reversion',
     'reversion_compare',
 
-    'loans',
+    'audit',
+    'loans.apps.LoansConfig',
     'userman',
 ]
 
@@ -87,6 +89,78 @@ DATABASES = {
     'default': dj_database_url.config(default=DEFAULT_DATABASE_URL),
 }
 
+# Read replicas of the default database, as comma separated database URLs. Reads of the views
+# decorated with utils.routers.read_from_replicas go to them.
+REPLICA_DATABASES = []
+for index, replica_url in enumerate(filter(None, os.environ.get('REPLICA_DATABASE_URLS', '').split(','))):
+    DATABASES[f'replica_{index}'] = dict(
+        dj_database_url.parse(replica_url),
+        # Tests read the test database of the primary through the replica connections.
+        TEST={'MIRROR': 'default'},
+    )
+    REPLICA_DATABASES.append(f'replica_{index}')
+
+# Postgres connections come from a bounded pool per worker process instead of a new connection
+# (and handshake) per request, see utils.db_backends.postgresql_pooled.
+for database in DATABASES.values():
+    if database['ENGINE'] in ('django.db.backends.postgresql', 'django.db.backends.postgresql_psycopg2'):
+        database['ENGINE'] = 'utils.db_backends.postgresql_pooled'
+        database['POOL'] = {'MAX_SIZE': int(os.environ.get('DATABASE_POOL_SIZE', 10))}
+
+DATABASE_ROUTERS = ['utils.routers.ReplicaRouter']
+
+# For how long (in seconds) reads of a customer stay on the primary after they changed their loans,
+# so that replication lag never shows them a stale balance. Pins live in the default cache. Responses
+# built on a replica are only cached once their loan (or customer) has not changed for as long, see loans.cache.
+PRIMARY_PIN_SECONDS = 10
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Memcached servers shared by all the workers, as comma separated host:port pairs. Without any, every
+# worker process has caches of its own, see the caveats of the aliases below.
+MEMCACHED_SERVERS = list(filter(None, os.environ.get('MEMCACHED_SERVERS', '').split(',')))
+
+CACHES = {
+    # Also holds the access token revocation list and the primary pins of utils.routers. Without
+    # MEMCACHED_SERVERS a revocation or pin only holds in the worker which made it.
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': MEMCACHED_SERVERS,
+    } if MEMCACHED_SERVERS else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Verified Basic auth credentials, see userman.authentication.CachedBasicAuthentication.
+    # LocMemCache culls least recently used entries once MAX_ENTRIES is reached. It is per process:
+    # a password change or ban only drops the entries of the worker handling it, other workers keep
+    # accepting the old credentials until TIMEOUT. Use a shared backend when running multiple workers.
+    'credentials': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'verified-credentials',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Serialized responses of the loan read endpoints, see loans.cache. Without MEMCACHED_SERVERS the
+    # invalidation after a repayment or evaluation only reaches the worker handling it, other workers
+    # keep serving the stale amount_due and status until TIMEOUT, which is kept short for that reason.
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': MEMCACHED_SERVERS,
+        'KEY_PREFIX': 'responses',
+        'TIMEOUT': 300,
+    } if MEMCACHED_SERVERS else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'loan-responses',
+        'TIMEOUT': 5,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -133,10 +207,58 @@ AUTH_USER_MODEL = 'userman.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'userman.authentication.CachedBasicAuthentication',
+        'userman.authentication.SignedTokenAuthentication',
     ],
 }
 
+# Keyset pagination of the loan list endpoints, clients can ask for up to LOAN_LIST_MAX_PAGE_SIZE.
+LOAN_LIST_PAGE_SIZE = 50
+LOAN_LIST_MAX_PAGE_SIZE = 500
+
+# Rows fetched per round trip by the server-side cursors of the streamed loan history export.
+LOAN_EXPORT_CHUNK_SIZE = 2000
+
+# Review queue: how many pending loans a reviewer claims by default (and at most), and for how long (in seconds).
+LOAN_REVIEW_CLAIM_SIZE = 10
+LOAN_REVIEW_MAX_CLAIM_SIZE = 100
+LOAN_REVIEW_LEASE_SECONDS = 15 * 60
+
+# How the repayment schedule of newly approved loans is stored, see loans.models.LoanScheduleMode.
+# MATERIALIZED keeps a LoanRepayment row per installment, VIRTUAL only the schedule parameters on the Loan.
+LOAN_SCHEDULE_MODE = 'MATERIALIZED'
+
+# How newly approved loans are charged interest, see loans.models.LoanInterestMethod. SIMPLE schedules
+# repay the principal and interest is accrued on top, REDUCING_BALANCE schedules are EMIs.
+LOAN_INTEREST_METHOD = 'SIMPLE'
+
+# How make_repayment and submit_loan_evaluation guard against concurrent updates of a loan, see
+# loans.models.LoanUpdateStrategy. OPTIMISTIC runs a request which lost the race anew, up to
+# LOAN_UPDATE_MAX_ATTEMPTS times, backing off LOAN_UPDATE_BACKOFF seconds (doubled every retry) in between.
+LOAN_UPDATE_STRATEGY = 'OPTIMISTIC'
+LOAN_UPDATE_MAX_ATTEMPTS = 5
+LOAN_UPDATE_BACKOFF = 0.01
+
+# Rows each approval status' totals are spread over in loans.models.PortfolioSummary, to keep
+# concurrent loan updates from queueing up on a single row lock.
+PORTFOLIO_SUMMARY_SLOTS = 16
+
+# Largest payment gateway settlement batch accepted by loans.views.make_bulk_repayment.
+BULK_REPAYMENT_MAX_RECORDS = 50000
+# Largest batch of evaluations accepted by loans.views.submit_bulk_loan_evaluation.
+BULK_EVALUATION_MAX_RECORDS = 10000
+
+# For how long (in seconds, at least) the responses to requests with an Idempotency-Key are kept
+# for replaying to their retries, see loans.idempotency. purge_idempotency_keys deletes them after.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Lifetime (in seconds) of the access tokens issued by userman.views.issue_token.
+ACCESS_TOKEN_MAX_AGE = 15 * 60
+
+# How changes to the models registered with audit.trail are audited, see audit.models.AuditTrailMode.
+# Read when the models get registered, so switching takes a restart.
+AUDIT_TRAIL_MODE = 'REVERSION'
+
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
@@ -18,8 +18,11 @@ from django.conf.urls import url
 from django.contrib import admin
 from django.urls import path, include
 
+from utils.views import get_database_pool_stats
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     url(r'^user/', include('userman.urls')),
     url(r'^loan/', include('loans.urls')),
+    url(r'^db-pool/stats/$', get_database_pool_stats, name='get_database_pool_stats'),
 ]
@@ -0,0 +1,49 @@
+from contextlib import nullcontext
+
+from django.contrib import admin
+from django.contrib.admin.utils import unquote
+from django.contrib.contenttypes.models import ContentType
+from reversion_compare.admin import CompareVersionAdmin
+
+from audit.models import AuditEvent
+from audit.trail import is_audited
+
+
+class AuditedVersionAdmin(CompareVersionAdmin):
+    """
+    CompareVersionAdmin for models registered with audit.trail.
+
+    Once a model is audited by the event store, its admin no longer opens revisions. The model
+    still gets registered with reversion by VersionAdmin, which only lets the history list and
+    compare the versions recorded before the switch, next to the audit events.
+    """
+    object_history_template = 'audit/object_history.html'
+
+    def create_revision(self, request):
+        if is_audited(self.model):
+            return nullcontext()
+        return super().create_revision(request)
+
+    def history_view(self, request, object_id, extra_context=None):
+        extra_context = dict(extra_context or {})
+        extra_context['audit_events'] = AuditEvent.objects.filter(
+            content_type=ContentType.objects.get_for_model(self.model), object_id=unquote(object_id),
+        ).order_by('-created')
+        return super().history_view(request, object_id, extra_context=extra_context)
+
+
+@admin.register(AuditEvent)
+class AuditEventsAdmin(admin.ModelAdmin):
+    # The trail is append-only.
+    list_display = ['created', 'content_type', 'object_id', 'action']
+    list_filter = ['content_type', 'action']
+    search_fields = ['object_id']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
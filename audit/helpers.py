@@ -0,0 +1,70 @@
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.functions import Length
+from reversion.models import Revision, Version
+
+from loans.models import Loan
+
+
+def find_prunable_versions(older_than: Optional[datetime] = None, keep: Optional[int] = None,
+                           collapse_closed_loans: bool = False, chunk_size=2000):
+    """
+    Returns the ids (in an int64 array) of the reversion versions to prune, and the {model label:
+    {'versions', 'bytes'}} they take up.
+
+    A version is pruned when its revision is from before `older_than`, when its object has `keep`
+    newer versions, or when its object is a closed loan and `collapse_closed_loans` is set. The
+    newest version of every object is always kept, for closed loans it becomes their final snapshot.
+    """
+    closed_loans = set()
+    if collapse_closed_loans:
+        closed_loans = {str(loan_id) for loan_id in
+                        Loan.objects.filter(closure_date__isnull=False).values_list('id', flat=True)}
+    loan_content_type = ContentType.objects.get_for_model(Loan).id
+    labels = {}
+
+    prunable, reclaimable = array('q'), defaultdict(lambda: {'versions': 0, 'bytes': 0})
+    previous_object, newer = None, 0
+    versions = Version.objects.order_by('content_type_id', 'object_id', '-id').values_list(
+        'id', 'content_type_id', 'object_id', 'revision__date_created',
+        # What the rows mostly consist of, a good enough estimate of their size.
+        Length('serialized_data') + Length('object_repr'),
+    )
+    for version_id, content_type_id, object_id, created, size in versions.iterator(chunk_size=chunk_size):
+        if (content_type_id, object_id) != previous_object:
+            previous_object, newer = (content_type_id, object_id), 0
+            continue
+        newer += 1
+        if (older_than is not None and created < older_than) or (keep is not None and newer >= keep) or (
+                content_type_id == loan_content_type and object_id in closed_loans):
+            prunable.append(version_id)
+            if content_type_id not in labels:
+                labels[content_type_id] = ContentType.objects.get_for_id(content_type_id).model_class()._meta.label
+            reclaimable[labels[content_type_id]]['versions'] += 1
+            reclaimable[labels[content_type_id]]['bytes'] += size or 0
+    return prunable, dict(reclaimable)
+
+
+def delete_versions(version_ids, chunk_size=1000) -> Dict[str, int]:
+    """
+    Deletes `version_ids`, then the revisions left without versions, in primary key ordered chunks.
+
+    Every chunk is its own (autocommitted) statement, so locks are only ever held briefly.
+    """
+    version_ids = sorted(version_ids)
+    deleted_versions = 0
+    for start in range(0, len(version_ids), chunk_size):
+        deleted_versions += Version.objects.filter(id__in=version_ids[start:start + chunk_size]).delete()[0]
+
+    deleted_revisions = 0
+    empty = Revision.objects.filter(version__isnull=True).order_by('id')
+    while True:
+        revision_ids = list(empty.values_list('id', flat=True)[:chunk_size])
+        if not revision_ids:
+            break
+        deleted_revisions += Revision.objects.filter(id__in=revision_ids).delete()[0]
+    return {'versions': deleted_versions, 'revisions': deleted_revisions}
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+
+from audit.helpers import delete_versions, find_prunable_versions
+
+
+class Command(BaseCommand):
+    help = ('Prune reversion versions by age and by count per object, in small primary key ordered chunks. '
+            'The newest version of an object is always kept.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='Prune versions older than this.')
+        parser.add_argument('--keep', type=int, help='Prune all but the newest KEEP versions of each object.')
+        parser.add_argument('--collapse-closed-loans', action='store_true',
+                            help="Keep only the final version of closed loans.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be pruned.')
+
+    def handle(self, *args, **options):
+        older_than_days, keep = options['older_than_days'], options['keep']
+        if older_than_days is None and keep is None and not options['collapse_closed_loans']:
+            raise CommandError('Nothing to prune by, pass --older-than-days, --keep or --collapse-closed-loans.')
+        if keep is not None and keep < 1:
+            raise CommandError('--keep should be at least 1.')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size should be at least 1.')
+
+        version_ids, reclaimable = find_prunable_versions(
+            older_than=timezone.now() - timedelta(days=older_than_days) if older_than_days is not None else None,
+            keep=keep, collapse_closed_loans=options['collapse_closed_loans'], chunk_size=options['chunk_size'])
+        for label, totals in sorted(reclaimable.items()):
+            self.stdout.write(f"{label}: {totals['versions']} version(s), ~{totals['bytes']} byte(s)")
+        total_bytes = sum(totals['bytes'] for totals in reclaimable.values())
+
+        if options['dry_run']:
+            self.stdout.write(f'Would prune {len(version_ids)} version(s), reclaiming ~{total_bytes} byte(s).')
+            return
+        deleted = delete_versions(version_ids, chunk_size=options['chunk_size'])
+        self.stdout.write(f"Pruned {deleted['versions']} version(s) and {deleted['revisions']} emptied revision(s), "
+                          f"reclaiming ~{total_bytes} byte(s).")
@@ -0,0 +1,34 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from utils.models import BaseUUIDModel
+
+
+class AuditTrailMode(models.TextChoices):
+    # Full snapshots of every object saved within a revision, by django-reversion.
+    REVERSION = ("REVERSION", "REVERSION")
+    # Only the changed fields, appended to the AuditEvent store once the transaction commits.
+    EVENTS = ("EVENTS", "EVENTS")
+
+
+class AuditAction(models.TextChoices):
+    CREATE = ("CREATE", "CREATE")
+    UPDATE = ("UPDATE", "UPDATE")
+    DELETE = ("DELETE", "DELETE")
+
+
+class AuditEvent(BaseUUIDModel):
+    """An append-only record of the fields one save (or delete) changed, see audit.trail."""
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'created'], name='audit_event_object_idx'),
+        ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.PROTECT)
+    # Every audited model has a UUID primary key.
+    object_id = models.UUIDField()
+    action = models.CharField(max_length=20, choices=AuditAction.choices)
+    # {attname: [old value, new value]}
+    changes = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
@@ -0,0 +1,218 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from reversion import revisions as reversion
+from reversion.models import Revision, Version
+
+from audit import trail as audit_trail
+from audit.models import AuditAction, AuditEvent, AuditTrailMode
+from loans.helpers import accrue_interest, apply_bulk_repayments, claim_pending_loans, evaluate_loans, \
+    mark_overdue_repayments
+from loans.models import Loan, LoanApprovalStatus, LoanRepayment, LoanRepaymentStatus
+from userman.models import User, UserLevel
+
+
+class AuditTrailTests(TransactionTestCase):
+    # Commits have to actually happen, the events are only written then.
+
+    def setUp(self):
+        for model in (Loan, LoanRepayment):
+            audit_trail.unregister(model)
+            with override_settings(AUDIT_TRAIL_MODE=AuditTrailMode.EVENTS):
+                audit_trail.register(model)
+            # Like the admin does, for the versions recorded before the switch.
+            reversion.register(model)
+        self.customer = User.objects.create_user(
+            username='customer1', password='customer1pass', phone_number='9876543211', name='Bruce Wayne')
+        self.admin = User.objects.create_user(
+            username='admin1', password='admin1pass', phone_number='8876543212', name='Shark',
+            user_level=UserLevel.ADMIN, is_staff=True, is_superuser=True)
+        self.loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+
+    def tearDown(self):
+        for model in (Loan, LoanRepayment):
+            audit_trail.unregister(model)
+            audit_trail.register(model)
+
+    def events(self, obj):
+        return list(AuditEvent.objects.filter(object_id=obj.pk).order_by('created'))
+
+    def test_only_changed_fields_are_recorded_on_commit(self):
+        created, = self.events(self.loan)
+        self.assertEquals(created.action, AuditAction.CREATE)
+        self.assertEquals(created.changes['approval_status'], [None, LoanApprovalStatus.PENDING])
+
+        with transaction.atomic():
+            self.loan.approve(approved_by=self.admin)
+            self.assertEquals(len(self.events(self.loan)), 1)
+        # One event per save: the approval, then the first installment.
+        approved, scheduled = sorted(self.events(self.loan)[1:], key=lambda event: 'approval_status' not in event.changes)
+        self.assertEquals(approved.action, AuditAction.UPDATE)
+        self.assertEquals(approved.changes['approval_status'], [LoanApprovalStatus.PENDING, LoanApprovalStatus.APPROVED])
+        self.assertEquals([Decimal(value) for value in approved.changes['amount_due']], [0, 100])
+        self.assertNotIn('loan_amount', approved.changes)
+        self.assertEquals(set(scheduled.changes), {'next_repayment_id', 'next_due_date', 'next_due_amount'})
+
+        # Nothing changed, nothing to record.
+        Loan.objects.get(id=self.loan.id).save()
+        self.assertEquals(len(self.events(self.loan)), 3)
+
+    def test_events_of_a_transaction_are_written_at_once(self):
+        self.loan.approve(approved_by=self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                for _ in range(3):
+                    self.loan.upcoming_repayment.mark_paid()
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "audit_auditevent"')]
+        self.assertEquals(len(inserts), 1)
+        paid = LoanRepayment.objects.filter(loan=self.loan, status=LoanRepaymentStatus.PAID)
+        self.assertEquals(AuditEvent.objects.filter(object_id__in=paid.values('id')).count(), 3)
+
+    def test_rolled_back_savepoints_take_their_events_along(self):
+        with transaction.atomic():
+            self.loan.term = 6
+            self.loan.save()
+            try:
+                with transaction.atomic():
+                    self.loan.term = 7
+                    self.loan.save()
+                    raise ValueError
+            except ValueError:
+                pass
+            # Rolling back undoes the version bump of the save in the database only.
+            self.loan.version -= 1
+        self.assertEquals([event.changes for event in self.events(self.loan)[1:]], [{'term': [5, 6]}])
+
+        try:
+            with transaction.atomic():
+                self.loan.term = 8
+                self.loan.save()
+                raise ValueError
+        except ValueError:
+            pass
+        self.loan.version -= 1
+        # Nothing of the rolled back transaction leaks into the next one.
+        with transaction.atomic():
+            self.loan.term = 9
+            self.loan.save()
+        self.assertEquals([event.changes for event in self.events(self.loan)[2:]], [{'term': [8, 9]}])
+
+    def test_savepoint_rolled_back_last_keeps_the_earlier_events(self):
+        with transaction.atomic():
+            with transaction.atomic():
+                self.loan.term = 6
+                self.loan.save()
+            try:
+                with transaction.atomic():
+                    self.loan.term = 7
+                    self.loan.save()
+                    raise ValueError
+            except ValueError:
+                pass
+            self.loan.version -= 1
+        self.assertEquals([event.changes for event in self.events(self.loan)[1:]], [{'term': [5, 6]}])
+
+    def test_bulk_writes_are_audited(self):
+        other = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        evaluate_loans([{'loan_id': self.loan.id, 'approval_status': LoanApprovalStatus.APPROVED},
+                        {'loan_id': other.id, 'approval_status': LoanApprovalStatus.REJECTED}], self.admin)
+        approved, = [event for event in self.events(self.loan) if event.action == AuditAction.UPDATE]
+        self.assertEquals(approved.changes['approval_status'], [LoanApprovalStatus.PENDING, LoanApprovalStatus.APPROVED])
+        self.assertEquals(self.events(other)[-1].changes['approval_status'],
+                          [LoanApprovalStatus.PENDING, LoanApprovalStatus.REJECTED])
+        repayment = LoanRepayment.objects.filter(loan=self.loan).order_by('due_date').first()
+        self.assertEquals([event.action for event in self.events(repayment)], [AuditAction.CREATE])
+
+        apply_bulk_repayments([{'loan_id': self.loan.id, 'amount': Decimal(20), 'payment_request_id': 'pr1'}])
+        paid = self.events(self.loan)[-1]
+        self.assertEquals([Decimal(value) for value in paid.changes['amount_due']], [100, 80])
+        self.assertEquals(self.events(repayment)[-1].changes['status'],
+                          [LoanRepaymentStatus.PENDING, LoanRepaymentStatus.PAID])
+
+    def test_bulk_updates_are_audited(self):
+        self.loan.approve(approved_by=self.admin)
+        pending = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        claim_pending_loans(self.admin, 1)
+        self.assertEquals(self.events(pending)[-1].changes['claimed_by_id'], [None, str(self.admin.id)])
+
+        LoanRepayment.objects.filter(loan=self.loan).update(due_date=timezone.now() - timedelta(days=1))
+        self.assertEquals(mark_overdue_repayments(), 5)
+        repayment = LoanRepayment.objects.filter(loan=self.loan).first()
+        self.assertEquals(self.events(repayment)[-1].changes,
+                          {'status': [LoanRepaymentStatus.PENDING, LoanRepaymentStatus.OVERDUE]})
+
+        Loan.objects.filter(id=self.loan.id).update(interest_rate=Decimal('36.50'))
+        accrue_interest(timezone.localdate() + timedelta(days=1))
+        accrued = self.events(self.loan)[-1].changes
+        self.assertEquals([Decimal(value) for value in accrued['accrued_interest']], [0, Decimal('0.10')])
+
+    def test_history_stays_viewable(self):
+        self.loan.approve(approved_by=self.admin)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:loans_loan_history', args=[self.loan.id]))
+        self.assertEquals(response.status_code, 200)
+        self.assertContains(response, 'audit-events')
+        self.assertContains(response, AuditAction.UPDATE)
+
+
+class VersionPruningTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(
+            username='customer1', password='customer1pass', phone_number='9876543211', name='Bruce Wayne')
+        self.loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        for term in range(6, 10):
+            with reversion.create_revision():
+                self.loan.term = term
+                self.loan.save()
+        with reversion.create_revision():
+            self.customer.save()
+        self.oldest = Version.objects.get_for_object(self.loan).order_by('id').first()
+        Revision.objects.filter(id=self.oldest.revision_id).update(
+            date_created=timezone.now() - timedelta(days=100))
+
+    def prune(self, *args):
+        out = StringIO()
+        call_command('prune_versions', *args, stdout=out)
+        return out.getvalue()
+
+    def loan_versions(self):
+        return [version.field_dict['term'] for version in Version.objects.get_for_object(self.loan).order_by('id')]
+
+    def test_dry_run_only_reports(self):
+        out = self.prune('--keep', '2', '--dry-run')
+        self.assertIn('loans.Loan: 2 version(s)', out)
+        self.assertIn('Would prune 2 version(s)', out)
+        self.assertEquals(len(self.loan_versions()), 4)
+
+    def test_prune_by_count_and_age(self):
+        out = self.prune('--older-than-days', '30', '--chunk-size', '1')
+        self.assertIn('Pruned 1 version(s) and 1 emptied revision(s)', out)
+        self.assertEquals(self.loan_versions(), [7, 8, 9])
+        self.assertFalse(Revision.objects.filter(id=self.oldest.revision_id).exists())
+
+        self.prune('--keep', '2')
+        self.assertEquals(self.loan_versions(), [8, 9])
+        # The newest version always stays.
+        self.prune('--keep', '1', '--older-than-days', '0')
+        self.assertEquals(self.loan_versions(), [9])
+        self.assertEquals(Version.objects.get_for_object(self.customer).count(), 1)
+
+    def test_collapse_closed_loans(self):
+        self.prune('--collapse-closed-loans')
+        self.assertEquals(len(self.loan_versions()), 4)
+        Loan.objects.filter(id=self.loan.id).update(closure_date=timezone.now())
+        self.prune('--collapse-closed-loans')
+        self.assertEquals(self.loan_versions(), [9])
+
+    def test_needs_a_criterion(self):
+        with self.assertRaises(CommandError):
+            self.prune()
+        with self.assertRaises(CommandError):
+            self.prune('--keep', '0')
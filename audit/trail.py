@@ -0,0 +1,186 @@
+"""
+Audit trail of model changes, either as django-reversion snapshots or as AuditEvent rows.
+
+In EVENTS mode a save records only the fields it changed, compared to the values the instance
+was loaded (or last saved) with. Events are not written right away: they are buffered for the
+whole transaction, per savepoint so that a rolled back savepoint takes its events along, and
+written with a single bulk_create once the transaction commits. Bulk writes send no signals, so
+their callers record them with `record_bulk_saves` and `record_updates`.
+"""
+from threading import local
+from typing import Dict, Iterable, List, Optional
+from weakref import WeakValueDictionary
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from reversion import revisions as reversion
+
+from audit.models import AuditAction, AuditEvent, AuditTrailMode
+
+# Bookkeeping fields, not worth an event of their own.
+UNAUDITED_FIELDS = {'created', 'modified', 'version'}
+
+_audited_models = set()
+_pending = local()
+
+
+def _audited_fields(model) -> list:
+    return [field for field in model._meta.concrete_fields if field.name not in UNAUDITED_FIELDS]
+
+
+class _Batch:
+    """
+    The events recorded in one savepoint, and their commit hook. Only Django's list of commit hooks
+    holds on to a batch, so a batch is gone once Django drops it along with a rolled back savepoint.
+    """
+
+    def __init__(self, pending: '_PendingEvents'):
+        self.pending = pending
+        self.events: List[AuditEvent] = []
+        self.committed = False
+
+    def __call__(self):
+        self.committed = True
+        self.pending.commit(self)
+
+
+class _PendingEvents:
+    """The events of one transaction on one database, by the savepoint they were recorded in."""
+
+    def __init__(self, using: str):
+        self.using = using
+        self.batches: 'WeakValueDictionary[tuple, _Batch]' = WeakValueDictionary()
+        self.committed: List[AuditEvent] = []
+
+    def add(self, event: AuditEvent):
+        savepoint_ids = tuple(connections[self.using].savepoint_ids)
+        batch = self.batches.get(savepoint_ids)
+        if batch is None:
+            batch = self.batches[savepoint_ids] = _Batch(self)
+            transaction.on_commit(batch, using=self.using)
+        batch.events.append(event)
+
+    def is_current(self) -> bool:
+        # A rolled back transaction takes its commit hooks, and so every batch, along.
+        return any(not batch.committed for batch in list(self.batches.values()))
+
+    def commit(self, batch: _Batch):
+        self.committed.extend(batch.events)
+        # Commit hooks run in the order they were added, the last batch left writes them all.
+        if self.is_current():
+            return
+        _set_pending(self.using, None)
+        AuditEvent.objects.using(self.using).bulk_create(self.committed)
+
+
+def _get_pending(using: str) -> Optional[_PendingEvents]:
+    return getattr(_pending, using, None)
+
+
+def _set_pending(using: str, pending: Optional[_PendingEvents]):
+    setattr(_pending, using, pending)
+
+
+def record(event: AuditEvent, using: str):
+    """Writes `event` once the current transaction commits, or right away outside of one."""
+    if not connections[using].in_atomic_block:
+        event.save(using=using)
+        return
+    pending = _get_pending(using)
+    if pending is None or not pending.is_current():
+        pending = _PendingEvents(using)
+        _set_pending(using, pending)
+    pending.add(event)
+
+
+def _snapshot(sender, instance, **kwargs):
+    # Deferred fields are left out rather than loaded.
+    instance._audit_snapshot = {
+        field.attname: instance.__dict__[field.attname]
+        for field in _audited_fields(sender) if field.attname in instance.__dict__
+    }
+
+
+def _event(sender, instance, action: str, changes: dict) -> AuditEvent:
+    return AuditEvent(
+        content_type=ContentType.objects.get_for_model(sender),
+        object_id=instance.pk,
+        action=action,
+        changes=changes,
+    )
+
+
+def _saved(sender, instance, created, update_fields, using, **kwargs):
+    snapshot = getattr(instance, '_audit_snapshot', {})
+    changes = {}
+    for field in _audited_fields(sender):
+        if update_fields is not None and field.name not in update_fields:
+            continue
+        attname, new = field.attname, getattr(instance, field.attname)
+        if created:
+            changes[attname] = [None, field.to_python(new)]
+        elif attname in snapshot and snapshot[attname] != new:
+            changes[attname] = [field.to_python(snapshot[attname]), field.to_python(new)]
+        snapshot[attname] = new
+    instance._audit_snapshot = snapshot
+    if changes:
+        record(_event(sender, instance, AuditAction.CREATE if created else AuditAction.UPDATE, changes), using)
+
+
+def _deleted(sender, instance, using, **kwargs):
+    snapshot = getattr(instance, '_audit_snapshot', {})
+    record(_event(sender, instance, AuditAction.DELETE,
+                  {field.attname: [field.to_python(snapshot[field.attname]), None]
+                   for field in _audited_fields(sender) if field.attname in snapshot}), using)
+
+
+def record_bulk_saves(model, instances: Iterable, update_fields: Optional[List[str]] = None,
+                      using: str = DEFAULT_DB_ALIAS):
+    """
+    Audits `instances` written by bulk_create (no `update_fields`) or by a bulk_update of
+    `update_fields`, the way their own saves would have been.
+    """
+    if model not in _audited_models:
+        return
+    for instance in instances:
+        _saved(model, instance, created=update_fields is None, update_fields=update_fields, using=using)
+
+
+def record_updates(model, changes: Dict, using: str = DEFAULT_DB_ALIAS):
+    """Audits rows written without loading them, e.g. by update(). `changes` is {pk: {attname: [old, new]}}."""
+    if model not in _audited_models:
+        return
+    for pk, row_changes in changes.items():
+        record(AuditEvent(content_type=ContentType.objects.get_for_model(model), object_id=pk,
+                          action=AuditAction.UPDATE, changes=row_changes), using)
+
+
+def _receivers(model):
+    uid = f'audit.trail.{model._meta.label}'
+    return [(post_init, _snapshot, uid), (post_save, _saved, uid), (post_delete, _deleted, uid)]
+
+
+def register(model):
+    """Audits changes to `model` the way AUDIT_TRAIL_MODE says."""
+    if settings.AUDIT_TRAIL_MODE == AuditTrailMode.REVERSION:
+        reversion.register(model)
+        return model
+    for signal, receiver, uid in _receivers(model):
+        signal.connect(receiver, sender=model, dispatch_uid=uid)
+    _audited_models.add(model)
+    return model
+
+
+def unregister(model):
+    if reversion.is_registered(model):
+        reversion.unregister(model)
+    for signal, receiver, uid in _receivers(model):
+        signal.disconnect(sender=model, dispatch_uid=uid)
+    _audited_models.discard(model)
+
+
+def is_audited(model) -> bool:
+    """Whether changes to `model` go to the event store, rather than to reversion."""
+    return model in _audited_models
@@ -1,14 +1,14 @@
 from django.contrib import admin
-from reversion_compare.admin import CompareVersionAdmin
 
+from audit.admin import AuditedVersionAdmin
 from loans.models import Loan, LoanRepayment
 
 
 @admin.register(Loan)
-class LoansAdmin(CompareVersionAdmin):
+class LoansAdmin(AuditedVersionAdmin):
     pass
 
 
 @admin.register(LoanRepayment)
-class LoanRepaymentsAdmin(CompareVersionAdmin):
+class LoanRepaymentsAdmin(AuditedVersionAdmin):
     pass
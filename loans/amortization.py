@@ -0,0 +1,80 @@
+"""
+Reducing-balance interest arithmetic for whole batches of loans at once.
+
+Every function takes NumPy arrays with one element per loan: principals and balances in
+integer minor units (see `loans.schedule`), annual interest rates in percent, terms in
+installments and repayment frequencies in days. Loops only ever run over installment
+periods, never over loans, so the cost of a batch is a handful of array operations.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+DAYS_IN_YEAR = 365
+
+
+class Amortization(NamedTuple):
+    # (loans, periods) arrays in minor units, zero past the term of a loan.
+    installment: np.ndarray
+    interest: np.ndarray
+    principal: np.ndarray
+    balance: np.ndarray     # Outstanding principal once the installment is paid.
+
+
+def periodic_rates(annual_rate: np.ndarray, frequency: np.ndarray) -> np.ndarray:
+    """Interest rate (as a fraction) of one repayment period."""
+    return np.asarray(annual_rate, dtype=np.float64) / 100 * np.asarray(frequency, dtype=np.float64) / DAYS_IN_YEAR
+
+
+def emi(principal: np.ndarray, annual_rate: np.ndarray, term: np.ndarray, frequency: np.ndarray) -> np.ndarray:
+    """
+    Equated installment of each loan, rounded to a minor unit.
+
+    Interest free loans get `principal // term`, the same split as `loans.schedule.split_installments`.
+    """
+    principal = np.asarray(principal, dtype=np.int64)
+    term = np.asarray(term, dtype=np.int64)
+    if (term <= 0).any():
+        raise ValueError('Need at least one installment.')
+    rate = periodic_rates(annual_rate, frequency)
+    growth = (1 + rate) ** term
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amortized = np.rint(principal * rate * growth / (growth - 1))
+    return np.where(rate > 0, amortized, principal // term).astype(np.int64)
+
+
+def amortize(principal: np.ndarray, annual_rate: np.ndarray, term: np.ndarray, frequency: np.ndarray) -> Amortization:
+    """
+    Reducing-balance schedules of a batch of loans.
+
+    Each period's interest is charged on the outstanding balance and the rest of the EMI
+    pays off principal. The last installment clears whatever balance is left, so rounding
+    never leaves anything behind. Memory grows with loans x longest term, so amortize
+    large portfolios in chunks.
+    """
+    principal = np.asarray(principal, dtype=np.int64)
+    term = np.asarray(term, dtype=np.int64)
+    rate = periodic_rates(annual_rate, frequency)
+    installment = emi(principal, annual_rate, term, frequency)
+
+    periods = int(term.max()) if term.size else 0
+    schedule = Amortization(*(np.zeros((principal.size, periods), dtype=np.int64) for _ in Amortization._fields))
+    balance = principal.copy()
+    for period in range(periods):
+        active = period < term
+        interest = np.where(active, np.rint(balance * rate), 0).astype(np.int64)
+        repaid = np.where(period == term - 1, balance, np.clip(installment - interest, 0, balance))
+        repaid = np.where(active, repaid, 0)
+        balance = balance - repaid
+
+        schedule.installment[:, period] = interest + repaid
+        schedule.interest[:, period] = interest
+        schedule.principal[:, period] = repaid
+        schedule.balance[:, period] = balance
+    return schedule
+
+
+def accrued_interest(balance: np.ndarray, annual_rate: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Simple interest accrued on each balance over `days` days, rounded to a minor unit."""
+    daily_rate = np.asarray(annual_rate, dtype=np.float64) / 100 / DAYS_IN_YEAR
+    return np.rint(np.asarray(balance, dtype=np.int64) * daily_rate * np.asarray(days)).astype(np.int64)
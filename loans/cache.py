@@ -0,0 +1,87 @@
+"""
+Server-side cache of the serialized responses of the per-loan and per-customer read endpoints.
+
+Entries are keyed on the generation of the loan (or customer) they were built from. Saving a
+Loan or LoanRepayment bumps those generations through the signal receivers below, the bulk
+paths which do not send signals call `invalidate_loan_responses` themselves.
+
+A response built on a replica is only cached once its generations were last bumped more than
+PRIMARY_PIN_SECONDS (the replication lag the routers allow for) ago. Until then the replica may
+not have the commit behind the bump yet, and its stale state would be cached under the new
+generation; such responses are served without being cached.
+"""
+import hashlib
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from loans.models import Loan, LoanRepayment
+from utils.cache import bump_generations, get_generations, get_or_build, recently_bumped
+from utils.http import Validators
+from utils.routers import current_read_database
+
+# Cache alias (see CACHES in settings) holding the serialized responses.
+RESPONSE_CACHE = 'responses'
+
+
+class CachedResponse(NamedTuple):
+    customer_id: str    # Owner of the loan, only they get to see the response.
+    content: bytes
+    validators: Validators
+
+
+def _loan_scope(loan_id) -> str:
+    return f'loan:{loan_id}'
+
+
+def _customer_scope(customer_id) -> str:
+    return f'customer:{customer_id}'
+
+
+def _get_or_build(cache, key: str, scopes: List[str], build: Callable):
+    if current_read_database() != DEFAULT_DB_ALIAS and recently_bumped(cache, scopes):
+        # The replica may still lag behind the change, serve what it has without caching it.
+        value = cache.get(key)
+        return build() if value is None else value
+    return get_or_build(cache, key, build)
+
+
+def get_loan_response(kind: str, loan_id, build: Callable[[], Optional[CachedResponse]]) -> Optional[CachedResponse]:
+    cache = caches[RESPONSE_CACHE]
+    scopes = [_loan_scope(loan_id)]
+    generation = get_generations(cache, scopes)
+    return _get_or_build(cache, f'loans:{kind}:{loan_id}:{generation}', scopes, build)
+
+
+def get_customer_response(kind: str, customer_id, params: str, build: Callable[[], bytes]) -> bytes:
+    cache = caches[RESPONSE_CACHE]
+    scopes = [_customer_scope(customer_id)]
+    generation = get_generations(cache, scopes)
+    # Hashing keeps arbitrary query parameters from producing invalid cache keys.
+    params = hashlib.sha256(params.encode('utf-8')).hexdigest()
+    return _get_or_build(cache, f'loans:{kind}:{customer_id}:{params}:{generation}', scopes, build)
+
+
+def invalidate_loan_responses(loan_ids: Iterable = (), customer_ids: Iterable = ()):
+    cache = caches[RESPONSE_CACHE]
+    scopes = [_loan_scope(loan_id) for loan_id in loan_ids] + [
+        _customer_scope(customer_id) for customer_id in set(customer_ids)]
+    if not scopes:
+        return
+    bump_generations(cache, scopes, recent_for=settings.PRIMARY_PIN_SECONDS)
+    # Once more after commit: a request may have cached the state from before the commit in between.
+    transaction.on_commit(lambda: bump_generations(cache, scopes, recent_for=settings.PRIMARY_PIN_SECONDS))
+
+
+@receiver([post_save, post_delete], sender=Loan)
+def loan_changed(sender, instance, **kwargs):
+    invalidate_loan_responses([instance.id], [instance.customer_id])
+
+
+@receiver([post_save, post_delete], sender=LoanRepayment)
+def loan_repayment_changed(sender, instance, **kwargs):
+    invalidate_loan_responses([instance.loan_id])
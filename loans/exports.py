@@ -0,0 +1,87 @@
+"""
+Streamed exports of a customer's loan history.
+
+Loans and repayments are each read through a server-side cursor, in loan id order, and merged
+on the fly. Only one chunk of rows (and the repayments of one loan) is held at a time, so memory
+stays flat however long the history is.
+"""
+import csv
+from itertools import groupby
+from typing import Dict, Iterator, List
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
+
+from loans.models import Loan, LoanRepayment, LoanRepaymentStatus
+from loans.serializers import loan_details_values, loan_repayment_values
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+EXPORT_CONTENT_TYPES = {
+    NDJSON: 'application/x-ndjson',
+    CSV: 'text/csv',
+}
+
+# Columns of the CSV export, one row per repayment. Repayment columns are left empty for loans without any.
+LOAN_COLUMNS = ["id", "loan_amount", "amount_due", "disbursement_date", "closure_date", "term",
+                "repayment_frequency", "approval_status"]
+REPAYMENT_COLUMNS = ["id", "amount", "due_date", "repayment_date", "status"]
+CSV_HEADER = [f'loan_{column}' if column == 'id' else column for column in LOAN_COLUMNS] + [
+    f'repayment_{column}' if column in ('id', 'amount', 'status') else column for column in REPAYMENT_COLUMNS]
+
+
+def iter_loan_history(customer, chunk_size: int, using: str = DEFAULT_DB_ALIAS) -> Iterator[Dict]:
+    """Every loan of `customer` as serialized by `get_loan_details`, with its `repayments` as in the schedule."""
+    loans = Loan.objects.using(using).filter(customer=customer).order_by('id').iterator(chunk_size=chunk_size)
+    repayments = groupby(
+        LoanRepayment.objects.using(using).filter(loan__customer=customer).exclude(
+            status=LoanRepaymentStatus.PREPAID).order_by('loan_id', 'due_date').values(
+            'loan_id', *loan_repayment_values.sources).iterator(chunk_size=chunk_size),
+        key=lambda row: row['loan_id'],
+    )
+    group_loan_id, group = next(repayments, (None, ()))
+    for loan in loans:
+        rows: List[Dict] = []
+        # Both cursors are ordered by loan id, repayments of loans gone in the meantime are skipped.
+        while group_loan_id is not None and group_loan_id <= loan.id:
+            if group_loan_id == loan.id:
+                rows = list(group)
+            group_loan_id, group = next(repayments, (None, ()))
+        item = loan_details_values.serialize_instances([loan])[0]
+        item['repayments'] = loan_repayment_values.serialize(rows)
+        if loan.has_virtual_schedule and not loan.has_been_paid_back():
+            item['repayments'].extend(loan_repayment_values.serialize_instances(loan.virtual_installments()))
+        yield item
+
+
+def _stringify(value) -> str:
+    return '' if value is None else str(value)
+
+
+def ndjson_lines(history: Iterator[Dict]) -> Iterator[str]:
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for item in history:
+        yield encoder.encode(item) + '\n'
+
+
+class _Line:
+    # csv.writer needs a file, this one just hands back what was written.
+    def write(self, value: str) -> str:
+        return value
+
+
+def csv_lines(history: Iterator[Dict]) -> Iterator[str]:
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_HEADER)
+    for item in history:
+        loan = [_stringify(item[column]) for column in LOAN_COLUMNS]
+        if not item['repayments']:
+            yield writer.writerow(loan + [''] * len(REPAYMENT_COLUMNS))
+        for repayment in item['repayments']:
+            yield writer.writerow(loan + [_stringify(repayment[column]) for column in REPAYMENT_COLUMNS])
+
+
+EXPORT_WRITERS = {
+    NDJSON: ndjson_lines,
+    CSV: csv_lines,
+}
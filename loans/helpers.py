@@ -1,33 +1,108 @@
-from decimal import Decimal, ROUND_DOWN
+import logging
+import random
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import chain
+from typing import List, Optional, Tuple
+from uuid import UUID
 
-from django.db import transaction
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Count, F, OuterRef, Q, QuerySet, Subquery, Sum
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
 
-from loans.models import Loan, LoanRepayment, LoanRepaymentStatus
-from utils.helpers import recurrence_date_generator
+from audit import trail as audit_trail
+from loans.amortization import accrued_interest, amortize
+from loans.cache import invalidate_loan_responses
+from loans.models import Loan, LoanApprovalStatus, LoanInterestMethod, LoanRepayment, LoanRepaymentStatus, \
+    LoanVersionConflict, NEXT_INSTALLMENT_FIELDS, OUTSTANDING_REPAYMENT_STATUSES, OVERDUE_BUCKETS, OverdueBucket, \
+    OverdueScanCheckpoint, PortfolioSummary, VIRTUAL_SCHEDULE_FIELDS
+from loans.schedule import from_minor_units, installment_due_dates, split_installments, to_minor_units
+from loans.serializers import validate_evaluator
 
+logger = logging.getLogger(__name__)
 
-def create_loan_repayment_schedule(loan: Loan):
-    installment = Decimal(loan.loan_amount / loan.term).quantize(Decimal('.00'), ROUND_DOWN)
-    loan_repayments = []
-    repayment_dates = recurrence_date_generator(loan.disbursement_date, loan.repayment_frequency)
-    for t in range(1, loan.term):
-        loan_repayments.append(
-            LoanRepayment(
-                loan=loan,
-                amount=installment,
-                due_date=next(repayment_dates),
-            )
-        )
-    # Creating the last installment separately to adjust for loan amount indivisible by loan term.
-    installment = loan.loan_amount - (installment * (loan.term - 1))
-    loan_repayments.append(
-        LoanRepayment(
-            loan=loan,
-            amount=installment,
-            due_date=next(repayment_dates),
-        )
+BULK_REPAYMENT_PAID = 'PAID'
+BULK_REPAYMENT_FAILED = 'FAILED'
+
+BULK_EVALUATION_DONE = 'DONE'
+BULK_EVALUATION_FAILED = 'FAILED'
+
+
+def schedule_installments(loans: List[Loan]) -> List[List[int]]:
+    """
+    Returns the installment amounts (in minor units) of freshly approved loans, and sets their
+    `amount_due` to the total, interest included.
+
+    The schedules of the whole batch are amortized at once by `loans.amortization`. SIMPLE interest
+    loans are amortized interest free: equal installments, the last one adjusting for a loan amount
+    indivisible by the loan term, like `split_installments`.
+    """
+    if not loans:
+        return []
+    schedule = amortize(
+        np.array([to_minor_units(loan.loan_amount) for loan in loans]),
+        np.array([loan.interest_rate if loan.interest_method == LoanInterestMethod.REDUCING_BALANCE else 0
+                  for loan in loans], dtype=np.float64),
+        np.array([loan.term for loan in loans]),
+        np.array([loan.repayment_frequency for loan in loans]),
     )
+    installments = []
+    for loan, amounts in zip(loans, schedule.installment):
+        amounts = amounts[:loan.term].tolist()
+        loan.amount_due = from_minor_units(sum(amounts))
+        installments.append(amounts)
+    return installments
+
+
+def build_loan_repayment_schedule(loan: Loan, installments: Optional[List[int]] = None) -> List[LoanRepayment]:
+    """
+    Returns the (unsaved) installments of a freshly approved loan, ordered by due date. Their
+    amounts come from `schedule_installments`, unless already computed there.
+    """
+    if installments is None:
+        installments, = schedule_installments([loan])
+    due_dates = installment_due_dates(loan.disbursement_date, loan.repayment_frequency, loan.term)
+    return [
+        LoanRepayment(loan=loan, amount=from_minor_units(amount), due_date=due_date)
+        for amount, due_date in zip(installments, due_dates)
+    ]
+
+
+def start_virtual_repayment_schedule(loan: Loan, installments: Optional[List[int]] = None):
+    """Sets up the virtual schedule of a freshly approved loan, in memory. No installment gets a row."""
+    if installments is None:
+        installments, = schedule_installments([loan])
+    loan.schedule_start_date = loan.disbursement_date
+    # Amortized schedules are equated installments too, only the last one differs.
+    loan.regular_installment = from_minor_units(installments[0])
+    loan.final_installment = from_minor_units(installments[-1])
+    loan.remaining_installments = loan.term
+    loan.refresh_next_installment()
+
+
+@transaction.atomic()
+def create_loan_repayment_schedule(loan: Loan, installments: Optional[List[int]] = None):
+    if loan.has_virtual_schedule:
+        start_virtual_repayment_schedule(loan, installments)
+        loan.save(update_fields=VIRTUAL_SCHEDULE_FIELDS + NEXT_INSTALLMENT_FIELDS + ["modified"])
+        return
+    loan_repayments = build_loan_repayment_schedule(loan, installments)
     LoanRepayment.objects.bulk_create(loan_repayments)
+    loan.set_next_installment(loan_repayments[0])
+    loan.save(update_fields=NEXT_INSTALLMENT_FIELDS + ["modified"])
+
+
+def _rebalance_installments(amount_due: Decimal, pending_repayments: List[LoanRepayment]):
+    """Spreads `amount_due` over the (due date ordered) `pending_repayments`, in place."""
+    # The last installment adjusts for a due amount indivisible by the remaining repayments.
+    amounts = split_installments(to_minor_units(amount_due), len(pending_repayments))
+    for repayment, amount in zip(pending_repayments, amounts):
+        repayment.amount = from_minor_units(amount)
 
 
 @transaction.atomic()
@@ -35,12 +110,477 @@ def rebalance_loan_repayment_schedule(loan: Loan):
     if not loan.amount_due:
         # create proper exception class.
         raise Exception('Why are we re-balancing if no balance is due?')
-    pending_repayments = LoanRepayment.objects.filter(loan=loan, status=LoanRepaymentStatus.PENDING).order_by('due_date')
-    new_installment = Decimal(loan.amount_due / pending_repayments.count()).quantize(Decimal('.00'), ROUND_DOWN)
-    repayment = None
-    for repayment in pending_repayments:
-        repayment.amount = new_installment
-
-    # Updating the last installment separately to adjust for due amount indivisible by remaining repayments.
-    repayment.amount = loan.amount_due - (new_installment * (pending_repayments.count() - 1))
+    if loan.has_virtual_schedule:
+        # Only the two installment amounts change, however long the schedule.
+        loan.set_virtual_installments(loan.amount_due, loan.remaining_installments)
+        loan.refresh_next_installment()
+        loan.save(update_fields=VIRTUAL_SCHEDULE_FIELDS + NEXT_INSTALLMENT_FIELDS + ["modified"])
+        return
+    pending_repayments = list(
+        LoanRepayment.objects.filter(loan=loan, status__in=OUTSTANDING_REPAYMENT_STATUSES).order_by('due_date'))
+    _rebalance_installments(loan.amount_due, pending_repayments)
     LoanRepayment.objects.bulk_update(pending_repayments, ["amount", "modified"])
+    loan.set_next_installment(pending_repayments[0])
+    loan.save(update_fields=NEXT_INSTALLMENT_FIELDS + ["modified"])
+
+
+def run_with_retries(func, *args, **kwargs):
+    """
+    Runs `func` in a transaction (savepoint) of its own, and runs it anew whenever a versioned
+    Loan save in it lost to a concurrent update (LoanVersionConflict): up to LOAN_UPDATE_MAX_ATTEMPTS
+    times, sleeping a jittered, exponentially growing multiple of LOAN_UPDATE_BACKOFF in between.
+    The conflict of the last attempt is raised.
+    """
+    for attempt in range(settings.LOAN_UPDATE_MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        except LoanVersionConflict:
+            if attempt == settings.LOAN_UPDATE_MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(settings.LOAN_UPDATE_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def find_next_installment_drift(loans: QuerySet, chunk_size=2000):
+    """
+    Yields (loan, expected) for every loan whose next installment fields do not match its
+    repayment schedule. `expected` is the next outstanding LoanRepayment, None if nothing is due.
+    Virtual schedules are checked against their schedule parameters instead, their expected
+    installment is unsaved.
+    """
+    next_pending = LoanRepayment.objects.filter(
+        loan=OuterRef('pk'), status__in=OUTSTANDING_REPAYMENT_STATUSES).order_by('due_date')
+    loans = loans.annotate(
+        expected_repayment_id=Subquery(next_pending.values('id')[:1]),
+        expected_due_date=Subquery(next_pending.values('due_date')[:1]),
+        expected_due_amount=Subquery(next_pending.values('amount')[:1]),
+    ).order_by('pk')
+    for loan in loans.iterator(chunk_size=chunk_size):
+        if loan.has_virtual_schedule:
+            expected = loan.next_virtual_installment()
+            if (loan.next_repayment_id, loan.next_due_date, loan.next_due_amount) != (
+                    None, getattr(expected, 'due_date', None), getattr(expected, 'amount', None)):
+                yield loan, expected
+            continue
+        if (loan.next_repayment_id, loan.next_due_date, loan.next_due_amount) == (
+                loan.expected_repayment_id, loan.expected_due_date, loan.expected_due_amount):
+            continue
+        expected = None
+        if loan.expected_repayment_id is not None:
+            expected = LoanRepayment(
+                id=loan.expected_repayment_id, loan=loan,
+                due_date=loan.expected_due_date, amount=loan.expected_due_amount,
+            )
+        yield loan, expected
+
+
+def _repayment_result(record: dict, status: str, message: str = None) -> dict:
+    return {
+        'loan_id': str(record['loan_id']),
+        'payment_request_id': record['payment_request_id'],
+        'status': status,
+        'message': message,
+    }
+
+
+def _apply_repayment_batch(records: List[dict]) -> List[dict]:
+    loan_ids = sorted({record['loan_id'] for record in records})
+    # Locking in a deterministic order, so that concurrent batches can not deadlock each other.
+    loans = {loan.id: loan for loan in Loan.objects.select_for_update().filter(id__in=loan_ids).order_by('id')}
+    schedules = defaultdict(list)
+    for repayment in LoanRepayment.objects.filter(
+            loan_id__in=loan_ids, status__in=OUTSTANDING_REPAYMENT_STATUSES).order_by('loan_id', 'due_date'):
+        repayment.loan = loans[repayment.loan_id]
+        schedules[repayment.loan_id].append(repayment)
+    # Gateways retry, a payment request must never be applied twice.
+    recorded_payment_requests = set(LoanRepayment.objects.filter(
+        payment_request_id__in=[record['payment_request_id'] for record in records]
+    ).values_list('payment_request_id', flat=True))
+
+    now, modified = datetime.now(), timezone.now()
+    # Installments of virtual schedules only get a row once paid.
+    results, changed_loans, changed_repayments, paid_installments = [], {}, {}, []
+    paid_total, closed = Decimal(0), 0
+    for record in records:
+        loan, amount = loans.get(record['loan_id']), record['amount']
+        if loan is None:
+            results.append(_repayment_result(record, BULK_REPAYMENT_FAILED, 'Loan Not Found'))
+            continue
+        if record['payment_request_id'] in recorded_payment_requests:
+            results.append(_repayment_result(record, BULK_REPAYMENT_FAILED, 'Repayment already recorded.'))
+            continue
+        if loan.has_been_paid_back():
+            results.append(
+                _repayment_result(record, BULK_REPAYMENT_FAILED, 'Trying to pay for an already closed loan.'))
+            continue
+        if amount > loan.amount_due:
+            results.append(_repayment_result(record, BULK_REPAYMENT_FAILED, 'Trying to pay more than the due amount.'))
+            continue
+        schedule = schedules[loan.id]
+        upcoming_repayment = loan.upcoming_repayment if loan.has_virtual_schedule else schedule[0]
+        if amount < upcoming_repayment.amount:
+            results.append(_repayment_result(
+                record, BULK_REPAYMENT_FAILED, f'Minimum acceptable amount is {upcoming_repayment.amount}'))
+            continue
+
+        overpaid = amount > upcoming_repayment.amount
+        upcoming_repayment.amount = amount
+        upcoming_repayment.status = LoanRepaymentStatus.PAID
+        upcoming_repayment.repayment_date = now
+        upcoming_repayment.payment_request_id = record['payment_request_id']
+        if loan.has_virtual_schedule:
+            paid_installments.append(upcoming_repayment)
+            loan.remaining_installments -= 1
+        else:
+            changed_repayments[upcoming_repayment.id] = upcoming_repayment
+            schedule.pop(0)
+
+        loan.amount_due = loan.amount_due - amount
+        paid_total += amount
+        if loan.has_been_paid_back():
+            loan.closure_date = now
+            closed += 1
+        elif overpaid and loan.has_virtual_schedule:
+            loan.set_virtual_installments(loan.amount_due, loan.remaining_installments)
+        elif overpaid:
+            _rebalance_installments(loan.amount_due, schedule)
+            changed_repayments.update((repayment.id, repayment) for repayment in schedule)
+        if loan.has_virtual_schedule:
+            loan.refresh_next_installment()
+        else:
+            loan.set_next_installment(schedule[0] if schedule else None)
+        changed_loans[loan.id] = loan
+        recorded_payment_requests.add(record['payment_request_id'])
+        results.append(_repayment_result(record, BULK_REPAYMENT_PAID))
+
+    for instance in chain(changed_repayments.values(), changed_loans.values()):
+        instance.modified = modified
+    for loan in changed_loans.values():
+        loan.version = F('version') + 1
+    repayment_fields = ["amount", "status", "repayment_date", "payment_request_id", "modified"]
+    loan_fields = (["amount_due", "closure_date", "modified", "version"]
+                   + NEXT_INSTALLMENT_FIELDS + VIRTUAL_SCHEDULE_FIELDS)
+    LoanRepayment.objects.bulk_create(paid_installments)
+    LoanRepayment.objects.bulk_update(changed_repayments.values(), repayment_fields)
+    Loan.objects.bulk_update(changed_loans.values(), loan_fields)
+    # Bulk writes send no post_save, so they are audited and the cached responses invalidated here.
+    audit_trail.record_bulk_saves(LoanRepayment, paid_installments)
+    audit_trail.record_bulk_saves(LoanRepayment, changed_repayments.values(), repayment_fields)
+    audit_trail.record_bulk_saves(Loan, changed_loans.values(), loan_fields)
+    invalidate_loan_responses(changed_loans, [loan.customer_id for loan in changed_loans.values()])
+    if changed_loans:
+        PortfolioSummary.record_change(LoanApprovalStatus.APPROVED, closed=closed, amount_due=-paid_total)
+    return results
+
+
+def apply_bulk_repayments(records: List[dict], batch_size=500) -> List[dict]:
+    """
+    Applies the {loan_id, amount, payment_request_id} repayment `records`, in order, and returns
+    a result for each of them.
+
+    Same rules as `make_repayment`, but whole batches are validated and applied in memory and
+    written with a handful of bulk queries. Every batch is its own transaction, and a record
+    which can not be applied is simply reported back as failed, so neither rolls back the others.
+    """
+    results = []
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        try:
+            with transaction.atomic():
+                results.extend(_apply_repayment_batch(batch))
+        except DatabaseError:
+            logger.exception('Could not apply a batch of %s repayments', len(batch))
+            results.extend(
+                _repayment_result(record, BULK_REPAYMENT_FAILED, 'Could not record the repayment, please retry.')
+                for record in batch
+            )
+    return results
+
+
+@transaction.atomic()
+def evaluate_loans(evaluations: List[dict], evaluated_by) -> List[dict]:
+    """
+    Approves or rejects the {loan_id, approval_status} `evaluations`, in order, and returns a
+    result for each of them.
+
+    Same rules as `submit_loan_evaluation`, but every evaluated loan is written by a single
+    bulk update and every repayment schedule by a single bulk insert. Evaluations which can not
+    be applied are reported back as failed without affecting the others.
+    """
+    loan_ids = sorted({evaluation['loan_id'] for evaluation in evaluations})
+    # Locking in a deterministic order, so that concurrent batches can not deadlock each other.
+    loans = {loan.id: loan for loan in Loan.objects.select_for_update().filter(id__in=loan_ids).order_by('id')}
+
+    now, modified = datetime.now(), timezone.now()
+    results, evaluated_loans, approved, loan_repayments = [], {}, [], []
+    for evaluation in evaluations:
+        result = {'loan_id': str(evaluation['loan_id']), 'approval_status': evaluation['approval_status']}
+        results.append(result)
+        loan = loans.get(evaluation['loan_id'])
+        if loan is None:
+            result.update(status=BULK_EVALUATION_FAILED, message='Loan Not Found')
+            continue
+        if loan.approval_status != LoanApprovalStatus.PENDING:
+            result.update(status=BULK_EVALUATION_FAILED, message='Cannot approve loan if it is not pending.')
+            continue
+        if loan.is_claimed_by_other(evaluated_by):
+            result.update(status=BULK_EVALUATION_FAILED, message='Loan is claimed by another reviewer.')
+            continue
+        try:
+            validate_evaluator(evaluated_by.id, loan)
+        except ValidationError as e:
+            result.update(status=BULK_EVALUATION_FAILED, message=e.detail[0])
+            continue
+
+        if evaluation['approval_status'] == LoanApprovalStatus.APPROVED:
+            loan.set_approved(evaluated_by, now)
+            approved.append(loan)
+        else:
+            loan.set_rejected(evaluated_by, now)
+        loan.modified = modified
+        loan.version = F('version') + 1
+        evaluated_loans[loan.id] = loan
+        result.update(status=BULK_EVALUATION_DONE, message=None)
+
+    # All the schedules of the batch are computed at once.
+    for loan, installments in zip(approved, schedule_installments(approved)):
+        if loan.has_virtual_schedule:
+            start_virtual_repayment_schedule(loan, installments)
+        else:
+            schedule = build_loan_repayment_schedule(loan, installments)
+            loan.set_next_installment(schedule[0])
+            loan_repayments.extend(schedule)
+
+    loan_fields = [
+        "approval_status", "evaluated_by", "evaluation_date", "disbursement_date", "amount_due", "modified",
+        "schedule_mode", "interest_method", "version"
+    ] + NEXT_INSTALLMENT_FIELDS + VIRTUAL_SCHEDULE_FIELDS
+    LoanRepayment.objects.bulk_create(loan_repayments)
+    Loan.objects.bulk_update(evaluated_loans.values(), loan_fields)
+    # Bulk writes send no post_save, so they are audited and the cached responses invalidated here.
+    audit_trail.record_bulk_saves(LoanRepayment, loan_repayments)
+    audit_trail.record_bulk_saves(Loan, evaluated_loans.values(), loan_fields)
+    invalidate_loan_responses(evaluated_loans, [loan.customer_id for loan in evaluated_loans.values()])
+
+    rejected = len(evaluated_loans) - len(approved)
+    if evaluated_loans:
+        PortfolioSummary.record_change(LoanApprovalStatus.PENDING, loans=-len(evaluated_loans))
+    if approved:
+        PortfolioSummary.record_change(
+            LoanApprovalStatus.APPROVED, loans=len(approved), amount_due=sum(loan.amount_due for loan in approved))
+    if rejected:
+        PortfolioSummary.record_change(LoanApprovalStatus.REJECTED, loans=rejected)
+    return results
+
+
+@transaction.atomic()
+def claim_pending_loans(reviewer, count: int) -> List[Loan]:
+    """
+    Leases up to `count` of the oldest unclaimed pending loans to `reviewer`.
+
+    Rows locked by a concurrent claim are skipped rather than waited for, so reviewers
+    claiming at the same time get disjoint loans without blocking each other. Loans whose
+    lease expired are claimable again. Reviewers never get their own loans.
+    """
+    now = timezone.now()
+    loans = list(
+        Loan.objects.select_for_update(skip_locked=True).filter(
+            Q(claim_expires_at__isnull=True) | Q(claim_expires_at__lte=now),
+            approval_status=LoanApprovalStatus.PENDING,
+        ).exclude(customer=reviewer).order_by('created', 'id')[:count]
+    )
+    claim_expires_at = now + timedelta(seconds=settings.LOAN_REVIEW_LEASE_SECONDS)
+    Loan.objects.filter(id__in=[loan.id for loan in loans]).update(
+        claimed_by=reviewer, claim_expires_at=claim_expires_at, version=F('version') + 1)
+    for loan in loans:
+        loan.claimed_by, loan.claim_expires_at = reviewer, claim_expires_at
+        loan.version += 1
+    audit_trail.record_bulk_saves(Loan, loans, ["claimed_by", "claim_expires_at"])
+    return loans
+
+
+def accrue_interest(through: date, chunk_size=2000) -> int:
+    """
+    Accrues interest on the outstanding principal of every SIMPLE interest loan up to and including
+    `through`, and returns the number of loans updated.
+
+    Loans are read in primary key order, `chunk_size` at a time. The interest of a whole chunk is
+    computed at once by `loans.amortization` and written back with a single bulk update. Every chunk
+    is its own transaction and loans already accrued through `through` are skipped, so an interrupted
+    run can simply be started again.
+    """
+    loans = Loan.objects.filter(
+        Q(interest_accrued_through__isnull=True) | Q(interest_accrued_through__lt=through),
+        approval_status=LoanApprovalStatus.APPROVED, disbursement_date__isnull=False,
+        interest_method=LoanInterestMethod.SIMPLE, interest_rate__gt=0, amount_due__gt=0,
+    ).order_by('id').values_list(
+        'id', 'amount_due', 'interest_rate', 'accrued_interest', 'interest_accrued_through', 'disbursement_date')
+
+    updated, last_id = 0, None
+    while True:
+        rows = list((loans.filter(id__gt=last_id) if last_id else loans)[:chunk_size])
+        if not rows:
+            return updated
+        last_id = rows[-1][0]
+        ids, amounts_due, rates, accrued, accrued_through, disbursement_dates = zip(*rows)
+        # Interest starts accruing the day after disbursement.
+        days = np.array([
+            (through - (last_accrual or timezone.localdate(disbursed))).days
+            for last_accrual, disbursed in zip(accrued_through, disbursement_dates)
+        ])
+        interest = accrued_interest(
+            np.array([to_minor_units(amount_due) for amount_due in amounts_due]),
+            np.array(rates, dtype=np.float64),
+            np.maximum(days, 0),
+        )
+        modified = timezone.now()
+        accrued_loans = [
+            Loan(id=loan_id, accrued_interest=previous + from_minor_units(int(amount)),
+                 interest_accrued_through=through, modified=modified, version=F('version') + 1)
+            for loan_id, previous, amount in zip(ids, accrued, interest)
+        ]
+        with transaction.atomic():
+            Loan.objects.bulk_update(
+                accrued_loans, ["accrued_interest", "interest_accrued_through", "modified", "version"])
+            audit_trail.record_updates(Loan, {
+                loan.id: {
+                    'accrued_interest': [previous, loan.accrued_interest],
+                    'interest_accrued_through': [previous_through, through],
+                }
+                for loan, previous, previous_through in zip(accrued_loans, accrued, accrued_through)
+            })
+        updated += len(rows)
+
+
+def _portfolio_totals(rows) -> dict:
+    totals = {
+        status: {'loans': 0, 'open_loans': 0, 'closed_loans': 0, 'amount_due': from_minor_units(0)}
+        for status in LoanApprovalStatus.values
+    }
+    for row in rows:
+        totals[row['approval_status']].update(
+            loans=row['loans'], open_loans=row['loans'] - row['closed_loans'], closed_loans=row['closed_loans'],
+            # Some backends lose the scale of summed decimals.
+            amount_due=from_minor_units(to_minor_units(row['amount_due'])))
+    return totals
+
+
+def summarize_portfolio() -> dict:
+    """Totals per approval status, read from the incrementally maintained PortfolioSummary."""
+    return _portfolio_totals(PortfolioSummary.objects.order_by().values('approval_status').annotate(
+        loans=Sum('loan_count'), closed_loans=Sum('closed_count'), amount_due=Sum('amount_due')))
+
+
+def aggregate_portfolio() -> dict:
+    """Same totals as `summarize_portfolio`, but aggregated over the whole Loan table."""
+    return _portfolio_totals(Loan.objects.order_by().values('approval_status').annotate(
+        loans=Count('id'), closed_loans=Count('id', filter=Q(closure_date__isnull=False)),
+        amount_due=Sum('amount_due')))
+
+
+@transaction.atomic()
+def rebuild_portfolio_summary():
+    """
+    Overwrites PortfolioSummary with totals aggregated over the Loan table.
+
+    The summary rows are locked before aggregating: loan changes committed before that are in
+    the aggregates, and changes still in flight wait for the rebuild and are applied on top.
+    """
+    list(PortfolioSummary.objects.select_for_update().order_by('approval_status', 'slot'))
+    totals = aggregate_portfolio()
+    PortfolioSummary.objects.exclude(slot=0).update(loan_count=0, closed_count=0, amount_due=0)
+    for status, total in totals.items():
+        PortfolioSummary.objects.update_or_create(approval_status=status, slot=0, defaults={
+            'loan_count': total['loans'], 'closed_count': total['closed_loans'], 'amount_due': total['amount_due'],
+        })
+
+
+@transaction.atomic()
+def refresh_overdue_buckets() -> List[OverdueBucket]:
+    """Recounts the approved open loans per OVERDUE_BUCKETS, by the due date of their next installment."""
+    as_of = timezone.now()
+    overdue = {}
+    for first_day, last_day in OVERDUE_BUCKETS:
+        bucket = Q(next_due_date__lte=as_of - timedelta(days=first_day))
+        if last_day is not None:
+            bucket &= Q(next_due_date__gt=as_of - timedelta(days=last_day + 1))
+        overdue[f'loans_{first_day}'] = Count('id', filter=bucket)
+        overdue[f'amount_due_{first_day}'] = Sum('amount_due', filter=bucket)
+    counts = Loan.objects.filter(
+        approval_status=LoanApprovalStatus.APPROVED, closure_date__isnull=True).aggregate(**overdue)
+
+    buckets = []
+    OverdueBucket.objects.exclude(first_day__in=[first_day for first_day, _ in OVERDUE_BUCKETS]).delete()
+    for first_day, last_day in OVERDUE_BUCKETS:
+        bucket, _ = OverdueBucket.objects.update_or_create(first_day=first_day, defaults={
+            'last_day': last_day,
+            'loan_count': counts[f'loans_{first_day}'],
+            'amount_due': counts[f'amount_due_{first_day}'] or 0,
+            'as_of': as_of,
+        })
+        buckets.append(bucket)
+    return buckets
+
+
+def shard_id_range(shard: int, shards: int) -> Tuple[UUID, Optional[UUID]]:
+    """
+    [first, last) UUIDs of the `shard`th of `shards` equal slices of the UUID keyspace. The last
+    one is open ended.
+    """
+    if not 0 <= shard < shards:
+        raise ValueError(f'shard should be in [0, {shards}).')
+    end = None if shard == shards - 1 else UUID(int=(shard + 1) * 2 ** 128 // shards)
+    return UUID(int=shard * 2 ** 128 // shards), end
+
+
+def mark_overdue_repayments(shard=0, shards=1, chunk_size=5000, restart=False) -> int:
+    """
+    Marks the PENDING installments whose due date has passed as OVERDUE, and returns how many
+    got marked.
+
+    Installments are walked in id keyset order over repayment_pending_by_id_idx, `chunk_size` at
+    a time, and every chunk of due ones is marked by a single UPDATE. The chunk and the
+    OverdueScanCheckpoint recording how far the scan got are committed together, so a run which
+    gets interrupted resumes after the last committed chunk. Workers given different `shard`s of
+    the same `shards` seek to disjoint ranges of ids, so they split the scan between them and can
+    run side by side.
+    """
+    first_id, end_id = shard_id_range(shard, shards)
+    checkpoint, created = OverdueScanCheckpoint.objects.get_or_create(
+        shard=shard, shards=shards, defaults={'as_of': timezone.now()})
+    if not created and (restart or checkpoint.completed_at is not None):
+        checkpoint.as_of, checkpoint.last_id, checkpoint.completed_at = timezone.now(), None, None
+        checkpoint.save(update_fields=['as_of', 'last_id', 'completed_at', 'modified'])
+
+    due = LoanRepayment.objects.filter(status=LoanRepaymentStatus.PENDING, due_date__lt=checkpoint.as_of)
+    if end_id is not None:
+        due = due.filter(id__lt=end_id)
+    due = due.order_by('id')
+
+    marked = 0
+    while True:
+        if checkpoint.last_id is not None:
+            chunk = due.filter(id__gt=checkpoint.last_id)
+        else:
+            chunk = due.filter(id__gte=first_id)
+        keys = list(chunk.values_list('id', 'loan_id')[:chunk_size])
+        if not keys:
+            break
+        with transaction.atomic():
+            # Installments paid since they were read are left alone, and out of the audit trail.
+            still_pending = list(LoanRepayment.objects.select_for_update().filter(
+                id__in=[repayment_id for repayment_id, _ in keys], status=LoanRepaymentStatus.PENDING,
+            ).values_list('id', flat=True))
+            marked += LoanRepayment.objects.filter(id__in=still_pending).update(
+                status=LoanRepaymentStatus.OVERDUE, modified=timezone.now())
+            audit_trail.record_updates(LoanRepayment, {
+                repayment_id: {'status': [LoanRepaymentStatus.PENDING, LoanRepaymentStatus.OVERDUE]}
+                for repayment_id in still_pending
+            })
+            invalidate_loan_responses({loan_id for _, loan_id in keys})
+            checkpoint.last_id = keys[-1][0]
+            checkpoint.save(update_fields=['last_id', 'modified'])
+
+    checkpoint.completed_at = timezone.now()
+    checkpoint.save(update_fields=['completed_at', 'modified'])
+    return marked
@@ -0,0 +1,100 @@
+"""
+Idempotency keys for the write endpoints: clients retrying a request send the same
+Idempotency-Key header, and get the response to the first request replayed instead of
+having it handled (and its locks taken) all over again.
+"""
+import hashlib
+import json
+from datetime import datetime
+from functools import wraps
+from typing import Optional
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse, QueryDict
+from rest_framework import status
+
+from loans.models import IdempotentResponse
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256('\x00'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _request_digest(data) -> str:
+    if isinstance(data, QueryDict):
+        data = dict(data.lists())
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _get_stored_response(key: str) -> Optional[IdempotentResponse]:
+    return IdempotentResponse.objects.filter(key=key).first()
+
+
+def _replay(stored: IdempotentResponse, request_digest: str) -> HttpResponse:
+    if stored.request_digest != request_digest:
+        return JsonResponse(
+            {'message': f'{IDEMPOTENCY_HEADER} has already been used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = HttpResponse(bytes(stored.content), content_type='application/json', status=stored.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Makes a (DRF, authenticated) function view replay its response to requests carrying an
+    Idempotency-Key the user already sent it. Goes right above the def.
+
+    A replay costs a single primary key lookup. The first request inserts its row before the
+    view runs, in the same transaction, so a concurrent retry waits on that row and then replays
+    the committed response. Nothing is stored for server errors, so those are retried for real.
+    Keys are kept for at least IDEMPOTENCY_KEY_TTL, see `purge_idempotent_responses`.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            return JsonResponse(
+                {'message': f'{IDEMPOTENCY_HEADER} should be 1 to {MAX_KEY_LENGTH} characters long.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        key = _digest(request.user.id, view.__name__, idempotency_key)
+        request_digest = _request_digest(request.data)
+        stored = _get_stored_response(key)
+        if stored is None:
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        IdempotentResponse.objects.create(key=key, request_digest=request_digest)
+                except IntegrityError:
+                    # A concurrent request with the same key committed first.
+                    stored = _get_stored_response(key)
+                else:
+                    response = view(request, *args, **kwargs)
+                    if response.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+                        transaction.set_rollback(True)
+                    else:
+                        IdempotentResponse.objects.filter(key=key).update(
+                            status_code=response.status_code, content=response.content)
+                    return response
+        return _replay(stored, request_digest)
+    return wrapper
+
+
+def purge_idempotent_responses(older_than: datetime, chunk_size=1000) -> int:
+    """Deletes the responses stored before `older_than`, in chunks of their own (autocommitted) statement."""
+    expired = IdempotentResponse.objects.filter(created__lt=older_than).order_by('created')
+    deleted = 0
+    while True:
+        keys = list(expired.values_list('key', flat=True)[:chunk_size])
+        if not keys:
+            break
+        deleted += IdempotentResponse.objects.filter(key__in=keys).delete()[0]
+    return deleted
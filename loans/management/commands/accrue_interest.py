@@ -0,0 +1,20 @@
+from datetime import date
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from loans.helpers import accrue_interest
+
+
+class Command(BaseCommand):
+    help = 'Accrue interest on every outstanding interest bearing loan, meant to run nightly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', type=date.fromisoformat,
+                            help='Last day (YYYY-MM-DD) to accrue interest for, defaults to today.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        through = options['through'] or timezone.localdate()
+        updated = accrue_interest(through, chunk_size=options['chunk_size'])
+        self.stdout.write(f'Accrued interest through {through} on {updated} loan(s).')
@@ -0,0 +1,36 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from audit import trail as audit_trail
+from loans.helpers import find_next_installment_drift
+from loans.models import Loan, NEXT_INSTALLMENT_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Fill in (or repair) every loan's next installment fields from its repayment schedule."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def write_batch(self, batch):
+        for loan in batch:
+            loan.version = F('version') + 1
+        with transaction.atomic():
+            Loan.objects.bulk_update(batch, NEXT_INSTALLMENT_FIELDS + ['version'])
+            # Bulk updates send no post_save.
+            audit_trail.record_bulk_saves(Loan, batch, NEXT_INSTALLMENT_FIELDS)
+
+    def handle(self, *args, **options):
+        batch, updated = [], 0
+        for loan, expected in find_next_installment_drift(Loan.objects.all()):
+            loan.set_next_installment(expected)
+            batch.append(loan)
+            if len(batch) == options['batch_size']:
+                self.write_batch(batch)
+                updated += len(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+            updated += len(batch)
+        self.stdout.write(f'Updated {updated} loan(s).')
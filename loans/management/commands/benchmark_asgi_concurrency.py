@@ -0,0 +1,116 @@
+import asyncio
+import base64
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.asgi import get_asgi_application
+from django.core.management import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+from loans.models import Loan
+from userman.models import User, UserLevel
+
+HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/sec and p99 latency of a read endpoint served by the WSGI application with a '
+            'fixed number of threads (like gunicorn --threads) and by its async version under the ASGI '
+            'application, for increasing numbers of concurrent clients.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 50, 200])
+        parser.add_argument('--wsgi-threads', type=int, default=8)
+        parser.add_argument('--endpoint', choices=['pending', 'details'], default='pending',
+                            help='pending loans always hit the database, loan details are mostly served '
+                                 'from the response cache.')
+
+    def run_wsgi(self, path, authorization, clients, threads, requests):
+        application = get_wsgi_application()
+        # Clients beyond the server's threads queue up, and their wait counts towards the latency.
+        server_threads = threading.BoundedSemaphore(threads)
+
+        def request():
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_AUTHORIZATION': authorization, 'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr,
+                'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0), 'wsgi.multithread': True,
+                'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            }
+            statuses = []
+            started = time.perf_counter()
+            with server_threads:
+                result = application(environ, lambda status_line, headers: statuses.append(status_line))
+                try:
+                    b''.join(result)
+                finally:
+                    # Sends request_finished, which closes the thread's connections.
+                    result.close()
+            assert statuses[0].startswith('200'), statuses[0]
+            return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            timings = list(executor.map(lambda _: request(), range(requests)))
+        return requests / (time.perf_counter() - started), statistics.quantiles(timings, n=100)[98]
+
+    async def run_asgi(self, path, authorization, clients, requests):
+        application = get_asgi_application()
+        in_flight = asyncio.Semaphore(clients)
+
+        async def request():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode('ascii'), 'query_string': b'',
+                'root_path': '', 'server': (HOST, 80), 'client': ('127.0.0.1', 0),
+                'headers': [(b'host', HOST.encode('ascii')), (b'authorization', authorization.encode('ascii'))],
+            }
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            async with in_flight:
+                started = time.perf_counter()
+                await application(scope, receive, send)
+                elapsed = (time.perf_counter() - started) * 1000
+            assert messages[0]['status'] == 200, messages
+            return elapsed
+
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(request() for _ in range(requests)))
+        return requests / (time.perf_counter() - started), statistics.quantiles(timings, n=100)[98]
+
+    def handle(self, *args, **options):
+        # The requests run on connections of their own, so the benchmark data has to be committed.
+        admin = User.objects.create_user(
+            username='benchasgiadmin', password='benchpass', phone_number='9876543200', name='Bench Admin',
+            user_level=UserLevel.ADMIN)
+        loans = [Loan.objects.create(customer=admin, loan_amount=100, term=5) for _ in range(50)]
+        if options['endpoint'] == 'pending':
+            wsgi_path, asgi_path = reverse('get_pending_loans'), reverse('get_pending_loans_async')
+        else:
+            wsgi_path = reverse('get_loan_details', args=[loans[0].id])
+            asgi_path = reverse('get_loan_details_async', args=[loans[0].id])
+        authorization = 'Basic ' + base64.b64encode(b'benchasgiadmin:benchpass').decode('ascii')
+
+        try:
+            for clients in options['clients']:
+                wsgi = self.run_wsgi(wsgi_path, authorization, clients, options['wsgi_threads'], options['requests'])
+                asgi = asyncio.run(self.run_asgi(asgi_path, authorization, clients, options['requests']))
+                self.stdout.write(
+                    f'{clients:5d} clients: WSGI ({options["wsgi_threads"]} threads) {wsgi[0]:8.1f} requests/sec, '
+                    f'p99 {wsgi[1]:8.2f} ms | ASGI {asgi[0]:8.1f} requests/sec, p99 {asgi[1]:8.2f} ms')
+        finally:
+            Loan.objects.filter(customer=admin).delete()
+            admin.delete()
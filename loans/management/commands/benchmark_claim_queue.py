@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import Counter
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from loans.helpers import claim_pending_loans
+from loans.models import Loan
+from userman.models import User, UserLevel
+
+
+class Command(BaseCommand):
+    help = 'Simulate many reviewers claiming pending loans concurrently. Needs Postgres for SKIP LOCKED.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviewers', type=int, default=16)
+        parser.add_argument('--loans', type=int, default=5000)
+        parser.add_argument('--batch', type=int, default=10)
+
+    def reviewer(self, user, batch, claims, errors):
+        try:
+            while True:
+                loans = claim_pending_loans(reviewer=user, count=batch)
+                if not loans:
+                    return
+                claims.extend(loan.id for loan in loans)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write(f'Running on {connection.vendor}: rows are not locked, expect contention errors.')
+
+        with transaction.atomic():
+            customer = User.objects.create_user(
+                username='benchcustomer', password='benchpass', phone_number='9876543200', name='Bench Customer')
+            reviewers = [
+                User.objects.create_user(
+                    username=f'benchreviewer{i}', password='benchpass', phone_number='9876543200',
+                    name='Bench Reviewer', user_level=UserLevel.ADMIN)
+                for i in range(options['reviewers'])
+            ]
+            Loan.objects.bulk_create(
+                Loan(customer=customer, loan_amount=100, term=5) for _ in range(options['loans']))
+        loan_ids = set(Loan.objects.filter(customer=customer).values_list('id', flat=True))
+
+        claims, errors = [], []
+        threads = [
+            threading.Thread(target=self.reviewer, args=(reviewer, options['batch'], claims, errors))
+            for reviewer in reviewers
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        claimed = Counter(claims)
+        try:
+            self.stdout.write(f'{len(reviewers)} reviewers claimed {len(claimed)}/{len(loan_ids)} loans '
+                              f'in {elapsed:.2f}s ({len(claims) / elapsed:.1f} loans/sec)')
+            self.stdout.write(f'Claimed more than once: {sum(1 for count in claimed.values() if count > 1)}')
+            self.stdout.write(f'Reviewer errors: {len(errors)} {errors[:1]}')
+        finally:
+            with transaction.atomic():
+                Loan.objects.filter(customer=customer).delete()
+                User.objects.filter(id__in=[customer.id] + [reviewer.id for reviewer in reviewers]).delete()
@@ -0,0 +1,62 @@
+import base64
+import statistics
+import time
+
+from django.core.cache import caches
+from django.core.management import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from rest_framework.test import APIRequestFactory
+
+from loans.cache import RESPONSE_CACHE
+from loans.models import Loan
+from loans.views import get_loan_details
+from userman.models import User
+from utils.db_backends.postgresql_pooled.base import DatabaseWrapper as PooledDatabaseWrapper, pool_stats
+
+
+class Command(BaseCommand):
+    help = ('Compare p50/p99 latency of get_loan_details with and without the connection pool. Every request '
+            'connects and closes like a real one (CONN_MAX_AGE=0), the response cache is cleared before each.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+
+    def run(self, loan_id, requests):
+        factory = APIRequestFactory()
+        credentials = base64.b64encode(b'benchpooluser:benchpass').decode('utf-8')
+        timings = []
+        for _ in range(requests):
+            caches[RESPONSE_CACHE].clear()
+            started = time.perf_counter()
+            response = get_loan_details(
+                factory.get(f'/loan/{loan_id}/', HTTP_AUTHORIZATION=f'Basic {credentials}'), loan_id=str(loan_id))
+            # What request_finished does at the end of every request.
+            connection.close()
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.content
+        percentiles = statistics.quantiles(timings, n=100)
+        return percentiles[49], percentiles[98]
+
+    def handle(self, *args, **options):
+        if not isinstance(connections[DEFAULT_DB_ALIAS], PooledDatabaseWrapper):
+            raise CommandError('Needs the pooled Postgres backend (utils.db_backends.postgresql_pooled).')
+        pool_options = connection.settings_dict['POOL']
+
+        # The requests run on connections of their own, so the benchmark data has to be committed.
+        customer = User.objects.create_user(
+            username='benchpooluser', password='benchpass', phone_number='9876543200', name='Bench User')
+        loan = Loan.objects.create(customer=customer, loan_amount=100, term=5)
+        try:
+            connection.close()
+            connection.settings_dict['POOL'] = None
+            unpooled = self.run(loan.id, options['requests'])
+            connection.settings_dict['POOL'] = pool_options
+            pooled = self.run(loan.id, options['requests'])
+        finally:
+            connection.settings_dict['POOL'] = pool_options
+            Loan.objects.filter(customer=customer).delete()
+            customer.delete()
+
+        self.stdout.write(f'Without pool: p50 {unpooled[0]:8.2f} ms, p99 {unpooled[1]:8.2f} ms')
+        self.stdout.write(f'With pool:    p50 {pooled[0]:8.2f} ms, p99 {pooled[1]:8.2f} ms')
+        self.stdout.write(f"Pool: {pool_stats()[connection.alias]}")
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from loans.models import Loan, LoanRepayment, LoanRepaymentStatus, LoanUpdateStrategy
+from loans.views import make_repayment
+from userman.authentication import issue_access_token
+from userman.models import User, UserLevel
+
+INSTALLMENT = 100
+
+
+class Command(BaseCommand):
+    help = ('Measure successful repayments/sec with many threads repaying the very same loan, with the '
+            'LOCKING and the OPTIMISTIC loan update strategy. Needs Postgres.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--repayments', type=int, default=50, help='Repayments made by every thread.')
+
+    def payer(self, loan_id, token, repayments, outcomes):
+        factory = APIRequestFactory()
+        try:
+            for _ in range(repayments):
+                request = factory.post('/loan/repay/', {'loan_id': str(loan_id), 'amount': INSTALLMENT},
+                                       HTTP_AUTHORIZATION=f'Bearer {token}')
+                try:
+                    outcomes.append(make_repayment(request).status_code)
+                except Exception as e:
+                    outcomes.append(type(e).__name__)
+        finally:
+            connection.close()
+
+    def run(self, strategy, customer, admin, threads, repayments):
+        installments = threads * repayments
+        loan = Loan.objects.create(customer=customer, loan_amount=INSTALLMENT * installments, term=installments)
+        loan.approve(approved_by=admin)
+        token = issue_access_token(customer)
+
+        outcomes = []
+        workers = [threading.Thread(target=self.payer, args=(loan.id, token, repayments, outcomes))
+                   for _ in range(threads)]
+        with override_settings(LOAN_UPDATE_STRATEGY=strategy):
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+
+        loan.refresh_from_db()
+        succeeded = outcomes.count(200)
+        paid = LoanRepayment.objects.filter(loan=loan, status=LoanRepaymentStatus.PAID).count()
+        # Every successful repayment has to show in the balance, exactly once.
+        consistent = paid == succeeded and loan.amount_due == INSTALLMENT * (installments - succeeded)
+        failures = {outcome: outcomes.count(outcome) for outcome in set(outcomes) if outcome != 200}
+        self.stdout.write(f'{strategy:10}: {succeeded}/{len(outcomes)} repayments succeeded, '
+                          f'{succeeded / elapsed:8.1f} successful repayments/sec, failures {failures}, '
+                          f'balance {"consistent" if consistent else "INCONSISTENT"}')
+
+    def handle(self, *args, **options):
+        # The payers run on connections of their own, so the benchmark data has to be committed.
+        customer = User.objects.create_user(
+            username='benchpayer', password='benchpass', phone_number='9876543200', name='Bench Payer')
+        admin = User.objects.create_user(
+            username='benchpayadmin', password='benchpass', phone_number='9876543201', name='Bench Admin',
+            user_level=UserLevel.ADMIN)
+        try:
+            for strategy in [LoanUpdateStrategy.LOCKING, LoanUpdateStrategy.OPTIMISTIC]:
+                self.run(strategy, customer, admin, options['threads'], options['repayments'])
+        finally:
+            loans = Loan.objects.filter(customer=customer)
+            LoanRepayment.objects.filter(loan__in=loans).delete()
+            loans.delete()
+            User.objects.filter(id__in=[customer.id, admin.id]).delete()
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from loans.helpers import build_loan_repayment_schedule
+from loans.models import Loan, LoanRepayment
+from loans.serializers import LoanDetailsSerializer, LoanRepaymentSerializer, loan_details_values, \
+    loan_repayment_values
+from userman.models import User
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/sec of the model serializers and their .values() fast paths on the list endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def run(self, label, rows, serialize):
+        started = time.perf_counter()
+        content = JsonResponse({'items': serialize()}).content
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label:40} {rows / elapsed:12.1f} rows/sec')
+        return content, elapsed
+
+    def compare(self, name, rows, slow, fast):
+        slow_content, slow_elapsed = self.run(f'{name} (ModelSerializer)', rows, slow)
+        fast_content, fast_elapsed = self.run(f'{name} (ValuesSerializer)', rows, fast)
+        assert slow_content == fast_content, f'{name}: the fast path does not produce the same JSON'
+        self.stdout.write(f'{name}: {slow_elapsed / fast_elapsed:.1f}x faster, identical output')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        with transaction.atomic():
+            customer = User.objects.create_user(
+                username='benchuser', password='benchpass', phone_number='9876543200', name='Bench User')
+            admin = User.objects.create_user(
+                username='benchadmin', password='benchpass', phone_number='9876543201', name='Bench Admin')
+            loans = [Loan(customer=customer, loan_amount=1000 + i, term=10) for i in range(rows)]
+            # Every other loan is approved, and as many repayments as loans get scheduled.
+            approved = loans[::2]
+            for loan in approved:
+                loan.set_approved(admin, timezone.now())
+            Loan.objects.bulk_create(loans)
+            LoanRepayment.objects.bulk_create(
+                repayment for loan in approved[:rows // 10] for repayment in build_loan_repayment_schedule(loan))
+
+            loan_rows = Loan.objects.filter(customer=customer).order_by('created', 'id')
+            self.compare(
+                'Loans', rows,
+                lambda: [LoanDetailsSerializer(instance=loan).data for loan in loan_rows],
+                lambda: loan_details_values.serialize(loan_rows.values(*loan_details_values.sources)),
+            )
+            repayment_rows = LoanRepayment.objects.filter(loan__customer=customer).order_by('due_date', 'id')
+            self.compare(
+                'Repayments', repayment_rows.count(),
+                lambda: [LoanRepaymentSerializer(instance=repayment).data for repayment in repayment_rows],
+                lambda: loan_repayment_values.serialize(repayment_rows.values(*loan_repayment_values.sources)),
+            )
+            # The benchmark data is not meant to stay around.
+            transaction.set_rollback(True)
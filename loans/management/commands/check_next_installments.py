@@ -0,0 +1,20 @@
+from django.core.management import BaseCommand, CommandError
+
+from loans.helpers import find_next_installment_drift
+from loans.models import Loan
+
+
+class Command(BaseCommand):
+    help = "Verify that every loan's next installment fields match its repayment schedule."
+
+    def handle(self, *args, **options):
+        drifted = 0
+        for loan, expected in find_next_installment_drift(Loan.objects.all()):
+            drifted += 1
+            self.stdout.write(
+                f'Loan {loan.id}: has ({loan.next_repayment_id}, {loan.next_due_date}, {loan.next_due_amount}), '
+                f'expected ({loan.expected_repayment_id}, {loan.expected_due_date}, {loan.expected_due_amount})'
+            )
+        if drifted:
+            raise CommandError(f'{drifted} loan(s) out of sync, run backfill_next_installments to repair them.')
+        self.stdout.write('All loans are in sync.')
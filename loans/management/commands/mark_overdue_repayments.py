@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand, CommandError
+
+from loans.helpers import mark_overdue_repayments
+
+
+class Command(BaseCommand):
+    help = ('Mark pending installments past their due date as overdue, meant to run nightly. '
+            'Resumes an interrupted run, and can be split across workers with --shard/--shards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--shards', type=int, default=1, help='Number of workers splitting the work.')
+        parser.add_argument('--shard', type=int, default=0, help='Which of the --shards this worker handles.')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint of an interrupted run.')
+
+    def handle(self, *args, **options):
+        try:
+            marked = mark_overdue_repayments(
+                shard=options['shard'], shards=options['shards'],
+                chunk_size=options['chunk_size'], restart=options['restart'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Marked {marked} installment(s) overdue in shard {options['shard']}/{options['shards']}.")
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from loans.idempotency import purge_idempotent_responses
+
+
+class Command(BaseCommand):
+    help = 'Delete the responses stored for Idempotency-Keys older than IDEMPOTENCY_KEY_TTL, meant to run hourly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        older_than = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        deleted = purge_idempotent_responses(older_than, chunk_size=options['chunk_size'])
+        self.stdout.write(f'Deleted {deleted} stored response(s) from before {older_than.isoformat()}.')
@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand, CommandError
+
+from loans.helpers import aggregate_portfolio, rebuild_portfolio_summary, refresh_overdue_buckets, \
+    summarize_portfolio
+
+
+class Command(BaseCommand):
+    help = 'Recompute the portfolio summary from the loans, repairing any drift, and refresh the overdue buckets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drift, do not repair it.')
+
+    def handle(self, *args, **options):
+        summary, expected = summarize_portfolio(), aggregate_portfolio()
+        drifted = [status for status in expected if summary[status] != expected[status]]
+        for status in drifted:
+            self.stdout.write(f'{status}: has {summary[status]}, expected {expected[status]}')
+
+        if options['check']:
+            if drifted:
+                raise CommandError(
+                    f'{len(drifted)} approval status(es) out of sync, run recompute_portfolio_summary to repair them.')
+            self.stdout.write('Portfolio summary is in sync.')
+            return
+
+        rebuild_portfolio_summary()
+        buckets = refresh_overdue_buckets()
+        self.stdout.write(
+            f'Repaired {len(drifted)} approval status(es), refreshed {len(buckets)} overdue bucket(s).')
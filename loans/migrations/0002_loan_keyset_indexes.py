@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'disbursement_date', 'id'], name='loan_customer_disbursal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['approval_status', 'created', 'id'], name='loan_status_created_idx'),
+        ),
+    ]
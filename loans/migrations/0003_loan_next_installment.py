@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_loan_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='next_due_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='next_due_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='next_repayment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='loans.loanrepayment'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('loans', '0003_loan_next_installment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loanrepayment',
+            index=models.Index(fields=['loan', 'status', 'due_date'], name='repayment_loan_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanrepayment',
+            index=models.Index(condition=models.Q(status='PENDING'), fields=['loan', 'due_date'], name='repayment_pending_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanrepayment',
+            index=models.Index(condition=models.Q(payment_request_id__isnull=False), fields=['payment_request_id'], name='repayment_payment_request_idx'),
+        ),
+        # The composite indexes above cover the FK lookups.
+        migrations.AlterField(
+            model_name='loan',
+            name='customer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='loanrepayment',
+            name='loan',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='loans.loan'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('loans', '0004_repayment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='claim_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0005_loan_review_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='final_installment',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='regular_installment',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='remaining_installments',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='schedule_mode',
+            field=models.CharField(choices=[('MATERIALIZED', 'MATERIALIZED'), ('VIRTUAL', 'VIRTUAL')], default='MATERIALIZED', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='schedule_start_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:51
+
+from django.db import migrations, models
+import utils.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0006_loan_virtual_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='accrued_interest',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='interest_accrued_through',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='interest_rate',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=5, validators=[utils.validators.validate_non_negative]),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:54
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import uuid
+
+
+def seed_portfolio_summary(apps, schema_editor):
+    # Start off from the current totals, they are maintained incrementally from here on.
+    Loan = apps.get_model('loans', 'Loan')
+    PortfolioSummary = apps.get_model('loans', 'PortfolioSummary')
+    totals = {
+        row['approval_status']: row
+        for row in Loan.objects.order_by().values('approval_status').annotate(
+            loans=Count('id'), closed_loans=Count('id', filter=Q(closure_date__isnull=False)),
+            amount_due=Sum('amount_due'))
+    }
+    PortfolioSummary.objects.bulk_create([
+        PortfolioSummary(approval_status=status, slot=slot)
+        if slot or status not in totals else
+        PortfolioSummary(
+            approval_status=status, slot=slot, loan_count=totals[status]['loans'],
+            closed_count=totals[status]['closed_loans'], amount_due=totals[status]['amount_due'],
+        )
+        for status in ('PENDING', 'APPROVED', 'REJECTED')
+        for slot in range(settings.PORTFOLIO_SUMMARY_SLOTS)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0007_loan_interest_accrual'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueBucket',
+            fields=[
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('first_day', models.PositiveIntegerField(unique=True)),
+                ('last_day', models.PositiveIntegerField(blank=True, null=True)),
+                ('loan_count', models.IntegerField(default=0)),
+                ('amount_due', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('as_of', models.DateTimeField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PortfolioSummary',
+            fields=[
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('approval_status', models.CharField(choices=[('PENDING', 'PENDING'), ('APPROVED', 'APPROVED'), ('REJECTED', 'REJECTED')], max_length=20)),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('loan_count', models.IntegerField(default=0)),
+                ('closed_count', models.IntegerField(default=0)),
+                ('amount_due', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='portfoliosummary',
+            constraint=models.UniqueConstraint(fields=('approval_status', 'slot'), name='portfolio_summary_status_slot'),
+        ),
+        migrations.RunPython(seed_portfolio_summary, migrations.RunPython.noop),
+    ]
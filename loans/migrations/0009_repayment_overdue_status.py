@@ -0,0 +1,49 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:56
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0008_portfolio_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueScanCheckpoint',
+            fields=[
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('shards', models.PositiveSmallIntegerField()),
+                ('as_of', models.DateTimeField()),
+                ('last_due_date', models.DateTimeField(blank=True, null=True)),
+                ('last_id', models.UUIDField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='loanrepayment',
+            name='repayment_pending_due_idx',
+        ),
+        migrations.AlterField(
+            model_name='loanrepayment',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'PENDING'), ('PAID', 'PAID'), ('CANCELLED', 'CANCELLED'), ('PREPAID', 'PREPAID'), ('OVERDUE', 'OVERDUE')], default='PENDING', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='loanrepayment',
+            index=models.Index(condition=models.Q(status__in=['PENDING', 'OVERDUE']), fields=['loan', 'due_date'], name='repayment_outstanding_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanrepayment',
+            index=models.Index(condition=models.Q(status='PENDING'), fields=['due_date', 'id'], name='repayment_pending_by_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='overduescancheckpoint',
+            constraint=models.UniqueConstraint(fields=('shard', 'shards'), name='overdue_scan_checkpoint_shard'),
+        ),
+    ]
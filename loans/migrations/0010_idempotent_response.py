@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0009_repayment_overdue_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotentResponse',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('request_digest', models.CharField(max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(null=True)),
+                ('content', models.BinaryField(default=b'')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
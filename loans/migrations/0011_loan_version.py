@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0010_idempotent_response'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
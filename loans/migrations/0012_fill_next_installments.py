@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import Exists, F, OuterRef, Subquery
+
+
+def fill_next_installments(apps, schema_editor):
+    # Loans approved before 0003 have no next installment yet, point it at their earliest outstanding repayment.
+    Loan = apps.get_model('loans', 'Loan')
+    LoanRepayment = apps.get_model('loans', 'LoanRepayment')
+    outstanding = LoanRepayment.objects.filter(
+        loan=OuterRef('pk'), status__in=['PENDING', 'OVERDUE']).order_by('due_date')
+    Loan.objects.filter(Exists(outstanding), next_repayment__isnull=True, schedule_mode='MATERIALIZED').update(
+        next_repayment=Subquery(outstanding.values('id')[:1]),
+        next_due_date=Subquery(outstanding.values('due_date')[:1]),
+        next_due_amount=Subquery(outstanding.values('amount')[:1]),
+        version=F('version') + 1,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0011_loan_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_next_installments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 22:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0012_fill_next_installments'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='loanrepayment',
+            name='repayment_pending_by_due_idx',
+        ),
+        migrations.RemoveField(
+            model_name='overduescancheckpoint',
+            name='last_due_date',
+        ),
+        migrations.AddIndex(
+            model_name='loanrepayment',
+            index=models.Index(condition=models.Q(status='PENDING'), fields=['id', 'due_date'], name='repayment_pending_by_id_idx'),
+        ),
+    ]
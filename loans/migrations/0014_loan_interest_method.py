@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 22:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0013_overdue_scan_by_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='interest_method',
+            field=models.CharField(choices=[('SIMPLE', 'SIMPLE'), ('REDUCING_BALANCE', 'REDUCING_BALANCE')], default='SIMPLE', max_length=20),
+        ),
+    ]
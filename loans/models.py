@@ -1,9 +1,15 @@
+import random
 from datetime import datetime
-from typing import Optional
+from decimal import Decimal
+from typing import List, Optional
 
-from django.db import models, transaction
-from reversion import revisions as reversion
+from django.conf import settings
+from django.db import DatabaseError, models, transaction
+from django.db.models import F
+from django.utils import timezone
 
+from audit import trail as audit_trail
+from loans.schedule import from_minor_units, installment_due_date, installment_split, to_minor_units
 from userman.models import User
 from utils.models import BaseUUIDModel, RecurrenceFrequency
 from utils.validators import validate_positive, validate_non_negative
@@ -19,8 +25,34 @@ class LoanApprovalStatus(models.TextChoices):
     REJECTED = ("REJECTED", "REJECTED")
 
 
+class LoanScheduleMode(models.TextChoices):
+    # One LoanRepayment row per installment, created on approval.
+    MATERIALIZED = ("MATERIALIZED", "MATERIALIZED")
+    # Only the schedule parameters are kept on the Loan, a LoanRepayment row is created once an installment is paid.
+    VIRTUAL = ("VIRTUAL", "VIRTUAL")
+
+
+class LoanInterestMethod(models.TextChoices):
+    # The installments repay the principal only, interest is accrued daily on the outstanding balance.
+    SIMPLE = ("SIMPLE", "SIMPLE")
+    # Equated installments (EMIs) which also pay the interest on the reducing balance, fixed on approval.
+    REDUCING_BALANCE = ("REDUCING_BALANCE", "REDUCING_BALANCE")
+
+
+class LoanUpdateStrategy(models.TextChoices):
+    # Loans are read with SELECT ... FOR UPDATE NOWAIT, a concurrent update fails the request.
+    LOCKING = ("LOCKING", "LOCKING")
+    # Loans are read without locks, and written back only if their version did not change meanwhile.
+    OPTIMISTIC = ("OPTIMISTIC", "OPTIMISTIC")
+
+
+class LoanVersionConflict(DatabaseError):
+    """The loan was changed by someone else since it was read, see `Loan.save`."""
+
+
 class Loan(BaseUUIDModel):
-    customer = models.ForeignKey(User, on_delete=models.PROTECT)
+    # Indexed through loan_customer_disbursal_idx.
+    customer = models.ForeignKey(User, on_delete=models.PROTECT, db_index=False)
     # The internal team member who approved or rejected the loan application.
     evaluated_by = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
 
@@ -42,45 +74,217 @@ class Loan(BaseUUIDModel):
     approval_status = models.CharField(
         max_length=20, choices=LoanApprovalStatus.choices, default=LoanApprovalStatus.PENDING)
 
+    # The next pending installment, copied over from the repayment schedule so that it does not
+    # have to be looked up every time. Kept in sync by the schedule helpers and `LoanRepayment.mark_paid`.
+    # All of them are null when nothing is due.
+    next_repayment = models.ForeignKey(
+        'LoanRepayment', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    next_due_date = models.DateTimeField(blank=True, null=True)
+    next_due_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
+    schedule_mode = models.CharField(
+        max_length=20, choices=LoanScheduleMode.choices, default=LoanScheduleMode.MATERIALIZED)
+    # Parameters of a VIRTUAL repayment schedule: installments are due every `repayment_frequency` days
+    # after `schedule_start_date`, and the `remaining_installments` still to be paid are all
+    # `regular_installment`, except the last one which is `final_installment`.
+    schedule_start_date = models.DateTimeField(blank=True, null=True)
+    regular_installment = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    final_installment = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    remaining_installments = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    # Annual interest rate, in percent, on the outstanding principal. For SIMPLE interest that is `amount_due`,
+    # and interest is accrued daily by the accrue_interest command, up to and including `interest_accrued_through`.
+    # REDUCING_BALANCE loans have the interest of their whole schedule in `amount_due` from approval on.
+    interest_rate = models.DecimalField(default=0, max_digits=5, decimal_places=2, validators=[validate_non_negative])
+    interest_method = models.CharField(
+        max_length=20, choices=LoanInterestMethod.choices, default=LoanInterestMethod.SIMPLE)
+    accrued_interest = models.DecimalField(default=0, max_digits=12, decimal_places=2)
+    interest_accrued_through = models.DateField(blank=True, null=True)
+
+    # Lease on a pending loan handed out to a reviewer by the claim queue, see `loans.helpers.claim_pending_loans`.
+    # It is up for grabs again once the lease expires.
+    claimed_by = models.ForeignKey(
+        User, on_delete=models.PROTECT, null=True, blank=True, related_name='+', db_index=False)
+    claim_expires_at = models.DateTimeField(blank=True, null=True)
+
+    # Bumped by every write to the row, for optimistic concurrency control. Writes bypassing `save`
+    # (bulk_update, update) have to bump it themselves, with F('version') + 1.
+    version = models.PositiveIntegerField(default=0)
+
+    # {attname: value} the expressions assigned to fields evaluate to, see `update_amount_due`.
+    _expression_outcomes = {}
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of get_user_loans and get_pending_loans.
+            models.Index(fields=['customer', 'disbursement_date', 'id'], name='loan_customer_disbursal_idx'),
+            models.Index(fields=['approval_status', 'created', 'id'], name='loan_status_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return self._save_version(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            PortfolioSummary.record_change(self.approval_status, loans=1, amount_due=self.amount_due)
+
+    def _save_version(self, *args, update_fields=None, **kwargs):
+        """
+        Writes the next version of the loan, with an UPDATE ... WHERE version = <the version read>.
+        Raises LoanVersionConflict when the row has been written since, see `loans.helpers.run_with_retries`.
+        """
+        read_version = self.version
+        self.version = read_version + 1
+        if update_fields is not None:
+            update_fields = list(update_fields) + ['version']
+        try:
+            super().save(*args, update_fields=update_fields, **kwargs)
+        except LoanVersionConflict:
+            self.version = read_version
+            raise
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # A concurrent writer holding the row makes this wait for it, and then match no row.
+        if not super()._do_update(base_qs.filter(version=self.version - 1), using, pk_val, values,
+                                  update_fields, forced_update):
+            raise LoanVersionConflict(f'Loan {pk_val} has been changed since version {self.version - 1}.')
+        # Expressions were applied to the very version of the row this instance holds, so their outcome
+        # is known without reading the row back. Set before any post_save receiver gets to look.
+        self.__dict__.update(self._expression_outcomes)
+        return True
+
     def has_been_paid_back(self) -> bool:
         if self.amount_due == 0:
             return True
         return False
 
-    @transaction.atomic()
-    def approve(self, approved_by):
+    def is_claimed_by_other(self, reviewer) -> bool:
+        return (self.claimed_by_id is not None and self.claimed_by_id != reviewer.id
+                and self.claim_expires_at > timezone.now())
+
+    def set_approved(self, approved_by, evaluation_date):
         self.evaluated_by = approved_by
         self.approval_status = LoanApprovalStatus.APPROVED
-        self.evaluation_date = datetime.now()
+        self.evaluation_date = evaluation_date
         self.amount_due = self.loan_amount
         # For now, keeping the disbursal and approval_date same.
         self.disbursement_date = self.evaluation_date
+        self.schedule_mode = settings.LOAN_SCHEDULE_MODE
+        self.interest_method = settings.LOAN_INTEREST_METHOD
+
+    def set_rejected(self, rejected_by, evaluation_date):
+        self.evaluated_by = rejected_by
+        self.approval_status = LoanApprovalStatus.REJECTED
+        self.evaluation_date = evaluation_date
+
+    @transaction.atomic()
+    def approve(self, approved_by):
+        from loans.helpers import create_loan_repayment_schedule, schedule_installments
+        self.set_approved(approved_by, datetime.now())
+        installments, = schedule_installments([self])
         self.save(update_fields=
-                  ["approval_status", "evaluated_by", "evaluation_date", "disbursement_date", "modified", "amount_due"]
+                  ["approval_status", "evaluated_by", "evaluation_date", "disbursement_date", "modified", "amount_due",
+                   "schedule_mode", "interest_method"]
                   )
-        from loans.helpers import create_loan_repayment_schedule
-        create_loan_repayment_schedule(loan=self)
+        create_loan_repayment_schedule(loan=self, installments=installments)
+        PortfolioSummary.record_change(LoanApprovalStatus.PENDING, loans=-1)
+        PortfolioSummary.record_change(LoanApprovalStatus.APPROVED, loans=1, amount_due=self.amount_due)
 
+    @transaction.atomic()
     def reject(self, rejected_by):
-        self.evaluated_by = rejected_by
-        self.approval_status = LoanApprovalStatus.REJECTED
-        self.evaluation_date = datetime.now()
+        self.set_rejected(rejected_by, datetime.now())
         self.save(update_fields=["approval_status", "evaluated_by", "evaluation_date", "modified"])
+        PortfolioSummary.record_change(LoanApprovalStatus.PENDING, loans=-1)
+        PortfolioSummary.record_change(LoanApprovalStatus.REJECTED, loans=1)
 
     @property
     def upcoming_repayment(self) -> Optional['LoanRepayment']:
         if self.has_been_paid_back():
             return None
-        return self.loanrepayment_set.filter(status=LoanRepaymentStatus.PENDING).order_by('due_date').first()
+        if self.has_virtual_schedule:
+            if self.next_due_date is None:
+                return None
+            return LoanRepayment(id=None, loan=self, amount=self.next_due_amount, due_date=self.next_due_date)
+        if self.next_repayment_id is None:
+            return None
+        repayment = self.next_repayment
+        # Make sure updates made through the repayment land on this very instance.
+        repayment.loan = self
+        return repayment
 
-    def update_amount_due(self, paid_amount):
-        self.amount_due = self.amount_due - paid_amount
-        if self.has_been_paid_back():
+    def pending_repayments(self) -> models.QuerySet:
+        return self.loanrepayment_set.filter(status__in=OUTSTANDING_REPAYMENT_STATUSES).order_by('due_date')
+
+    @property
+    def has_virtual_schedule(self) -> bool:
+        return self.schedule_mode == LoanScheduleMode.VIRTUAL
+
+    def set_virtual_installments(self, amount_due: Decimal, count: int):
+        """Spreads `amount_due` over the `count` remaining installments of a virtual schedule."""
+        # The final installment adjusts for an amount indivisible by the remaining installments.
+        regular, final = installment_split(to_minor_units(amount_due), count)
+        self.regular_installment = from_minor_units(regular)
+        self.final_installment = from_minor_units(final)
+        self.remaining_installments = count
+
+    def _virtual_installment(self, number: int) -> 'LoanRepayment':
+        return LoanRepayment(
+            id=None, loan=self,
+            amount=self.final_installment if number == self.term else self.regular_installment,
+            due_date=installment_due_date(self.schedule_start_date, self.repayment_frequency, number),
+        )
+
+    def virtual_installments(self) -> List['LoanRepayment']:
+        """The installments still to be paid on a virtual schedule, as unsaved LoanRepayments."""
+        paid = self.term - self.remaining_installments
+        return [self._virtual_installment(number) for number in range(paid + 1, self.term + 1)]
+
+    def next_virtual_installment(self) -> Optional['LoanRepayment']:
+        if not self.remaining_installments:
+            return None
+        return self._virtual_installment(self.term - self.remaining_installments + 1)
+
+    def refresh_next_installment(self):
+        """Points the next installment fields at the earliest installment still to be paid."""
+        if self.has_virtual_schedule:
+            self.set_next_installment(self.next_virtual_installment())
+        else:
+            self.set_next_installment(self.pending_repayments().first())
+
+    def set_next_installment(self, repayment: Optional['LoanRepayment']):
+        # Installments of a virtual schedule have no row (nor id) until they are paid.
+        self.next_repayment = repayment if repayment is not None and repayment.pk is not None else None
+        self.next_due_date = repayment.due_date if repayment else None
+        self.next_due_amount = repayment.amount if repayment else None
+
+    def update_amount_due(self, paid_amount, update_fields=()):
+        """
+        Takes `paid_amount` off the balance, with an atomic amount_due = amount_due - paid_amount.
+        Only the balance (and closure_date, once paid back) is written, along with the
+        `update_fields` the caller changed.
+        """
+        read_amount_due = self.amount_due
+        update_fields = ['amount_due', 'modified', *update_fields]
+        if read_amount_due - paid_amount == 0:
             self.closure_date = datetime.now()
-        self.save()
+            update_fields.append('closure_date')
+        self.amount_due = F('amount_due') - paid_amount
+        self._expression_outcomes = {'amount_due': read_amount_due - paid_amount}
+        try:
+            self.save(update_fields=update_fields)
+        except Exception:
+            self.amount_due = read_amount_due
+            raise
+        finally:
+            self._expression_outcomes = {}
+        PortfolioSummary.record_change(
+            self.approval_status, closed=1 if self.has_been_paid_back() else 0, amount_due=-paid_amount)
+
 
+audit_trail.register(Loan)
 
-reversion.register(Loan)
+NEXT_INSTALLMENT_FIELDS = ["next_repayment", "next_due_date", "next_due_amount"]
+VIRTUAL_SCHEDULE_FIELDS = ["schedule_start_date", "regular_installment", "final_installment", "remaining_installments"]
 
 
 class LoanRepaymentStatus(models.TextChoices):
@@ -88,10 +292,17 @@ class LoanRepaymentStatus(models.TextChoices):
     PAID = ("PAID", "PAID")
     CANCELLED = ("CANCELLED", "CANCELLED")
     PREPAID = ("PREPAID", "PREPAID")
+    # Still to be paid, but past its due date. Set by the mark_overdue_repayments command.
+    OVERDUE = ("OVERDUE", "OVERDUE")
+
+
+# Installments which are still to be paid.
+OUTSTANDING_REPAYMENT_STATUSES = [LoanRepaymentStatus.PENDING, LoanRepaymentStatus.OVERDUE]
 
 
 class LoanRepayment(BaseUUIDModel):
-    loan = models.ForeignKey(Loan, on_delete=models.PROTECT)
+    # Indexed through repayment_loan_status_due_idx.
+    loan = models.ForeignKey(Loan, on_delete=models.PROTECT, db_index=False)
     amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[validate_non_negative])
 
     due_date = models.DateTimeField(blank=True, null=True)      # When is the repayment due?
@@ -106,14 +317,129 @@ class LoanRepayment(BaseUUIDModel):
     # For simplicity, keeping this a char field and not Foreign Key.
     payment_request_id = models.CharField(max_length=40, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['loan', 'status', 'due_date'], name='repayment_loan_status_due_idx'),
+            # Next installment lookups only ever look at the outstanding ones.
+            models.Index(fields=['loan', 'due_date'], name='repayment_outstanding_due_idx',
+                         condition=models.Q(status__in=['PENDING', 'OVERDUE'])),
+            # Keyset order of the mark_overdue_repayments scan. Led by id, so that every shard seeks
+            # straight to its own slice of the keyspace.
+            models.Index(fields=['id', 'due_date'], name='repayment_pending_by_id_idx',
+                         condition=models.Q(status='PENDING')),
+            models.Index(fields=['payment_request_id'], name='repayment_payment_request_idx',
+                         condition=models.Q(payment_request_id__isnull=False)),
+        ]
+
     @transaction.atomic()
     def mark_paid(self, with_amount=None):
         self.repayment_date = datetime.now()
         self.status = LoanRepaymentStatus.PAID
         if with_amount:
             self.amount = with_amount
-        self.save()
-        self.loan.update_amount_due(self.amount)
+        if self._state.adding:
+            # The row of an installment from a virtual schedule is only inserted once it is paid.
+            self.save()
+        else:
+            self.save(update_fields=['repayment_date', 'status', 'amount', 'modified'])
+        changed_loan_fields = NEXT_INSTALLMENT_FIELDS
+        if self.loan.has_virtual_schedule:
+            self.loan.remaining_installments -= 1
+            changed_loan_fields = NEXT_INSTALLMENT_FIELDS + ['remaining_installments']
+        self.loan.refresh_next_installment()
+        self.loan.update_amount_due(self.amount, update_fields=changed_loan_fields)
+
+
+audit_trail.register(LoanRepayment)
+
+
+class PortfolioSummary(BaseUUIDModel):
+    """
+    Running totals of the loans in each approval status, kept up to date by every change to a loan
+    so that reading them never has to aggregate over the Loan table.
+
+    The totals of a status are spread over PORTFOLIO_SUMMARY_SLOTS rows and every change lands on a
+    random one of them. Concurrent repayments thus rarely wait on the same row lock, and reading a
+    total still only sums a fixed handful of rows. The recompute_portfolio_summary command
+    verifies the totals against the Loan table and repairs any drift.
+    """
+    approval_status = models.CharField(max_length=20, choices=LoanApprovalStatus.choices)
+    slot = models.PositiveSmallIntegerField()
+
+    loan_count = models.IntegerField(default=0)
+    closed_count = models.IntegerField(default=0)   # Loans which have been paid back.
+    amount_due = models.DecimalField(default=0, max_digits=16, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['approval_status', 'slot'], name='portfolio_summary_status_slot'),
+        ]
+
+    @classmethod
+    def record_change(cls, approval_status, loans=0, closed=0, amount_due=0):
+        slot = random.randrange(settings.PORTFOLIO_SUMMARY_SLOTS)
+        changes = {
+            'loan_count': F('loan_count') + loans,
+            'closed_count': F('closed_count') + closed,
+            'amount_due': F('amount_due') + amount_due,
+        }
+        if not cls.objects.filter(approval_status=approval_status, slot=slot).update(**changes):
+            # Slots are only created on first use, PORTFOLIO_SUMMARY_SLOTS may have been raised.
+            cls.objects.get_or_create(approval_status=approval_status, slot=slot)
+            cls.objects.filter(approval_status=approval_status, slot=slot).update(**changes)
+
+
+# Days past the next installment's due date, (first day, last day) of each bucket. None is open ended.
+OVERDUE_BUCKETS = [(1, 30), (31, 60), (61, 90), (91, None)]
+
+
+class OverdueBucket(BaseUUIDModel):
+    """
+    Approved open loans by how many days their next installment is past due, as of `as_of`.
+
+    Unlike PortfolioSummary this moves with the clock rather than with changes to loans, so it is
+    refreshed by the recompute_portfolio_summary command.
+    """
+    first_day = models.PositiveIntegerField(unique=True)
+    last_day = models.PositiveIntegerField(null=True, blank=True)
+
+    loan_count = models.IntegerField(default=0)
+    amount_due = models.DecimalField(default=0, max_digits=16, decimal_places=2)
+    as_of = models.DateTimeField()
+
+
+class OverdueScanCheckpoint(BaseUUIDModel):
+    """
+    Progress of a mark_overdue_repayments run over one shard of the repayment keyspace.
+
+    `last_id` is the id of the last installment handled, so an interrupted run picks up right
+    after it, with the same `as_of`. Once the shard is done
+    `completed_at` is set, and the next run starts over with a new `as_of`.
+    """
+    shard = models.PositiveSmallIntegerField()
+    shards = models.PositiveSmallIntegerField()
+
+    as_of = models.DateTimeField()  # Installments due before this get marked overdue.
+    last_id = models.UUIDField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shard', 'shards'], name='overdue_scan_checkpoint_shard'),
+        ]
 
 
-reversion.register(LoanRepayment)
+class IdempotentResponse(models.Model):
+    """
+    The response to a request sent with an Idempotency-Key header, replayed to its retries by
+    `loans.idempotency.idempotent`. Rows are deleted by the purge_idempotency_keys command once
+    older than IDEMPOTENCY_KEY_TTL, so they are kept to a minimum: no surrogate id, no modified.
+    """
+    # sha256 of the (user, view, Idempotency-Key) the response belongs to.
+    key = models.CharField(max_length=64, primary_key=True)
+    # sha256 of the request data, a key may not be reused for a different request.
+    request_digest = models.CharField(max_length=64)
+    # Null while the first request is still being handled.
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content = models.BinaryField(default=b'')
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -0,0 +1,53 @@
+"""
+Repayment schedule arithmetic, kept free of any database access.
+
+Money is handled in integer minor units (paise) so that splitting an amount into
+installments is exact: there is no rounding to reason about, only a remainder.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List, Tuple
+
+from utils.models import RecurrenceFrequency
+
+MINOR_UNIT_EXPONENT = 2  # 1 INR = 100 paise
+
+
+def to_minor_units(amount: Decimal) -> int:
+    minor_units = Decimal(amount).scaleb(MINOR_UNIT_EXPONENT)
+    if minor_units != minor_units.to_integral_value():
+        raise ValueError(f'{amount} can not be expressed in minor units.')
+    return int(minor_units)
+
+
+def from_minor_units(amount: int) -> Decimal:
+    return Decimal(amount).scaleb(-MINOR_UNIT_EXPONENT)
+
+
+def split_installments(total: int, count: int) -> List[int]:
+    """
+    Splits `total` into `count` installments. All of them are `total // count`, except
+    the last one which also carries the remainder.
+    """
+    regular, final = installment_split(total, count)
+    return [regular] * (count - 1) + [final]
+
+
+def installment_split(total: int, count: int) -> Tuple[int, int]:
+    """The (regular, final) installment amounts of `split_installments`, without building the list."""
+    if count <= 0:
+        raise ValueError('Need at least one installment.')
+    installment = total // count
+    return installment, total - installment * (count - 1)
+
+
+def installment_due_dates(start: datetime, frequency: int, count: int) -> List[datetime]:
+    """Due dates of `count` installments, the first one a full period after `start`."""
+    return [installment_due_date(start, frequency, number) for number in range(1, count + 1)]
+
+
+def installment_due_date(start: datetime, frequency: int, number: int) -> datetime:
+    """Due date of the `number`th (1-based) installment."""
+    if frequency not in RecurrenceFrequency.values:
+        raise ValueError("Invalid recurrence frequency")
+    return start + timedelta(days=frequency) * number
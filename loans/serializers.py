@@ -1,13 +1,24 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from loans.models import Loan, LoanRepayment, LoanApprovalStatus
+from loans.models import Loan, LoanRepayment, LoanApprovalStatus, OverdueBucket
+from utils.serializers import ValuesSerializer
+
+
+def validate_evaluator(evaluator_id, loan: Loan):
+    # Some application level checks for the evaluator.
+    # Like we do not want the evaluator to approve their own loans.
+    if evaluator_id == loan.customer_id:
+        raise ValidationError('User not permitted to approve this loan')
 
 
 class LoanCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Loan
-        fields = ["customer", "loan_amount", "term"]
+        # interest_rate is optional, loans are interest free unless asked otherwise.
+        fields = ["customer", "loan_amount", "term", "interest_rate"]
 
 
 class LoanEvaluationSerializer(serializers.ModelSerializer):
@@ -18,10 +29,20 @@ class LoanEvaluationSerializer(serializers.ModelSerializer):
         fields = ["evaluated_by", "evaluation_date", "approval_status"]
 
     def validate_evaluated_by(self, evaluated_by):
-        # Some application level checks for the evaluator.
-        # Like we do not want the evaluator to approve their own loans.
-        if evaluated_by.id == self.instance.customer.id:
-            raise ValidationError('User not permitted to approve this loan')
+        validate_evaluator(evaluated_by.id, self.instance)
+        return evaluated_by
+
+
+class BulkEvaluationSerializer(serializers.Serializer):
+    loan_id = serializers.UUIDField()
+    approval_status = serializers.ChoiceField(
+        choices=[LoanApprovalStatus.APPROVED, LoanApprovalStatus.REJECTED])
+
+
+class BulkRepaymentSerializer(serializers.Serializer):
+    loan_id = serializers.UUIDField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    payment_request_id = serializers.CharField(max_length=40)
 
 
 class LoanDetailsSerializer(serializers.ModelSerializer):
@@ -30,7 +51,8 @@ class LoanDetailsSerializer(serializers.ModelSerializer):
         model = Loan
         fields = [
             "id", "loan_amount", "amount_due", "disbursement_date",
-            "closure_date", "term", "repayment_frequency", "approval_status"
+            "closure_date", "term", "repayment_frequency", "approval_status",
+            "interest_rate", "accrued_interest", "interest_accrued_through",
         ]
 
 
@@ -38,3 +60,14 @@ class LoanRepaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = LoanRepayment
         fields = '__all__'
+
+
+# Fast paths of the above for the list endpoints, serializing `.values()` rows to the very same output.
+loan_details_values = ValuesSerializer(LoanDetailsSerializer)
+loan_repayment_values = ValuesSerializer(LoanRepaymentSerializer)
+
+
+class OverdueBucketSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OverdueBucket
+        fields = ["first_day", "last_day", "loan_count", "amount_due", "as_of"]
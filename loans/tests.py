@@ -1,12 +1,45 @@
 import base64
-from decimal import Decimal
+import csv
+import json
+import re
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal, ROUND_DOWN
+from importlib import import_module
+from io import StringIO
+from random import Random
+from unittest import skipUnless
+from uuid import UUID
 
-from django.test import TestCase
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import JsonResponse
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from loans.models import Loan, LoanApprovalStatus, LoanRepayment, LoanRepaymentStatus
+from loans.amortization import accrued_interest, amortize, emi
+from loans.cache import RESPONSE_CACHE
+from loans.helpers import apply_bulk_repayments, build_loan_repayment_schedule, create_loan_repayment_schedule, \
+    evaluate_loans, mark_overdue_repayments, shard_id_range
+from loans.models import IdempotentResponse, Loan, LoanApprovalStatus, LoanInterestMethod, LoanRepayment, \
+    LoanRepaymentStatus, LoanScheduleMode, LoanUpdateStrategy, LoanVersionConflict, OverdueScanCheckpoint
+from loans.schedule import from_minor_units, installment_due_dates, split_installments, to_minor_units
+from loans.serializers import LoanDetailsSerializer, LoanRepaymentSerializer, loan_details_values, \
+    loan_repayment_values
+from userman.authentication import CREDENTIALS_CACHE, issue_access_token
 from userman.models import User, UserLevel
+from utils.cache import get_or_build
 from utils.models import RecurrenceFrequency
+from utils.routers import get_replica, is_pinned_to_primary, pin_to_primary
 
 
 def get_basic_auth_header(user, password):
@@ -42,6 +75,18 @@ def repay_loan_payload(loan_id=None, amount=20):
     }
 
 
+class CustomerAdminMixin:
+    """Sets up customer1 and admin1, the users most of the tests act as."""
+
+    def setUp(self):
+        super().setUp()
+        self.customer = User.objects.create_user(
+            username='customer1', password='customer1pass', phone_number='9876543211', name='Bruce Wayne')
+        self.admin = User.objects.create_user(
+            username='admin1', password='admin1pass', phone_number='8876543212', name='Shark',
+            user_level=UserLevel.ADMIN)
+
+
 class LoanFlowsTests(TestCase):
     def create_user(self, username, password, name, phone_number) -> User:
         self.client.post(
@@ -157,7 +202,10 @@ class LoanFlowsTests(TestCase):
             'id': str(loan.id),
             'loan_amount': '100.00',
             'repayment_frequency': 7,
-            'term': 5
+            'term': 5,
+            'interest_rate': '0.00',
+            'accrued_interest': '0.00',
+            'interest_accrued_through': None,
         }
         self.assertEquals(response.status_code, 200)
         self.assertEquals(response.json(), expected_response)
@@ -348,3 +396,1422 @@ class LoanFlowsTests(TestCase):
             )
         self.assertEquals(response.status_code, 400)
         self.assertEquals(response.json(), {'message': 'Trying to pay for an already closed loan.'})
+
+    def assertNextInstallment(self, loan):
+        loan.refresh_from_db()
+        expected = loan.pending_repayments().first()
+        self.assertEquals(loan.next_repayment, expected)
+        self.assertEquals(loan.next_due_date, expected.due_date if expected else None)
+        self.assertEquals(loan.next_due_amount, expected.amount if expected else None)
+
+    def test_next_installment_follows_schedule(self):
+        self.test_admin_approve_loan()
+        loan = Loan.objects.get()
+        self.assertNextInstallment(loan)
+        self.assertEquals(str(loan.next_due_amount), '20.00')
+
+        auth_headers = get_basic_auth_header("customer1", "customer1pass")
+        self.client.post(
+            path=reverse('make_repayment'),
+            data=repay_loan_payload(loan_id=loan.id, amount=35),
+            **auth_headers
+        )
+        self.assertNextInstallment(loan)
+        self.assertEquals(str(loan.next_due_amount), '16.25')
+
+        for i in range(0, 4):
+            self.client.post(
+                path=reverse('make_repayment'),
+                data=repay_loan_payload(loan_id=loan.id, amount=loan.next_due_amount),
+                **auth_headers
+            )
+            self.assertNextInstallment(loan)
+        self.assertIsNone(loan.next_repayment)
+        self.assertEquals(loan.amount_due, 0)
+
+    def test_backfill_and_check(self):
+        self.test_admin_approve_loan()
+        Loan.objects.update(next_repayment=None, next_due_date=None, next_due_amount=None)
+        with self.assertRaises(CommandError):
+            call_command('check_next_installments', stdout=StringIO())
+
+        call_command('backfill_next_installments', stdout=StringIO())
+        call_command('check_next_installments', stdout=StringIO())
+        for loan in Loan.objects.all():
+            self.assertNextInstallment(loan)
+
+    def test_migration_fills_next_installments(self):
+        self.test_admin_approve_loan()
+        Loan.objects.update(next_repayment=None, next_due_date=None, next_due_amount=None)
+        import_module('loans.migrations.0012_fill_next_installments').fill_next_installments(apps, None)
+        call_command('check_next_installments', stdout=StringIO())
+        loan = Loan.objects.get()
+        self.assertNextInstallment(loan)
+
+        response = self.client.post(
+            path=reverse('make_repayment'),
+            data=repay_loan_payload(loan_id=loan.id, amount=20),
+            **get_basic_auth_header("customer1", "customer1pass")
+        )
+        self.assertEquals(response.status_code, 200)
+
+
+class LoanListPaginationTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        disbursed_at = timezone.now()
+        for i in range(7):
+            # Two loans per disbursement date to exercise the id tie breaker, and a couple of pending ones.
+            Loan.objects.create(
+                customer=self.customer, loan_amount=100, term=5,
+                disbursement_date=disbursed_at + timedelta(days=i // 2) if i < 5 else None,
+            )
+
+    def fetch_all(self, url_name, result_key, auth_headers, page_size):
+        pages = []
+        response = self.client.get(path=reverse(url_name), data={'page_size': page_size}, **auth_headers)
+        while True:
+            self.assertEquals(response.status_code, 200)
+            pages.append(response.json())
+            if not response.json()['next']:
+                break
+            response = self.client.get(
+                path=reverse(url_name), data={'page_size': page_size, 'cursor': response.json()['next']},
+                **auth_headers)
+        return pages, [loan['id'] for page in pages for loan in page[result_key]]
+
+    def test_user_loans_pages(self):
+        auth_headers = get_basic_auth_header("customer1", "customer1pass")
+        pages, loan_ids = self.fetch_all('get_user_loans', 'loans', auth_headers, page_size=3)
+        self.assertEquals([len(page['loans']) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0]['previous'])
+
+        expected = sorted(Loan.objects.filter(disbursement_date__isnull=False),
+                          key=lambda loan: (loan.disbursement_date, str(loan.id)))
+        expected += sorted(Loan.objects.filter(disbursement_date__isnull=True), key=lambda loan: str(loan.id))
+        self.assertEquals(loan_ids, [str(loan.id) for loan in expected])
+
+        # Walking back from the last page returns the same pages.
+        response = self.client.get(
+            path=reverse('get_user_loans'), data={'page_size': 3, 'cursor': pages[2]['previous']}, **auth_headers)
+        self.assertEquals(response.json()['loans'], pages[1]['loans'])
+        response = self.client.get(
+            path=reverse('get_user_loans'), data={'page_size': 3, 'cursor': response.json()['previous']},
+            **auth_headers)
+        self.assertEquals(response.json()['loans'], pages[0]['loans'])
+        self.assertIsNone(response.json()['previous'])
+
+    def test_pending_loans_pages(self):
+        Loan.objects.filter(disbursement_date__isnull=False).update(approval_status=LoanApprovalStatus.APPROVED)
+        auth_headers = get_basic_auth_header("admin1", "admin1pass")
+        pages, loan_ids = self.fetch_all('get_pending_loans', 'pending_loans', auth_headers, page_size=1)
+        expected = Loan.objects.filter(approval_status=LoanApprovalStatus.PENDING).order_by('created', 'id')
+        self.assertEquals(loan_ids, [str(loan.id) for loan in expected])
+
+    def test_invalid_page_parameters(self):
+        auth_headers = get_basic_auth_header("customer1", "customer1pass")
+        response = self.client.get(path=reverse('get_user_loans'), data={'cursor': 'garbage'}, **auth_headers)
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.json(), {'message': 'Invalid cursor.'})
+
+        response = self.client.get(path=reverse('get_user_loans'), data={'page_size': 0}, **auth_headers)
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.json(), {'message': 'page_size should be a positive integer.'})
+
+
+class LoanQueryPlanTests(CustomerAdminMixin, TestCase):
+    """
+    Guards the query plans and query counts of every sync loan endpoint.
+
+    Fails when one of them starts scanning a whole loans table or runs more queries than
+    before. On Postgres sequential scans are disabled for the EXPLAIN, so a `Seq Scan` in
+    the plan means no index can serve the query at all. The async endpoints run the queries
+    of their sync counterparts on worker threads' connections, out of reach of these counts.
+    """
+    # Loan tables whose full scans are not acceptable.
+    GUARDED_TABLES = ('loans_loan', 'loans_loanrepayment')
+
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+            if i % 2:
+                loan.approve(approved_by=self.admin)
+        self.loan = Loan.objects.filter(approval_status=LoanApprovalStatus.APPROVED).first()
+        self.pending_loan = Loan.objects.filter(approval_status=LoanApprovalStatus.PENDING).first()
+        self.customer_auth = get_basic_auth_header('customer1', 'customer1pass')
+        self.admin_auth = get_basic_auth_header('admin1', 'admin1pass')
+        # Keep the (cached) authentication out of the counts.
+        self.client.get(path=reverse('get_user_details'), **self.customer_auth)
+        self.client.get(path=reverse('get_user_details'), **self.admin_auth)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                return [row[0] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def full_scans(self, plan):
+        for line in plan:
+            for table in self.GUARDED_TABLES:
+                if connection.vendor == 'postgresql' and f'Seq Scan on {table} ' in f'{line} ':
+                    yield line
+                # SQLite reports index lookups as SEARCH, a SCAN (even USING INDEX) reads the whole thing.
+                elif connection.vendor == 'sqlite' and line.startswith(f'SCAN {table}'):
+                    yield line
+
+    def assertQueryPlans(self, num_queries, request, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = request(*args, **kwargs)
+            if response.streaming:
+                # Streamed rows are only read while the content is consumed.
+                content = b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 300, content if response.streaming else response.content)
+        self.assertEquals(len(context.captured_queries), num_queries,
+                          '\n'.join(query['sql'] for query in context.captured_queries))
+        self.assertNoFullScans(context.captured_queries)
+        return response
+
+    def assertNoFullScans(self, captured_queries):
+        for query in captured_queries:
+            if not query['sql'].startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            plan = self.explain(query['sql'])
+            self.assertEquals(list(self.full_scans(plan)), [], f"{query['sql']}\n" + '\n'.join(plan))
+
+    def test_create_loan_request(self):
+        self.assertQueryPlans(
+            5, self.client.post, path=reverse('create_loan_request'), data=create_loan_payload(),
+            **self.customer_auth)
+
+    def test_make_repayment(self):
+        self.assertQueryPlans(
+            15, self.client.post, path=reverse('make_repayment'),
+            data=repay_loan_payload(loan_id=self.loan.id, amount=30), **self.customer_auth)
+
+    def test_get_user_loans(self):
+        self.assertQueryPlans(1, self.client.get, path=reverse('get_user_loans'), **self.customer_auth)
+
+    def test_get_loan_details(self):
+        self.assertQueryPlans(
+            1, self.client.get, path=reverse('get_loan_details', args=[self.loan.id]), **self.customer_auth)
+
+    def test_get_repayment_schedule(self):
+        self.assertQueryPlans(
+            2, self.client.get, path=reverse('get_repayment_schedule', args=[self.loan.id]), **self.customer_auth)
+
+    def test_export_user_loans(self):
+        self.assertQueryPlans(2, self.client.get, path=reverse('export_user_loans'), **self.customer_auth)
+
+    def test_get_pending_loans(self):
+        self.assertQueryPlans(1, self.client.get, path=reverse('get_pending_loans'), **self.admin_auth)
+
+    def test_make_bulk_repayment(self):
+        records = [{'loan_id': str(self.loan.id), 'amount': '20', 'payment_request_id': 'pr1'}]
+        self.assertQueryPlans(
+            8, self.client.post, path=reverse('make_bulk_repayment'), data=json.dumps(records),
+            content_type='application/json', **self.admin_auth)
+
+    def test_submit_bulk_loan_evaluation(self):
+        evaluations = [{'loan_id': str(self.pending_loan.id), 'approval_status': LoanApprovalStatus.APPROVED}]
+        self.assertQueryPlans(
+            7, self.client.post, path=reverse('submit_bulk_loan_evaluation'), data=json.dumps(evaluations),
+            content_type='application/json', **self.admin_auth)
+
+    def test_claim_loans_for_review(self):
+        self.assertQueryPlans(
+            4, self.client.post, path=reverse('claim_loans_for_review'), data={'count': 2}, **self.admin_auth)
+
+    def test_mark_overdue_repayments(self):
+        LoanRepayment.objects.update(due_date=timezone.now() - timedelta(days=1))
+        with CaptureQueriesContext(connection) as context:
+            self.assertGreater(mark_overdue_repayments(shard=1, shards=2, chunk_size=2), 0)
+        self.assertNoFullScans(context.captured_queries)
+        if connection.vendor == 'postgresql':
+            # The shard seeks to its own id range, instead of filtering everybody's installments.
+            scan = next(query['sql'] for query in context.captured_queries
+                        if query['sql'].startswith('SELECT') and 'FROM "loans_loanrepayment"' in query['sql'])
+            plan = '\n'.join(self.explain(scan))
+            self.assertIn('repayment_pending_by_id_idx', plan)
+            self.assertRegex(plan, r'Index Cond: \(\(id >')
+
+    def test_get_portfolio_summary(self):
+        self.assertQueryPlans(2, self.client.get, path=reverse('get_portfolio_summary'), **self.admin_auth)
+
+    def test_submit_loan_evaluation(self):
+        self.assertQueryPlans(
+            13, self.client.post, path=reverse('submit_loan_evaluation'),
+            data=evaluate_loan_payload(loan_id=self.pending_loan.id), **self.admin_auth)
+
+
+class BulkRepaymentTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.loan_1 = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        self.loan_1.approve(approved_by=self.admin)
+        self.loan_2 = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        self.loan_2.approve(approved_by=self.admin)
+
+    def test_bulk_repayment(self):
+        records = [
+            {'loan_id': str(self.loan_1.id), 'amount': '20', 'payment_request_id': 'pr1'},
+            {'loan_id': str(self.loan_1.id), 'amount': '35', 'payment_request_id': 'pr2'},
+            {'loan_id': str(self.loan_2.id), 'amount': '5', 'payment_request_id': 'pr3'},
+            {'loan_id': str(self.loan_2.id), 'amount': '20', 'payment_request_id': 'pr1'},
+            {'loan_id': str(self.customer.id), 'amount': '20', 'payment_request_id': 'pr4'},
+            {'loan_id': str(self.loan_2.id), 'payment_request_id': 'pr5'},
+        ]
+        response = self.client.post(
+            path=reverse('make_bulk_repayment'), data=json.dumps(records), content_type='application/json',
+            **get_basic_auth_header('admin1', 'admin1pass'))
+        self.assertEquals(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEquals([result['status'] for result in results], ['PAID', 'PAID'] + ['FAILED'] * 4)
+        self.assertEquals([result['message'] for result in results[2:]], [
+            'Minimum acceptable amount is 20.00',
+            'Repayment already recorded.',
+            'Loan Not Found',
+            {'amount': ['This field is required.']},
+        ])
+
+        # Same outcome as two make_repayment calls.
+        self.loan_1.refresh_from_db()
+        self.assertEquals(str(self.loan_1.amount_due), '45.00')
+        repayments = LoanRepayment.objects.filter(loan=self.loan_1).order_by('due_date')
+        self.assertEquals([(r.status, str(r.amount), r.payment_request_id) for r in repayments], [
+            (LoanRepaymentStatus.PAID, '20.00', 'pr1'),
+            (LoanRepaymentStatus.PAID, '35.00', 'pr2'),
+            (LoanRepaymentStatus.PENDING, '15.00', None),
+            (LoanRepaymentStatus.PENDING, '15.00', None),
+            (LoanRepaymentStatus.PENDING, '15.00', None),
+        ])
+        self.assertEquals(self.loan_1.next_repayment, repayments[2])
+        self.assertEquals(str(self.loan_1.next_due_amount), '15.00')
+
+        self.loan_2.refresh_from_db()
+        self.assertEquals(self.loan_2.amount_due, self.loan_2.loan_amount)
+
+    def test_bulk_repayment_json_lines_closes_loan(self):
+        records = '\n'.join(
+            json.dumps({'loan_id': str(self.loan_1.id), 'amount': '20', 'payment_request_id': f'pr{i}'})
+            for i in range(6)
+        )
+        response = self.client.post(
+            path=reverse('make_bulk_repayment'), data=records, content_type='application/x-ndjson',
+            **get_basic_auth_header('admin1', 'admin1pass'))
+        self.assertEquals(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEquals([result['status'] for result in results], ['PAID'] * 5 + ['FAILED'])
+        self.assertEquals(results[-1]['message'], 'Trying to pay for an already closed loan.')
+        self.loan_1.refresh_from_db()
+        self.assertEquals(self.loan_1.amount_due, 0)
+        self.assertIsNotNone(self.loan_1.closure_date)
+        self.assertIsNone(self.loan_1.next_repayment)
+
+    def test_bulk_repayment_needs_admin(self):
+        response = self.client.post(
+            path=reverse('make_bulk_repayment'), data='[]', content_type='application/json',
+            **get_basic_auth_header('customer1', 'customer1pass'))
+        self.assertEquals(response.status_code, 403)
+
+
+class BulkLoanEvaluationTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.loans = [Loan.objects.create(customer=self.customer, loan_amount=100, term=7) for _ in range(3)]
+        self.own_loan = Loan.objects.create(customer=self.admin, loan_amount=100, term=5)
+
+    def evaluate(self, evaluations):
+        return self.client.post(
+            path=reverse('submit_bulk_loan_evaluation'), data=json.dumps(evaluations),
+            content_type='application/json', **get_basic_auth_header('admin1', 'admin1pass'))
+
+    def test_bulk_evaluation(self):
+        response = self.evaluate([
+            {'loan_id': str(self.loans[0].id), 'approval_status': LoanApprovalStatus.APPROVED},
+            {'loan_id': str(self.loans[1].id), 'approval_status': LoanApprovalStatus.REJECTED},
+            {'loan_id': str(self.loans[2].id), 'approval_status': LoanApprovalStatus.APPROVED},
+            {'loan_id': str(self.loans[2].id), 'approval_status': LoanApprovalStatus.REJECTED},
+            {'loan_id': str(self.own_loan.id), 'approval_status': LoanApprovalStatus.APPROVED},
+            {'loan_id': str(self.customer.id), 'approval_status': LoanApprovalStatus.APPROVED},
+            {'loan_id': str(self.loans[0].id), 'approval_status': LoanApprovalStatus.PENDING},
+        ])
+        self.assertEquals(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEquals([result['status'] for result in results], ['DONE'] * 3 + ['FAILED'] * 4)
+        self.assertEquals([result['message'] for result in results[3:]], [
+            'Cannot approve loan if it is not pending.',
+            'User not permitted to approve this loan',
+            'Loan Not Found',
+            {'approval_status': ['"PENDING" is not a valid choice.']},
+        ])
+
+        for loan in self.loans:
+            loan.refresh_from_db()
+        self.assertEquals(
+            [loan.approval_status for loan in self.loans],
+            [LoanApprovalStatus.APPROVED, LoanApprovalStatus.REJECTED, LoanApprovalStatus.APPROVED])
+        self.own_loan.refresh_from_db()
+        self.assertEquals(self.own_loan.approval_status, LoanApprovalStatus.PENDING)
+
+        # Same schedule as a single approval.
+        for loan in (self.loans[0], self.loans[2]):
+            self.assertEquals(loan.amount_due, loan.loan_amount)
+            self.assertEquals(loan.evaluated_by, self.admin)
+            repayments = list(LoanRepayment.objects.filter(loan=loan).order_by('due_date'))
+            self.assertEquals([str(repayment.amount) for repayment in repayments], ['14.28'] * 6 + ['14.32'])
+            self.assertEquals(loan.next_repayment, repayments[0])
+        self.assertFalse(LoanRepayment.objects.filter(loan=self.loans[1]).exists())
+
+
+class LoanReviewClaimTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin2 = User.objects.create_user(
+            username='admin2', password='admin2pass', phone_number='8876543213', name='Fish',
+            user_level=UserLevel.ADMIN)
+        self.own_loan = Loan.objects.create(customer=self.admin, loan_amount=100, term=5)
+        self.loans = [Loan.objects.create(customer=self.customer, loan_amount=100, term=5) for _ in range(3)]
+
+    def claim(self, username, password, count):
+        response = self.client.post(
+            path=reverse('claim_loans_for_review'), data={'count': count}, **get_basic_auth_header(username, password))
+        self.assertEquals(response.status_code, 200)
+        return [loan['id'] for loan in response.json()['pending_loans']]
+
+    def test_reviewers_get_disjoint_loans(self):
+        self.assertEquals(self.claim('admin1', 'admin1pass', 2), [str(loan.id) for loan in self.loans[:2]])
+        # admin2 gets what is left, including admin1's own loan.
+        self.assertEquals(
+            sorted(self.claim('admin2', 'admin2pass', 5)), sorted([str(self.own_loan.id), str(self.loans[2].id)]))
+        self.assertEquals(self.claim('admin1', 'admin1pass', 5), [])
+
+    def test_expired_claims_return_to_the_pool(self):
+        self.claim('admin1', 'admin1pass', 3)
+        Loan.objects.filter(id=self.loans[1].id).update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEquals(self.claim('admin2', 'admin2pass', 5), [str(self.own_loan.id), str(self.loans[1].id)])
+
+    def test_evaluating_loan_claimed_by_another_reviewer(self):
+        self.claim('admin1', 'admin1pass', 1)
+        response = self.client.post(
+            path=reverse('submit_loan_evaluation'),
+            data=evaluate_loan_payload(loan_id=self.loans[0].id),
+            **get_basic_auth_header('admin2', 'admin2pass')
+        )
+        self.assertEquals(response.status_code, 409)
+        self.assertEquals(response.json(), {'message': 'Loan is claimed by another reviewer.'})
+
+        response = self.client.post(
+            path=reverse('submit_loan_evaluation'),
+            data=evaluate_loan_payload(loan_id=self.loans[0].id),
+            **get_basic_auth_header('admin1', 'admin1pass')
+        )
+        self.assertEquals(response.status_code, 200)
+
+    def test_invalid_count(self):
+        response = self.client.post(
+            path=reverse('claim_loans_for_review'), data={'count': 'all'},
+            **get_basic_auth_header('admin1', 'admin1pass'))
+        self.assertEquals(response.status_code, 400)
+
+
+class OverdueRepaymentTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(4):
+            Loan.objects.create(customer=self.customer, loan_amount=100, term=5).approve(approved_by=self.admin)
+        # The first two installments of every loan are past due.
+        now = timezone.now()
+        for repayment in LoanRepayment.objects.order_by('loan_id', 'due_date'):
+            number = (repayment.due_date - repayment.loan.disbursement_date).days // 7
+            repayment.due_date = now + timedelta(days=7 * (number - 2) - 1)
+            repayment.save()
+        call_command('backfill_next_installments', stdout=StringIO())
+        self.due = list(LoanRepayment.objects.filter(due_date__lt=now).order_by('id'))
+        self.assertEquals(len(self.due), 8)
+
+    def overdue(self):
+        return list(LoanRepayment.objects.filter(status=LoanRepaymentStatus.OVERDUE).order_by('id'))
+
+    def test_marks_due_installments(self):
+        call_command('mark_overdue_repayments', chunk_size=3, stdout=StringIO())
+        self.assertEquals(self.overdue(), self.due)
+        # A new run starts over and finds nothing left to do.
+        self.assertEquals(mark_overdue_repayments(chunk_size=3), 0)
+
+    def test_resumes_from_checkpoint(self):
+        OverdueScanCheckpoint.objects.create(
+            shard=0, shards=1, as_of=timezone.now(), last_id=self.due[2].id)
+        self.assertEquals(mark_overdue_repayments(chunk_size=2), 5)
+        self.assertEquals(self.overdue(), self.due[3:])
+        self.assertIsNotNone(OverdueScanCheckpoint.objects.get().completed_at)
+
+        # Unless asked to restart.
+        OverdueScanCheckpoint.objects.update(completed_at=None)
+        self.assertEquals(mark_overdue_repayments(chunk_size=2, restart=True), 3)
+
+    def test_shards_split_the_work(self):
+        marked = [mark_overdue_repayments(shard=shard, shards=3, chunk_size=2) for shard in range(3)]
+        self.assertEquals(sum(marked), 8)
+        self.assertEquals(self.overdue(), self.due)
+        self.assertEquals(shard_id_range(0, 1), (UUID(int=0), None))
+        with self.assertRaises(CommandError):
+            call_command('mark_overdue_repayments', shard=3, shards=3, stdout=StringIO())
+
+    def test_overdue_installment_can_be_paid(self):
+        mark_overdue_repayments()
+        loan = self.due[0].loan
+        loan.refresh_from_db()
+        self.assertEquals(loan.next_repayment.status, LoanRepaymentStatus.OVERDUE)
+        response = self.client.post(
+            path=reverse('make_repayment'), data=repay_loan_payload(loan_id=loan.id, amount=50),
+            **get_basic_auth_header('customer1', 'customer1pass'))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(
+            [repayment.status for repayment in loan.loanrepayment_set.order_by('due_date')],
+            [LoanRepaymentStatus.PAID, LoanRepaymentStatus.OVERDUE] + [LoanRepaymentStatus.PENDING] * 3)
+        loan.refresh_from_db()
+        self.assertEquals(str(loan.next_due_amount), '12.50')
+        call_command('check_next_installments', stdout=StringIO())
+
+
+class ConditionalGetTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        caches[RESPONSE_CACHE].clear()
+        self.loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        self.loan.approve(approved_by=self.admin)
+        self.auth_headers = get_basic_auth_header('customer1', 'customer1pass')
+        # Keep the (cached) authentication out of the counts.
+        self.client.get(path=reverse('get_user_details'), **self.auth_headers)
+
+    def get(self, url_name, num_queries, **headers):
+        with self.assertNumQueries(num_queries):
+            return self.client.get(path=reverse(url_name, args=[self.loan.id]), **self.auth_headers, **headers)
+
+    def test_loan_details(self):
+        response = self.get('get_loan_details', 1)
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = self.get('get_loan_details', 0, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(response.content, b'')
+        self.assertEquals(response['ETag'], etag)
+        self.assertEquals(self.get('get_loan_details', 0, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.loan.upcoming_repayment.mark_paid()
+        response = self.get('get_loan_details', 1, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEquals(response['ETag'], etag)
+
+    def test_repayment_schedule(self):
+        response = self.get('get_repayment_schedule', 2)
+        self.assertEquals(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEquals(self.get('get_repayment_schedule', 0, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Changes to the repayments alone invalidate the schedule too.
+        LoanRepayment.objects.filter(loan=self.loan).update(due_date=timezone.now() - timedelta(days=1))
+        mark_overdue_repayments()
+        response = self.get('get_repayment_schedule', 2, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(
+            {repayment['status'] for repayment in response.json()['repayments']}, {LoanRepaymentStatus.OVERDUE})
+        self.assertEquals(
+            self.get('get_repayment_schedule', 0, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class ResponseCacheTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        caches[RESPONSE_CACHE].clear()
+        User.objects.create_user(
+            username='customer2', password='customer2pass', phone_number='9876543213', name='Clark Kent')
+        self.loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        self.loan.approve(approved_by=self.admin)
+        self.auth_headers = get_basic_auth_header('customer1', 'customer1pass')
+        # Keep the (cached) authentication out of the counts.
+        self.client.get(path=reverse('get_user_details'), **self.auth_headers)
+
+    def get_amounts_due(self):
+        details = self.client.get(path=reverse('get_loan_details', args=[self.loan.id]), **self.auth_headers)
+        loans = self.client.get(path=reverse('get_user_loans'), **self.auth_headers)
+        return details.json()['amount_due'], [loan['amount_due'] for loan in loans.json()['loans']]
+
+    def test_hits_are_served_without_queries(self):
+        for url in (reverse('get_user_loans'), reverse('get_loan_details', args=[self.loan.id]),
+                    reverse('get_repayment_schedule', args=[self.loan.id])):
+            response = self.client.get(path=url, **self.auth_headers)
+            self.assertEquals(response.status_code, 200)
+            with self.assertNumQueries(0):
+                cached = self.client.get(path=url, **self.auth_headers)
+            self.assertEquals(cached.status_code, 200)
+            self.assertEquals(cached['Content-Type'], 'application/json')
+            self.assertEquals(cached.content, response.content)
+
+    def test_invalidated_by_saves(self):
+        self.assertEquals(self.get_amounts_due(), ('100.00', ['100.00']))
+        self.loan.upcoming_repayment.mark_paid()
+        self.assertEquals(self.get_amounts_due(), ('80.00', ['80.00']))
+        schedule = self.client.get(path=reverse('get_repayment_schedule', args=[self.loan.id]), **self.auth_headers)
+        self.assertEquals(schedule.json()['repayments'][0]['status'], LoanRepaymentStatus.PAID)
+
+    def test_invalidated_by_bulk_writes(self):
+        self.assertEquals(self.get_amounts_due(), ('100.00', ['100.00']))
+        apply_bulk_repayments([{'loan_id': self.loan.id, 'amount': Decimal(30), 'payment_request_id': 'pr1'}])
+        self.assertEquals(self.get_amounts_due(), ('70.00', ['70.00']))
+
+        url = reverse('get_repayment_schedule', args=[self.loan.id])
+        self.client.get(path=url, **self.auth_headers)
+        LoanRepayment.objects.filter(loan=self.loan).update(due_date=timezone.now() - timedelta(days=1))
+        mark_overdue_repayments()
+        repayments = self.client.get(path=url, **self.auth_headers).json()['repayments']
+        self.assertEquals({repayment['status'] for repayment in repayments}, {LoanRepaymentStatus.PAID, LoanRepaymentStatus.OVERDUE})
+
+    def test_cached_loans_are_not_shared_between_customers(self):
+        url = reverse('get_loan_details', args=[self.loan.id])
+        self.assertEquals(self.client.get(path=url, **self.auth_headers).status_code, 200)
+        other_headers = get_basic_auth_header('customer2', 'customer2pass')
+        self.assertEquals(self.client.get(path=url, **other_headers).status_code, 404)
+        self.assertEquals(self.client.get(path=reverse('get_user_loans'), **other_headers).json()['loans'], [])
+        self.assertEquals(
+            self.client.get(path=reverse('get_loan_details', args=['not-a-uuid']), **self.auth_headers).status_code,
+            404)
+
+    def test_concurrent_misses_are_coalesced(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.2)
+            return b'built'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            get_or_build(caches[RESPONSE_CACHE], 'coalesced', build))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(len(builds), 1)
+        self.assertEquals(results, [b'built'] * 5)
+
+
+class LoanExportTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.auth_headers = get_basic_auth_header('customer1', 'customer1pass')
+
+    def export(self, export_type):
+        response = self.client.get(path=reverse('export_user_loans'), data={'type': export_type}, **self.auth_headers)
+        self.assertEquals(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def create_history(self, count):
+        loans = Loan.objects.bulk_create(
+            Loan(customer=self.customer, loan_amount=100, term=5, amount_due=100,
+                 approval_status=LoanApprovalStatus.APPROVED, disbursement_date=timezone.now())
+            for _ in range(count))
+        LoanRepayment.objects.bulk_create(
+            repayment for loan in loans for repayment in build_loan_repayment_schedule(loan))
+
+    def test_export_matches_details_and_schedule(self):
+        loans = [Loan.objects.create(customer=self.customer, loan_amount=100, term=5) for _ in range(3)]
+        loans[0].approve(approved_by=self.admin)
+        loans[0].upcoming_repayment.mark_paid()
+        with override_settings(LOAN_SCHEDULE_MODE=LoanScheduleMode.VIRTUAL):
+            loans[1].approve(approved_by=self.admin)
+        Loan.objects.create(customer=self.admin, loan_amount=100, term=5).approve(approved_by=self.customer)
+
+        exported = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        self.assertEquals(sorted(item['id'] for item in exported), sorted(str(loan.id) for loan in loans))
+        for item in exported:
+            details = self.client.get(path=reverse('get_loan_details', args=[item['id']]), **self.auth_headers)
+            schedule = self.client.get(path=reverse('get_repayment_schedule', args=[item['id']]), **self.auth_headers)
+            repayments = item.pop('repayments')
+            self.assertEquals(item, details.json())
+            self.assertEquals(repayments, schedule.json()['repayments'])
+
+        rows = list(csv.DictReader(StringIO(self.export('csv'))))
+        # Five installments each for the approved loans, a single row for the pending one.
+        self.assertEquals(len(rows), 11)
+        self.assertEquals([row['repayment_status'] for row in rows if row['loan_id'] == str(loans[0].id)],
+                          [LoanRepaymentStatus.PAID] + [LoanRepaymentStatus.PENDING] * 4)
+        self.assertEquals([row['repayment_id'] for row in rows if row['loan_id'] == str(loans[2].id)], [''])
+
+    def test_unknown_type(self):
+        response = self.client.get(path=reverse('export_user_loans'), data={'type': 'xml'}, **self.auth_headers)
+        self.assertEquals(response.status_code, 400)
+
+    @override_settings(LOAN_EXPORT_CHUNK_SIZE=100)
+    def test_memory_stays_flat(self):
+        def peak_memory():
+            tracemalloc.start()
+            try:
+                response = self.client.get(
+                    path=reverse('export_user_loans'), data={'type': 'csv'}, **self.auth_headers)
+                size = sum(len(chunk) for chunk in response.streaming_content)
+                return size, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        self.create_history(200)
+        # The first export also pays for one-off imports and caches.
+        peak_memory()
+        small_size, small_peak = peak_memory()
+        self.create_history(1800)
+        size, peak = peak_memory()
+        self.assertGreater(size, small_size * 9)
+        # Ten times the history, yet (give or take the allocator) the same peak.
+        self.assertLess(peak, small_peak * 1.5)
+        self.assertLess(peak, size / 2)
+
+
+class ReplicaRoutingTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches[RESPONSE_CACHE].clear()
+        self.loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        self.loan.approve(approved_by=self.admin)
+        self.auth_headers = get_basic_auth_header('customer1', 'customer1pass')
+
+    @override_settings(REPLICA_DATABASES=['replica_0', 'replica_1'])
+    def test_pinned_users_read_from_the_primary(self):
+        self.assertIn(get_replica(self.customer.id), ['replica_0', 'replica_1'])
+        pin_to_primary(self.customer.id)
+        self.assertIsNone(get_replica(self.customer.id))
+        self.assertIsNotNone(get_replica(self.admin.id))
+        with override_settings(REPLICA_DATABASES=[]):
+            self.assertIsNone(get_replica(self.admin.id))
+
+    def test_writes_pin_the_customer(self):
+        self.assertFalse(is_pinned_to_primary(self.customer.id))
+        response = self.client.post(
+            path=reverse('make_repayment'), data=repay_loan_payload(loan_id=self.loan.id), **self.auth_headers)
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(is_pinned_to_primary(self.customer.id))
+        self.assertFalse(is_pinned_to_primary(self.admin.id))
+        self.client.post(
+            path=reverse('create_loan_request'), data=create_loan_payload(),
+            **get_basic_auth_header('admin1', 'admin1pass'))
+        self.assertTrue(is_pinned_to_primary(self.admin.id))
+
+
+class ReplicaReadTests(CustomerAdminMixin, TransactionTestCase):
+    """A second connection to the test database stands in for the replica, it only sees committed data too."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added once the test database exists, as a plain connection rather than a database of its own.
+        connections.databases['replica'] = dict(connections.databases['default'])
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches[RESPONSE_CACHE].clear()
+        self.loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        self.loan.approve(approved_by=self.admin)
+        self.auth_headers = get_basic_auth_header('customer1', 'customer1pass')
+
+    def export(self):
+        response = self.client.get(path=reverse('export_user_loans'), **self.auth_headers)
+        self.assertEquals(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_reads_go_to_the_replica_until_pinned(self):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.export()
+        self.assertGreater(len(replica_queries), 0)
+
+        self.client.post(
+            path=reverse('make_repayment'), data=repay_loan_payload(loan_id=self.loan.id), **self.auth_headers)
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.export()
+        self.assertEquals(len(replica_queries), 0)
+
+    @override_settings(REPLICA_DATABASES=['replica'], PRIMARY_PIN_SECONDS=1)
+    def test_replica_builds_are_cached_once_replication_caught_up(self):
+        urls = [reverse('get_user_loans'), reverse('get_loan_details', args=[self.loan.id]),
+                reverse('get_repayment_schedule', args=[self.loan.id])]
+
+        def replica_queries():
+            with CaptureQueriesContext(connections['replica']) as queries:
+                for url in urls:
+                    self.assertEquals(self.client.get(path=url, **self.auth_headers).status_code, 200)
+            return len(queries)
+
+        self.loan.save()
+        # Just changed, the replica may not have it yet: built on the replica every time, never cached.
+        self.assertGreater(replica_queries(), 0)
+        self.assertGreater(replica_queries(), 0)
+        time.sleep(1.1)
+        self.assertGreater(replica_queries(), 0)
+        self.assertEquals(replica_queries(), 0)
+
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_lagging_replica_is_not_cached(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Holding a snapshot on the replica connection would lock SQLite writers out.')
+        url = reverse('get_loan_details', args=[self.loan.id])
+        self.assertEquals(self.client.get(path=url, **self.auth_headers).json()['amount_due'], '100.00')
+        with transaction.atomic(using='replica'):
+            # The replica is stuck at this snapshot, like one lagging behind the primary.
+            with connections['replica'].cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                cursor.execute('SELECT COUNT(*) FROM loans_loan')
+            # Bulk repayments do not pin the customer to the primary, they get to see the lag.
+            apply_bulk_repayments([{'loan_id': self.loan.id, 'amount': Decimal(20), 'payment_request_id': 'pr1'}])
+            self.assertEquals(self.client.get(path=url, **self.auth_headers).json()['amount_due'], '100.00')
+        # But only for as long as the replica lags, the stale state was not cached.
+        self.assertEquals(self.client.get(path=url, **self.auth_headers).json()['amount_due'], '80.00')
+
+
+class AsyncReadEndpointTests(CustomerAdminMixin, TransactionTestCase):
+    """The queries of the async views run on connections of worker threads, which only see committed data."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches[RESPONSE_CACHE].clear()
+        caches[CREDENTIALS_CACHE].clear()
+        self.loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        self.loan.approve(approved_by=self.admin)
+        for _ in range(2):
+            Loan.objects.create(customer=self.customer, loan_amount=200, term=4)
+        self.auth_headers = get_basic_auth_header('customer1', 'customer1pass')
+
+    @staticmethod
+    def async_headers(headers):
+        # AsyncClient takes the header names without the HTTP_ prefix.
+        return {name[len('HTTP_'):]: value for name, value in headers.items()}
+
+    async def test_answers_like_the_sync_endpoints(self):
+        for url_name, args in [('get_user_loans', []), ('get_loan_details', [self.loan.id]),
+                               ('get_repayment_schedule', [self.loan.id])]:
+            expected = await sync_to_async(self.client.get)(path=reverse(url_name, args=args), **self.auth_headers)
+            response = await self.async_client.get(
+                reverse(f'{url_name}_async', args=args), **self.async_headers(self.auth_headers))
+            self.assertEquals(response.status_code, 200)
+            self.assertEquals(response.json(), expected.json())
+
+            if url_name != 'get_user_loans':
+                self.assertEquals(response['ETag'], expected['ETag'])
+                response = await self.async_client.get(
+                    reverse(f'{url_name}_async', args=args),
+                    **self.async_headers(self.auth_headers), IF_NONE_MATCH=expected['ETag'])
+                self.assertEquals(response.status_code, 304)
+
+    async def test_same_status_as_the_sync_endpoints(self):
+        await sync_to_async(User.objects.create_user)(
+            username='banned1', password='banned1pass', phone_number='7876543213', name='Joker',
+            user_level=UserLevel.BANNED)
+        for headers in ({}, self.auth_headers, get_basic_auth_header('admin1', 'admin1pass'),
+                        get_basic_auth_header('banned1', 'banned1pass')):
+            for url_name, args in [('get_user_loans', []), ('get_loan_details', [self.loan.id]),
+                                   ('get_repayment_schedule', [self.loan.id]), ('get_pending_loans', [])]:
+                expected = await sync_to_async(self.client.get)(path=reverse(url_name, args=args), **headers)
+                response = await self.async_client.get(
+                    reverse(f'{url_name}_async', args=args), **self.async_headers(headers))
+                self.assertEquals(response.status_code, expected.status_code, (url_name, headers))
+
+    async def test_authentication(self):
+        url = reverse('get_loan_details_async', args=[self.loan.id])
+        response = await self.async_client.get(url, **self.async_headers(get_basic_auth_header('customer1', 'wrong')))
+        self.assertEquals(response.status_code, 401)
+        response = await self.async_client.get(url, **self.async_headers(get_basic_auth_header('nobody', 'wrong')))
+        self.assertEquals(response.status_code, 401)
+
+        # Verified credentials are remembered, like by CachedBasicAuthentication.
+        self.assertEquals((await self.async_client.get(url, **self.async_headers(self.auth_headers))).status_code, 200)
+        await sync_to_async(User.objects.filter(id=self.customer.id).update)(password='!')
+        response = await self.async_client.get(url, **self.async_headers(self.auth_headers))
+        self.assertEquals(response.status_code, 200)
+
+        response = await self.async_client.get(url, AUTHORIZATION=f'Bearer {issue_access_token(self.customer)}')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals((await self.async_client.get(url)).status_code, 401)
+
+    async def test_permissions(self):
+        url = reverse('get_pending_loans_async')
+        self.assertEquals((await self.async_client.get(url)).status_code, 401)
+        response = await self.async_client.get(url, **self.async_headers(self.auth_headers))
+        self.assertEquals(response.status_code, 403)
+        # Django 3.1's AsyncClient drops the data of GET requests, hence the query in the path.
+        response = await self.async_client.get(
+            f'{url}?page_size=1', **self.async_headers(get_basic_auth_header('admin1', 'admin1pass')))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(len(response.json()['pending_loans']), 1)
+        self.assertIsNotNone(response.json()['next'])
+        self.assertEquals((await self.async_client.post(url)).status_code, 405)
+
+        self.customer.user_level = UserLevel.BANNED
+        await sync_to_async(self.customer.save)()
+        response = await self.async_client.get(reverse('get_user_loans_async'), **self.async_headers(self.auth_headers))
+        self.assertEquals(response.status_code, 403)
+
+    async def test_other_customers_loans_are_not_found(self):
+        response = await self.async_client.get(
+            reverse('get_loan_details_async', args=[self.loan.id]),
+            **self.async_headers(get_basic_auth_header('admin1', 'admin1pass')))
+        self.assertEquals(response.status_code, 404)
+        response = await self.async_client.get(
+            reverse('get_loan_details_async', args=['not-a-uuid']), **self.async_headers(self.auth_headers))
+        self.assertEquals(response.status_code, 404)
+
+
+class IdempotencyKeyTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches[RESPONSE_CACHE].clear()
+        self.loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        self.loan.approve(approved_by=self.admin)
+        self.auth_headers = get_basic_auth_header('customer1', 'customer1pass')
+
+    def repay(self, key, amount=20):
+        return self.client.post(path=reverse('make_repayment'),
+                                data=repay_loan_payload(loan_id=self.loan.id, amount=amount),
+                                HTTP_IDEMPOTENCY_KEY=key, **self.auth_headers)
+
+    def test_retried_repayments_are_replayed(self):
+        response = self.repay('retry-1')
+        self.assertEquals(response.status_code, 200)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+        # Just the stored response lookup, no locking and no writes.
+        with self.assertNumQueries(1):
+            replayed = self.repay('retry-1')
+        self.assertEquals(replayed.status_code, 200)
+        self.assertEquals(replayed['Idempotent-Replayed'], 'true')
+        self.assertEquals(replayed.json(), response.json())
+        self.loan.refresh_from_db()
+        self.assertEquals(self.loan.amount_due, Decimal('80.00'))
+
+        self.assertEquals(self.repay('retry-2').json()['amount_due'], '60.00')
+        self.assertEquals(self.repay('retry-1', amount=40).status_code, 422)
+        self.assertEquals(self.repay('x' * 256).status_code, 400)
+
+    def test_client_errors_are_replayed_too(self):
+        self.assertEquals(self.repay('too-much', amount=1000).status_code, 400)
+        self.assertEquals(self.repay('too-much', amount=1000)['Idempotent-Replayed'], 'true')
+
+    def test_keys_are_per_user_and_endpoint(self):
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'same-key'}
+        for _ in range(2):
+            self.client.post(path=reverse('create_loan_request'), data=create_loan_payload(),
+                             **headers, **self.auth_headers)
+            self.client.post(path=reverse('create_loan_request'), data=create_loan_payload(),
+                             **headers, **get_basic_auth_header('admin1', 'admin1pass'))
+        self.assertEquals(Loan.objects.filter(customer=self.customer).count(), 2)
+        self.assertEquals(Loan.objects.filter(customer=self.admin).count(), 1)
+
+        # The key admin1 used for its own loan request, now on another endpoint (and not for its own loan).
+        pending = Loan.objects.filter(customer=self.customer, approval_status=LoanApprovalStatus.PENDING).first()
+        response = self.client.post(path=reverse('submit_loan_evaluation'), data=evaluate_loan_payload(pending.id),
+                                    **headers, **get_basic_auth_header('admin1', 'admin1pass'))
+        self.assertEquals(response.status_code, 200)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+    def test_expired_keys_are_purged(self):
+        self.repay('old')
+        IdempotentResponse.objects.update(created=timezone.now() - timedelta(days=2))
+        self.repay('new')
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertEquals(IdempotentResponse.objects.count(), 1)
+        self.assertEquals(self.repay('new')['Idempotent-Replayed'], 'true')
+
+
+class LoanUpdateContentionTests(CustomerAdminMixin, TransactionTestCase):
+    """Threads repaying the very same loan, each on a connection of its own."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.loan = Loan.objects.create(customer=self.customer, loan_amount=2400, term=24)
+        self.loan.approve(approved_by=self.admin)
+        self.token = issue_access_token(self.customer)
+
+    def repay_concurrently(self, threads=6, repayments=4):
+        outcomes = []
+
+        def payer():
+            client = Client(raise_request_exception=False)
+            try:
+                for _ in range(repayments):
+                    outcomes.append(client.post(
+                        path=reverse('make_repayment'), data=repay_loan_payload(loan_id=self.loan.id, amount=100),
+                        HTTP_AUTHORIZATION=f'Bearer {self.token}').status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=payer) for _ in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        succeeded = outcomes.count(200)
+        return succeeded, succeeded / (time.perf_counter() - started)
+
+    def assertBalanceConsistent(self, succeeded):
+        self.loan.refresh_from_db()
+        self.assertEquals(self.loan.amount_due, Decimal(2400 - 100 * succeeded))
+        self.assertEquals(
+            LoanRepayment.objects.filter(loan=self.loan, status=LoanRepaymentStatus.PAID).count(), succeeded)
+        # Approval wrote the loan twice, every repayment once.
+        self.assertEquals(self.loan.version, 2 + succeeded)
+
+    @override_settings(LOAN_UPDATE_STRATEGY=LoanUpdateStrategy.OPTIMISTIC, LOAN_UPDATE_MAX_ATTEMPTS=50)
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite takes one writer at a time.')
+    def test_optimistic_repayments_all_go_through(self):
+        succeeded, per_second = self.repay_concurrently()
+        self.assertEquals(succeeded, 24)
+        self.assertGreater(per_second, 0)
+        self.assertBalanceConsistent(succeeded)
+
+    @override_settings(LOAN_UPDATE_STRATEGY=LoanUpdateStrategy.LOCKING)
+    @skipUnless(connection.vendor == 'postgresql', 'SQLite takes one writer at a time.')
+    def test_locking_repayments_stay_consistent(self):
+        succeeded, _ = self.repay_concurrently()
+        self.assertBalanceConsistent(succeeded)
+
+    def test_stale_saves_are_rejected(self):
+        stale = Loan.objects.get(id=self.loan.id)
+        self.loan.upcoming_repayment.mark_paid()
+        stale.amount_due = 0
+        with self.assertRaises(LoanVersionConflict):
+            stale.save()
+        self.loan.refresh_from_db()
+        self.assertEquals(self.loan.amount_due, Decimal(2300))
+
+
+class WriteAmplificationTests(CustomerAdminMixin, TestCase):
+    """Repayments write the columns they change, not whole loan and repayment rows."""
+
+    def setUp(self):
+        super().setUp()
+        self.loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        self.loan.approve(approved_by=self.admin)
+        self.auth_headers = get_basic_auth_header('customer1', 'customer1pass')
+
+    def written_columns(self, queries, table):
+        """{column} SET by every UPDATE of `table`, in order."""
+        updates = [query['sql'] for query in queries if query['sql'].startswith(f'UPDATE "{table}" SET ')]
+        return [set(re.findall(r'"(\w+)" = ', sql.split(' SET ', 1)[1].rsplit(' WHERE ', 1)[0]))
+                for sql in updates]
+
+    def test_repayment_writes_only_changed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(path=reverse('make_repayment'), **self.auth_headers,
+                                        data=repay_loan_payload(loan_id=self.loan.id, amount=20))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(self.written_columns(queries, 'loans_loan'), [
+            {'amount_due', 'modified', 'version', 'next_repayment_id', 'next_due_date', 'next_due_amount'}])
+        self.assertEquals(self.written_columns(queries, 'loans_loanrepayment'), [
+            {'repayment_date', 'status', 'amount', 'modified'}])
+
+        with CaptureQueriesContext(connection) as queries:
+            Loan.objects.get(id=self.loan.id).save()
+        full_row, = self.written_columns(queries, 'loans_loan')
+        # A plain save writes every column, more than three times the repayment's.
+        self.assertGreater(len(full_row), 3 * 6)
+
+    def test_balance_is_decremented_in_place(self):
+        self.loan.upcoming_repayment.mark_paid()
+        # The outcome of the amount_due - 20 expression, without reading the row back.
+        self.assertEquals(self.loan.amount_due, Decimal(80))
+        self.loan.refresh_from_db()
+        self.assertEquals(self.loan.amount_due, Decimal(80))
+        self.assertIsNone(self.loan.closure_date)
+
+        for _ in range(4):
+            self.loan.upcoming_repayment.mark_paid()
+        self.loan.refresh_from_db()
+        self.assertEquals(self.loan.amount_due, 0)
+        self.assertIsNotNone(self.loan.closure_date)
+
+    def test_columns_changed_elsewhere_survive_repayments(self):
+        # Neither versioned nor part of the repayment, so only a full row write would undo it.
+        Loan.objects.filter(id=self.loan.id).update(interest_rate=Decimal(12))
+        self.loan.upcoming_repayment.mark_paid()
+        self.loan.refresh_from_db()
+        self.assertEquals(self.loan.interest_rate, Decimal(12))
+        self.assertEquals(self.loan.amount_due, Decimal(80))
+
+
+class FastSerializationTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        loans = [Loan.objects.create(customer=self.customer, loan_amount=Decimal('1234.5'), term=7) for _ in range(4)]
+        loans[0].approve(approved_by=self.admin)
+        loans[1].reject(rejected_by=self.admin)
+        loans[2].approve(approved_by=self.admin)
+        for _ in range(7):
+            loans[2].upcoming_repayment.mark_paid()
+        with override_settings(LOAN_SCHEDULE_MODE=LoanScheduleMode.VIRTUAL):
+            loans[3].approve(approved_by=self.admin)
+        loans[3].upcoming_repayment.mark_paid(with_amount=Decimal('500.01'))
+        self.virtual_loan = Loan.objects.get(id=loans[3].id)
+
+    def assertSameJson(self, slow, fast):
+        self.assertEquals(JsonResponse({'items': fast}).content, JsonResponse({'items': slow}).content)
+
+    def test_parity_with_model_serializers(self):
+        for tz in ('UTC', 'Asia/Kolkata'):
+            with timezone.override(tz):
+                loans = Loan.objects.order_by('created')
+                self.assertSameJson(
+                    [LoanDetailsSerializer(instance=loan).data for loan in loans],
+                    loan_details_values.serialize(loans.values(*loan_details_values.sources)))
+
+                repayments = LoanRepayment.objects.order_by('due_date')
+                self.assertSameJson(
+                    [LoanRepaymentSerializer(instance=repayment).data for repayment in repayments],
+                    loan_repayment_values.serialize(repayments.values(*loan_repayment_values.sources)))
+
+                virtual_installments = self.virtual_loan.virtual_installments()
+                self.assertSameJson(
+                    [LoanRepaymentSerializer(instance=repayment).data for repayment in virtual_installments],
+                    loan_repayment_values.serialize_instances(virtual_installments))
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_serialization', rows=50, stdout=out)
+        self.assertIn('rows/sec', out.getvalue())
+        self.assertEquals(Loan.objects.count(), 4)
+
+
+class PortfolioSummaryTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin_auth = get_basic_auth_header('admin1', 'admin1pass')
+
+    def summary(self):
+        response = self.client.get(path=reverse('get_portfolio_summary'), **self.admin_auth)
+        self.assertEquals(response.status_code, 200)
+        return response.json()
+
+    def test_summary_follows_loan_changes(self):
+        for _ in range(3):
+            self.client.post(
+                path=reverse('create_loan_request'), data=create_loan_payload(),
+                **get_basic_auth_header('customer1', 'customer1pass'))
+        loans = [Loan.objects.create(customer=self.customer, loan_amount=100, term=5) for _ in range(4)]
+        loans[0].approve(approved_by=self.admin)
+        loans[1].reject(rejected_by=self.admin)
+        self.client.post(
+            path=reverse('submit_bulk_loan_evaluation'), content_type='application/json', data=json.dumps([
+                {'loan_id': str(loans[2].id), 'approval_status': LoanApprovalStatus.APPROVED},
+                {'loan_id': str(loans[3].id), 'approval_status': LoanApprovalStatus.REJECTED},
+            ]), **self.admin_auth)
+        for _ in range(5):
+            loans[0].upcoming_repayment.mark_paid()
+        self.client.post(
+            path=reverse('make_bulk_repayment'), content_type='application/json',
+            data=json.dumps([{'loan_id': str(loans[2].id), 'amount': '35', 'payment_request_id': 'pr1'}]),
+            **self.admin_auth)
+
+        self.assertEquals(self.summary()['portfolio'], {
+            'PENDING': {'loans': 3, 'open_loans': 3, 'closed_loans': 0, 'amount_due': '0.00'},
+            'APPROVED': {'loans': 2, 'open_loans': 1, 'closed_loans': 1, 'amount_due': '65.00'},
+            'REJECTED': {'loans': 2, 'open_loans': 2, 'closed_loans': 0, 'amount_due': '0.00'},
+        })
+        call_command('recompute_portfolio_summary', check=True, stdout=StringIO())
+
+    def test_recompute_repairs_drift_and_buckets_overdue_loans(self):
+        loans = [Loan.objects.create(customer=self.customer, loan_amount=100, term=5) for _ in range(3)]
+        for loan in loans:
+            loan.approve(approved_by=self.admin)
+        now = timezone.now()
+        Loan.objects.filter(id=loans[0].id).update(next_due_date=now - timedelta(days=10), amount_due=60)
+        Loan.objects.filter(id=loans[1].id).update(next_due_date=now - timedelta(days=100))
+
+        with self.assertRaises(CommandError):
+            call_command('recompute_portfolio_summary', check=True, stdout=StringIO())
+        call_command('recompute_portfolio_summary', stdout=StringIO())
+        call_command('recompute_portfolio_summary', check=True, stdout=StringIO())
+
+        summary = self.summary()
+        self.assertEquals(summary['portfolio']['APPROVED']['amount_due'], '260.00')
+        self.assertEquals(
+            [(bucket['first_day'], bucket['last_day'], bucket['loan_count'], bucket['amount_due'])
+             for bucket in summary['overdue']],
+            [(1, 30, 1, '60.00'), (31, 60, 0, '0.00'), (61, 90, 0, '0.00'), (91, None, 1, '100.00')])
+
+    def test_summary_needs_admin(self):
+        response = self.client.get(
+            path=reverse('get_portfolio_summary'), **get_basic_auth_header('customer1', 'customer1pass'))
+        self.assertEquals(response.status_code, 403)
+
+
+@override_settings(LOAN_SCHEDULE_MODE=LoanScheduleMode.VIRTUAL)
+class VirtualScheduleTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+    def schedule(self, loan):
+        response = self.client.get(
+            path=reverse('get_repayment_schedule', args=[loan.id]),
+            **get_basic_auth_header('customer1', 'customer1pass'))
+        self.assertEquals(response.status_code, 200)
+        return [(r['status'], r['amount'], r['due_date']) for r in response.json()['repayments']]
+
+    def repay(self, loan, amount):
+        response = self.client.post(
+            path=reverse('make_repayment'), data=repay_loan_payload(loan_id=loan.id, amount=amount),
+            **get_basic_auth_header('customer1', 'customer1pass'))
+        self.assertEquals(response.status_code, 200)
+
+    def test_schedule_matches_materialized_one(self):
+        materialized = Loan.objects.create(customer=self.customer, loan_amount=100, term=7)
+        virtual = Loan.objects.create(customer=self.customer, loan_amount=100, term=7)
+        # Same disbursement date, so that the due dates can be compared.
+        evaluation_date = timezone.now()
+        for loan, mode in ((materialized, LoanScheduleMode.MATERIALIZED), (virtual, LoanScheduleMode.VIRTUAL)):
+            with override_settings(LOAN_SCHEDULE_MODE=mode):
+                loan.set_approved(self.admin, evaluation_date)
+            loan.save()
+            create_loan_repayment_schedule(loan)
+
+        virtual.refresh_from_db()
+        self.assertEquals(virtual.schedule_mode, LoanScheduleMode.VIRTUAL)
+        self.assertFalse(LoanRepayment.objects.filter(loan=virtual).exists())
+        self.assertEquals(self.schedule(virtual), self.schedule(materialized))
+        self.assertEquals([amount for _, amount, _ in self.schedule(virtual)], ['14.28'] * 6 + ['14.32'])
+
+        for amount in ('14.28', '30'):
+            self.repay(materialized, amount)
+            self.repay(virtual, amount)
+        self.assertEquals(self.schedule(virtual), self.schedule(materialized))
+        self.assertEquals(LoanRepayment.objects.filter(loan=virtual).count(), 2)
+
+    def test_repayments_until_closure(self):
+        loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        loan.approve(approved_by=self.admin)
+        loan.refresh_from_db()
+        self.assertIsNone(loan.next_repayment)
+        self.assertEquals(str(loan.next_due_amount), '20.00')
+
+        self.repay(loan, 35)
+        loan.refresh_from_db()
+        self.assertEquals(str(loan.amount_due), '65.00')
+        self.assertEquals((loan.remaining_installments, str(loan.next_due_amount)), (4, '16.25'))
+        paid = LoanRepayment.objects.get(loan=loan)
+        self.assertEquals((paid.status, str(paid.amount)), (LoanRepaymentStatus.PAID, '35.00'))
+        call_command('check_next_installments', stdout=StringIO())
+
+        while loan.amount_due:
+            self.repay(loan, loan.next_due_amount)
+            loan.refresh_from_db()
+        self.assertIsNotNone(loan.closure_date)
+        self.assertEquals((loan.remaining_installments, loan.next_due_date), (0, None))
+        self.assertEquals([status for status, _, _ in self.schedule(loan)], [LoanRepaymentStatus.PAID] * 5)
+        call_command('check_next_installments', stdout=StringIO())
+
+    def test_bulk_evaluation_and_repayment(self):
+        loan = Loan.objects.create(customer=self.customer, loan_amount=100, term=5)
+        auth_headers = get_basic_auth_header('admin1', 'admin1pass')
+        self.client.post(
+            path=reverse('submit_bulk_loan_evaluation'), content_type='application/json',
+            data=json.dumps([{'loan_id': str(loan.id), 'approval_status': LoanApprovalStatus.APPROVED}]),
+            **auth_headers)
+        self.assertFalse(LoanRepayment.objects.filter(loan=loan).exists())
+
+        records = [
+            {'loan_id': str(loan.id), 'amount': '20', 'payment_request_id': 'pr1'},
+            {'loan_id': str(loan.id), 'amount': '35', 'payment_request_id': 'pr2'},
+        ]
+        response = self.client.post(
+            path=reverse('make_bulk_repayment'), data=json.dumps(records), content_type='application/json',
+            **auth_headers)
+        self.assertEquals([result['status'] for result in response.json()['results']], ['PAID', 'PAID'])
+        loan.refresh_from_db()
+        self.assertEquals(str(loan.amount_due), '45.00')
+        schedule = self.schedule(loan)
+        self.assertEquals([(status, amount) for status, amount, _ in schedule], [
+            (LoanRepaymentStatus.PAID, '20.00'),
+            (LoanRepaymentStatus.PAID, '35.00'),
+            (LoanRepaymentStatus.PENDING, '15.00'),
+            (LoanRepaymentStatus.PENDING, '15.00'),
+            (LoanRepaymentStatus.PENDING, '15.00'),
+        ])
+        self.assertEquals(
+            [parse_datetime(due_date) for _, _, due_date in schedule],
+            installment_due_dates(loan.schedule_start_date, loan.repayment_frequency, loan.term))
+        self.assertEquals(
+            sorted(LoanRepayment.objects.filter(loan=loan).values_list('payment_request_id', flat=True)),
+            ['pr1', 'pr2'])
+        call_command('check_next_installments', stdout=StringIO())
+
+
+class ScheduleEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.random = Random(20230908)
+
+    def test_split_installments_properties(self):
+        for _ in range(2000):
+            total, count = self.random.randint(0, 10 ** 9), self.random.randint(1, 520)
+            installments = split_installments(total, count)
+            self.assertEquals(len(installments), count)
+            self.assertEquals(sum(installments), total)
+            # Every installment but the last one is the same, the last one carries the remainder.
+            self.assertEquals(set(installments[:-1]) - {total // count}, set())
+            self.assertEquals(installments[-1] - total // count, total % count)
+
+    def test_split_installments_matches_decimal_rounding(self):
+        for _ in range(500):
+            total = Decimal(self.random.randint(1, 10 ** 7)).scaleb(-2)
+            count = self.random.randint(1, 52)
+            installment = Decimal(total / count).quantize(Decimal('.00'), ROUND_DOWN)
+            expected = [installment] * (count - 1) + [total - installment * (count - 1)]
+            self.assertEquals(
+                [from_minor_units(amount) for amount in split_installments(to_minor_units(total), count)], expected)
+
+    def test_minor_units(self):
+        self.assertEquals(to_minor_units(Decimal('14.28')), 1428)
+        self.assertEquals(str(from_minor_units(2000)), '20.00')
+        with self.assertRaises(ValueError):
+            to_minor_units(Decimal('14.285'))
+        with self.assertRaises(ValueError):
+            split_installments(100, 0)
+
+    def test_installment_due_dates(self):
+        start = timezone.now()
+        for term in (1, 5, 520):
+            due_dates = installment_due_dates(start, RecurrenceFrequency.WEEKLY, term)
+            self.assertEquals(len(due_dates), term)
+            self.assertEquals(due_dates[0], start + timedelta(days=7))
+            self.assertEquals(due_dates[-1], start + timedelta(days=7 * term))
+        with self.assertRaises(ValueError):
+            installment_due_dates(start, 3, 5)
+
+
+class AmortizationEngineTests(SimpleTestCase):
+    def setUp(self):
+        random = Random(20231012)
+        size = 1000
+        self.principal = np.array([random.randint(1, 10 ** 9) for _ in range(size)])
+        self.rate = np.array([random.choice([0, random.randint(1, 3600) / 100]) for _ in range(size)])
+        self.term = np.array([random.randint(1, 104) for _ in range(size)])
+        self.frequency = np.full(size, RecurrenceFrequency.WEEKLY)
+
+    def test_schedules_pay_off_the_principal(self):
+        schedule = amortize(self.principal, self.rate, self.term, self.frequency)
+        installments = emi(self.principal, self.rate, self.term, self.frequency)
+        np.testing.assert_array_equal(schedule.principal.sum(axis=1), self.principal)
+        np.testing.assert_array_equal(schedule.installment, schedule.interest + schedule.principal)
+        self.assertTrue((schedule.balance >= 0).all())
+        for i in range(len(self.principal)):
+            term = self.term[i]
+            self.assertEquals(schedule.balance[i, term - 1], 0)
+            self.assertFalse(schedule.installment[i, term:].any())
+            # Equated installments, only the last one absorbs the rounding.
+            self.assertEquals(set(schedule.installment[i, :term - 1]) - {installments[i]}, set())
+
+    def test_emi_matches_closed_form(self):
+        installments = emi(self.principal, self.rate, self.term, self.frequency)
+        for principal, rate, term, installment in zip(self.principal, self.rate, self.term, installments):
+            if rate:
+                periodic = rate / 100 * 7 / 365
+                expected = principal * periodic * (1 + periodic) ** term / ((1 + periodic) ** term - 1)
+                self.assertAlmostEqual(installment, expected, delta=1)
+            else:
+                # Interest free loans are split like the current schedules.
+                self.assertEquals(installment, split_installments(int(principal), int(term))[0])
+
+    def test_accrued_interest(self):
+        # 1,00,000 INR at 36.5% a year earns 100 INR a day.
+        np.testing.assert_array_equal(
+            accrued_interest(np.array([10 ** 7, 10 ** 7, 10 ** 7]), np.array([36.5, 36.5, 0]), np.array([1, 30, 30])),
+            [10 ** 4, 30 * 10 ** 4, 0])
+        with self.assertRaises(ValueError):
+            emi(np.array([100]), np.array([10]), np.array([0]), np.array([7]))
+
+
+class InterestAccrualTests(CustomerAdminMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.loans = []
+        for interest_rate in (Decimal('36.50'), Decimal('18.25'), Decimal('0'), Decimal('36.50')):
+            loan = Loan.objects.create(customer=self.customer, loan_amount=100000, term=5, interest_rate=interest_rate)
+            loan.approve(approved_by=self.admin)
+            self.loans.append(loan)
+        self.pending = Loan.objects.create(customer=self.customer, loan_amount=100000, term=5, interest_rate=10)
+        self.today = timezone.localdate()
+
+    def accrue(self, through):
+        call_command('accrue_interest', through=through, chunk_size=2, stdout=StringIO())
+        return [Loan.objects.get(id=loan.id) for loan in self.loans]
+
+    def test_nightly_accrual(self):
+        loans = self.accrue(self.today + timedelta(days=1))
+        self.assertEquals([str(loan.accrued_interest) for loan in loans], ['100.00', '50.00', '0.00', '100.00'])
+        self.assertEquals(loans[0].interest_accrued_through, self.today + timedelta(days=1))
+        self.assertIsNone(loans[2].interest_accrued_through)
+
+        # Running again for the same day is a no-op, the next night accrues on the reduced balance.
+        self.accrue(self.today + timedelta(days=1))
+        Loan.objects.filter(id=self.loans[3].id).update(amount_due=50000)
+        loans = self.accrue(self.today + timedelta(days=3))
+        self.assertEquals([str(loan.accrued_interest) for loan in loans], ['300.00', '150.00', '0.00', '200.00'])
+        self.pending.refresh_from_db()
+        self.assertEquals(self.pending.accrued_interest, 0)
+
+    def test_rate_set_on_create_and_accrual_shown_in_details(self):
+        auth_headers = get_basic_auth_header('customer1', 'customer1pass')
+        response = self.client.post(
+            path=reverse('create_loan_request'), data={**create_loan_payload(loan_amount=100000), 'interest_rate': '36.50'},
+            **auth_headers)
+        self.assertEquals(response.status_code, 201)
+        self.assertEquals(response.json()['interest_rate'], '36.50')
+        loan = Loan.objects.get(id=response.json()['id'])
+        loan.approve(approved_by=self.admin)
+
+        self.accrue(self.today + timedelta(days=2))
+        details = self.client.get(path=reverse('get_loan_details', args=[loan.id]), **auth_headers).json()
+        self.assertEquals(details['accrued_interest'], '200.00')
+        self.assertEquals(details['interest_accrued_through'], str(self.today + timedelta(days=2)))
+
+    @override_settings(LOAN_INTEREST_METHOD=LoanInterestMethod.REDUCING_BALANCE)
+    def test_reducing_balance_schedules_on_approval(self):
+        expected = amortize(np.array([10 ** 7]), np.array([36.5]), np.array([5]), np.array([7])).installment[0]
+        single = Loan.objects.create(customer=self.customer, loan_amount=100000, term=5, interest_rate=Decimal('36.50'))
+        single.approve(approved_by=self.admin)
+        bulk = Loan.objects.create(customer=self.customer, loan_amount=100000, term=5, interest_rate=Decimal('36.50'))
+        evaluate_loans([{'loan_id': bulk.id, 'approval_status': LoanApprovalStatus.APPROVED}], self.admin)
+        with override_settings(LOAN_SCHEDULE_MODE=LoanScheduleMode.VIRTUAL):
+            virtual = Loan.objects.create(
+                customer=self.customer, loan_amount=100000, term=5, interest_rate=Decimal('36.50'))
+            virtual.approve(approved_by=self.admin)
+
+        for loan in (single, bulk):
+            loan.refresh_from_db()
+            self.assertEquals(loan.interest_method, LoanInterestMethod.REDUCING_BALANCE)
+            # The interest of the whole schedule is due from approval on.
+            self.assertEquals(loan.amount_due, from_minor_units(int(expected.sum())))
+            self.assertGreater(loan.amount_due, loan.loan_amount)
+            self.assertEquals([to_minor_units(repayment.amount) for repayment in loan.pending_repayments()],
+                              expected.tolist())
+        virtual.refresh_from_db()
+        self.assertEquals([to_minor_units(virtual.regular_installment), to_minor_units(virtual.final_installment)],
+                          [expected[0], expected[-1]])
+
+        # Nothing is accrued on top of interest already in the installments.
+        self.accrue(self.today + timedelta(days=1))
+        for loan in (single, bulk, virtual):
+            self.assertEquals(Loan.objects.get(id=loan.id).accrued_interest, 0)
@@ -1,14 +1,26 @@
 from django.conf.urls import url
 
 from loans.views import create_loan_request, make_repayment, get_user_loans, get_loan_details, get_pending_loans, \
-    submit_loan_evaluation, get_repayment_schedule
+    submit_loan_evaluation, get_repayment_schedule, make_bulk_repayment, submit_bulk_loan_evaluation, \
+    claim_loans_for_review, get_portfolio_summary, export_user_loans, get_user_loans_async, get_loan_details_async, \
+    get_repayment_schedule_async, get_pending_loans_async
 
 urlpatterns = [
     url(r'request/$', create_loan_request, name='create_loan_request'),
     url(r'list/$', get_user_loans, name='get_user_loans'),
+    url(r'list/export/$', export_user_loans, name='export_user_loans'),
     url(r'list/pending/$', get_pending_loans, name='get_pending_loans'),
+    url(r'list/pending/claim/$', claim_loans_for_review, name='claim_loans_for_review'),
+    url(r'portfolio/summary/$', get_portfolio_summary, name='get_portfolio_summary'),
     url(r'evaluate/$', submit_loan_evaluation, name='submit_loan_evaluation'),
+    url(r'evaluate/bulk/$', submit_bulk_loan_evaluation, name='submit_bulk_loan_evaluation'),
     url(r'repay/$', make_repayment, name='make_repayment'),
+    url(r'repay/bulk/$', make_bulk_repayment, name='make_bulk_repayment'),
+    url(r'async/list/$', get_user_loans_async, name='get_user_loans_async'),
+    url(r'async/list/pending/$', get_pending_loans_async, name='get_pending_loans_async'),
+    url(r'async/(?P<loan_id>[-a-zA-Z0-9]+)/$', get_loan_details_async, name='get_loan_details_async'),
+    url(r'async/(?P<loan_id>[-a-zA-Z0-9]+)/repayment-schedule/$', get_repayment_schedule_async,
+        name='get_repayment_schedule_async'),
     url(r'(?P<loan_id>[-a-zA-Z0-9]+)/$', get_loan_details, name='get_loan_details'),
     url(r'(?P<loan_id>[-a-zA-Z0-9]+)/repayment-schedule/$', get_repayment_schedule, name='get_repayment_schedule'),
 ]
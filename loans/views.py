@@ -1,22 +1,56 @@
 from decimal import Decimal
+from typing import Optional
+from uuid import UUID
 
-from django.db import transaction
-from django.http import JsonResponse
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework import status
-from rest_framework.authentication import BasicAuthentication
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, parser_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 
-from loans.helpers import rebalance_loan_repayment_schedule
-from loans.models import LoanApprovalStatus, Loan, LoanRepayment, LoanRepaymentStatus
+from loans.cache import CachedResponse, get_customer_response, get_loan_response
+from loans.exports import EXPORT_CONTENT_TYPES, EXPORT_WRITERS, NDJSON, iter_loan_history
+from loans.helpers import BULK_EVALUATION_FAILED, BULK_REPAYMENT_FAILED, apply_bulk_repayments, \
+    claim_pending_loans, evaluate_loans, rebalance_loan_repayment_schedule, run_with_retries, summarize_portfolio
+from loans.idempotency import idempotent
+from loans.models import LoanApprovalStatus, Loan, LoanRepayment, LoanRepaymentStatus, LoanUpdateStrategy, \
+    LoanVersionConflict, OverdueBucket
+from userman.authentication import CachedBasicAuthentication, SignedTokenAuthentication
+from userman.decorators import async_api_view
 from userman.permissions.loans import ApplyLoanPermission, ManageLoanPermission
-from .serializers import LoanCreateSerializer, LoanDetailsSerializer, LoanEvaluationSerializer, LoanRepaymentSerializer
+from utils.aio import run_in_worker
+from utils.http import get_validators, not_modified, set_validators
+from utils.pagination import InvalidPage, get_page_size, paginate_by_keyset
+from utils.parsers import JSONLinesParser
+from utils.routers import current_read_database, pin_to_primary, read_from_replicas
+from .serializers import BulkEvaluationSerializer, BulkRepaymentSerializer, LoanCreateSerializer, \
+    LoanDetailsSerializer, LoanEvaluationSerializer, OverdueBucketSerializer, loan_details_values, loan_repayment_values
+
+
+def _get_loan_to_update(**lookup) -> Loan:
+    if settings.LOAN_UPDATE_STRATEGY == LoanUpdateStrategy.LOCKING:
+        return Loan.objects.select_for_update(nowait=True).get(**lookup)
+    # Read without a lock, a concurrent update makes the versioned save fail instead (see Loan.save).
+    return Loan.objects.get(**lookup)
+
+
+def _loan_busy_response() -> JsonResponse:
+    response = JsonResponse(
+        {'message': 'The loan is being updated by another request, please retry.'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    response['Retry-After'] = '1'
+    return response
 
 
 # ------------------ Customer endpoints ------------------
 
 @api_view(['POST'])
 @permission_classes([ApplyLoanPermission, ])
-@authentication_classes([BasicAuthentication])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+@idempotent
 def create_loan_request(request) -> JsonResponse:
     # Validating the request.
     request_data = request.data.copy()
@@ -28,146 +62,450 @@ def create_loan_request(request) -> JsonResponse:
             status=status.HTTP_400_BAD_REQUEST
         )
     serializer.save()
+    pin_to_primary(request.user.id)
     read_serializer = LoanDetailsSerializer(instance=serializer.instance)
     return JsonResponse(read_serializer.data, status=status.HTTP_201_CREATED)
 
 
 @api_view(['POST'])
 # Do we really need authentication here? We can allow anyone to repay the loan.
-@authentication_classes([BasicAuthentication])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+@idempotent
 def make_repayment(request) -> JsonResponse:
     if not request.data.get('loan_id'):
         return JsonResponse(
             {'message': "loan_id is a required field."},
             status=status.HTTP_400_BAD_REQUEST
         )
-    with transaction.atomic():
-        try:
-            # Let's lock the loan object to avoid concurrent balance updates.
-            loan = Loan.objects.select_for_update(nowait=True
-                                                  ).get(id=request.data.get('loan_id'), customer=request.user)
-            if loan.has_been_paid_back():
-                return JsonResponse(
-                    {'message': "Trying to pay for an already closed loan."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except Loan.DoesNotExist:
-            return JsonResponse(
-                {'message': 'Loan Not Found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        if not request.data.get('amount'):
-            return JsonResponse(
-                {'message': "amount is a required field."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        amount = Decimal(request.data.get('amount'))
-        if amount > loan.amount_due:
-            return JsonResponse(
-                {'message': "Trying to pay more than the due amount."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        # Note: If there is a due amount, there must be at least one pending repayment.
-        elif amount < loan.upcoming_repayment.amount:
+    try:
+        return run_with_retries(_make_repayment, request)
+    except LoanVersionConflict:
+        return _loan_busy_response()
+
+
+def _make_repayment(request) -> JsonResponse:
+    try:
+        loan = _get_loan_to_update(id=request.data.get('loan_id'), customer=request.user)
+        if loan.has_been_paid_back():
             return JsonResponse(
-                {'message': f"Minimum acceptable amount is {loan.upcoming_repayment.amount}"},
+                {'message': "Trying to pay for an already closed loan."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        elif amount > loan.upcoming_repayment.amount:
-            loan.upcoming_repayment.mark_paid(with_amount=amount)
-            rebalance_loan_repayment_schedule(loan)
-        else:
-            loan.upcoming_repayment.mark_paid(with_amount=amount)
+    except Loan.DoesNotExist:
+        return JsonResponse(
+            {'message': 'Loan Not Found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if not request.data.get('amount'):
+        return JsonResponse(
+            {'message': "amount is a required field."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    amount = Decimal(request.data.get('amount'))
+    if amount > loan.amount_due:
+        return JsonResponse(
+            {'message': "Trying to pay more than the due amount."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    # Note: If there is a due amount, there must be at least one pending repayment.
+    elif amount < loan.next_due_amount:
+        return JsonResponse(
+            {'message': f"Minimum acceptable amount is {loan.next_due_amount}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    elif amount > loan.next_due_amount:
+        loan.upcoming_repayment.mark_paid(with_amount=amount)
+        rebalance_loan_repayment_schedule(loan)
+    else:
+        loan.upcoming_repayment.mark_paid(with_amount=amount)
+    pin_to_primary(request.user.id)
     return JsonResponse(LoanDetailsSerializer(instance=loan).data, status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
-@authentication_classes([BasicAuthentication])
-def get_user_loans(request) -> JsonResponse:
-    loans = Loan.objects.filter(customer=request.user).order_by('disbursement_date')
-    return JsonResponse(
-        {'loans': [LoanDetailsSerializer(instance=loan).data for loan in loans]},
-        status=status.HTTP_200_OK
+@permission_classes([ApplyLoanPermission, ])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+@read_from_replicas
+def get_user_loans(request) -> HttpResponse:
+    cursor = request.query_params.get('cursor')
+    try:
+        page_size = get_page_size(request.query_params, settings.LOAN_LIST_PAGE_SIZE,
+                                  settings.LOAN_LIST_MAX_PAGE_SIZE)
+        content = get_customer_response('loans', request.user.id, f'{page_size}:{cursor}',
+                                        lambda: _build_user_loans_page(request.user.id, page_size, cursor))
+    except InvalidPage as e:
+        return JsonResponse(
+            {'message': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return HttpResponse(content, content_type='application/json', status=status.HTTP_200_OK)
+
+
+def _build_user_loans_page(customer_id, page_size: int, cursor: Optional[str]) -> bytes:
+    page = paginate_by_keyset(
+        Loan.objects.filter(customer_id=customer_id).values(*loan_details_values.sources),
+        key='disbursement_date',
+        page_size=page_size,
+        cursor=cursor,
     )
+    return JsonResponse({
+        'loans': loan_details_values.serialize(page.items),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }).content
 
 
 @api_view(['GET'])
-@authentication_classes([BasicAuthentication])
-def get_loan_details(request, loan_id) -> JsonResponse:
-    try:
-        loan = Loan.objects.get(id=loan_id, customer=request.user)
-    except Loan.DoesNotExist:
+@permission_classes([ApplyLoanPermission, ])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+@read_from_replicas
+def export_user_loans(request):
+    export_type = request.query_params.get('type', NDJSON)
+    if export_type not in EXPORT_WRITERS:
         return JsonResponse(
-            {'message': 'Loan Not Found'},
-            status=status.HTTP_404_NOT_FOUND
+            {'message': f'type should be one of {", ".join(EXPORT_WRITERS)}.'},
+            status=status.HTTP_400_BAD_REQUEST
         )
-    return JsonResponse(LoanDetailsSerializer(instance=loan).data, status=status.HTTP_200_OK)
+    # The rows are only read while streaming, after the view returned.
+    history = iter_loan_history(request.user, chunk_size=settings.LOAN_EXPORT_CHUNK_SIZE,
+                                using=current_read_database())
+    response = StreamingHttpResponse(EXPORT_WRITERS[export_type](history),
+                                     content_type=EXPORT_CONTENT_TYPES[export_type], status=status.HTTP_200_OK)
+    response['Content-Disposition'] = f'attachment; filename="loans.{export_type}"'
+    return response
 
 
-@api_view(['GET'])
-@authentication_classes([BasicAuthentication])
-def get_repayment_schedule(request, loan_id) -> JsonResponse:
+def _get_cached_loan_response(request, kind: str, loan_id, build) -> HttpResponse:
+    return _render_cached_loan_response(request, _lookup_cached_loan_response(kind, loan_id, build))
+
+
+def _lookup_cached_loan_response(kind: str, loan_id, build) -> Optional[CachedResponse]:
     try:
-        loan = Loan.objects.get(id=loan_id, customer=request.user)
-    except Loan.DoesNotExist:
+        loan_id = UUID(loan_id)
+    except ValueError:
+        return None
+    return get_loan_response(kind, loan_id, lambda: build(loan_id))
+
+
+def _render_cached_loan_response(request, cached: Optional[CachedResponse]) -> HttpResponse:
+    # Entries are shared by loan id, so ownership is checked on every hit.
+    if cached is None or cached.customer_id != str(request.user.id):
         return JsonResponse(
             {'message': 'Loan Not Found'},
             status=status.HTTP_404_NOT_FOUND
         )
-    loan_repayments = LoanRepayment.objects.filter(loan=loan).exclude(status=LoanRepaymentStatus.PREPAID)
-    return JsonResponse(
-        {'repayments': [LoanRepaymentSerializer(instance=repayment).data for repayment in loan_repayments]},
-        status=status.HTTP_200_OK)
+    response = not_modified(request, cached.validators)
+    if response is None:
+        response = HttpResponse(cached.content, content_type='application/json', status=status.HTTP_200_OK)
+    return set_validators(response, cached.validators)
+
+
+def _build_loan_details(loan_id) -> Optional[CachedResponse]:
+    try:
+        loan = Loan.objects.get(id=loan_id)
+    except Loan.DoesNotExist:
+        return None
+    return CachedResponse(
+        customer_id=str(loan.customer_id),
+        content=JsonResponse(LoanDetailsSerializer(instance=loan).data).content,
+        validators=get_validators(loan.id, loan.modified),
+    )
+
+
+def _build_repayment_schedule(loan_id) -> Optional[CachedResponse]:
+    last_repayment_change = LoanRepayment.objects.filter(loan=OuterRef('pk')).order_by('-modified')
+    try:
+        loan = Loan.objects.annotate(
+            repayments_modified=Subquery(last_repayment_change.values('modified')[:1]),
+        ).get(id=loan_id)
+    except Loan.DoesNotExist:
+        return None
+    repayments = loan_repayment_values.serialize(
+        LoanRepayment.objects.filter(loan=loan).exclude(status=LoanRepaymentStatus.PREPAID
+                                                        ).order_by('due_date').values(*loan_repayment_values.sources))
+    if loan.has_virtual_schedule and not loan.has_been_paid_back():
+        # Only the paid installments have rows, the pending ones are expanded from the schedule parameters.
+        repayments.extend(loan_repayment_values.serialize_instances(loan.virtual_installments()))
+    return CachedResponse(
+        customer_id=str(loan.customer_id),
+        content=JsonResponse({'repayments': repayments}).content,
+        # A virtual schedule only changes along with the loan.
+        validators=get_validators(loan.id, max(filter(None, [loan.modified, loan.repayments_modified]))),
+    )
+
+
+@api_view(['GET'])
+@permission_classes([ApplyLoanPermission, ])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+@read_from_replicas
+def get_loan_details(request, loan_id) -> HttpResponse:
+    return _get_cached_loan_response(request, 'details', loan_id, _build_loan_details)
+
+
+@api_view(['GET'])
+@permission_classes([ApplyLoanPermission, ])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+@read_from_replicas
+def get_repayment_schedule(request, loan_id) -> HttpResponse:
+    return _get_cached_loan_response(request, 'schedule', loan_id, _build_repayment_schedule)
 
 # ------------------ Internal Team endpoints ------------------
 
 
 @api_view(['GET'])
 @permission_classes([ManageLoanPermission, ])
-@authentication_classes([BasicAuthentication])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+@read_from_replicas
 def get_pending_loans(request) -> JsonResponse:
-    pending_loans = Loan.objects.filter(status=LoanApprovalStatus.PENDING).order_by('created')
+    try:
+        page = _get_pending_loans_page(
+            get_page_size(request.query_params, settings.LOAN_LIST_PAGE_SIZE, settings.LOAN_LIST_MAX_PAGE_SIZE),
+            request.query_params.get('cursor'),
+        )
+    except InvalidPage as e:
+        return JsonResponse(
+            {'message': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return JsonResponse(page, status=status.HTTP_200_OK)
+
+
+def _get_pending_loans_page(page_size: int, cursor: Optional[str]) -> dict:
+    page = paginate_by_keyset(
+        Loan.objects.filter(approval_status=LoanApprovalStatus.PENDING).values(
+            'created', *loan_details_values.sources),
+        key='created',
+        page_size=page_size,
+        cursor=cursor,
+    )
+    return {
+        'pending_loans': loan_details_values.serialize(page.items),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([ManageLoanPermission, ])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+def get_portfolio_summary(request) -> JsonResponse:
+    """
+    Portfolio totals per approval status, and the overdue buckets as of their last refresh.
+    Both are read from precomputed tables, no loan gets aggregated.
+    """
     return JsonResponse(
-        {'pending_loans': [LoanDetailsSerializer(instance=loan).data for loan in pending_loans]},
+        {
+            'portfolio': summarize_portfolio(),
+            'overdue': [
+                OverdueBucketSerializer(instance=bucket).data
+                for bucket in OverdueBucket.objects.order_by('first_day')
+            ],
+        },
         status=status.HTTP_200_OK
     )
 
 
 @api_view(['POST'])
 @permission_classes([ManageLoanPermission, ])
-@authentication_classes([BasicAuthentication])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+def claim_loans_for_review(request) -> JsonResponse:
+    """
+    Hands out the next `count` pending loans to the requesting reviewer for LOAN_REVIEW_LEASE_SECONDS.
+    """
+    try:
+        count = int(request.data.get('count', settings.LOAN_REVIEW_CLAIM_SIZE))
+    except (TypeError, ValueError):
+        count = 0
+    if count <= 0:
+        return JsonResponse(
+            {'message': "count should be a positive integer."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    loans = claim_pending_loans(reviewer=request.user, count=min(count, settings.LOAN_REVIEW_MAX_CLAIM_SIZE))
+    return JsonResponse(
+        {
+            'pending_loans': [LoanDetailsSerializer(instance=loan).data for loan in loans],
+            'claim_expires_at': loans[0].claim_expires_at if loans else None,
+        },
+        status=status.HTTP_200_OK
+    )
+
+
+@api_view(['POST'])
+@permission_classes([ManageLoanPermission, ])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+@idempotent
 def submit_loan_evaluation(request) -> JsonResponse:
     if not request.data.get('loan_id'):
         return JsonResponse(
             {'message': "loan_id is a required field."},
             status=status.HTTP_400_BAD_REQUEST
         )
-    with transaction.atomic():
-        try:
-            # Let's lock the loan object, we do not want multiple schedules getting created for the same loan.
-            loan = Loan.objects.select_for_update(nowait=True).get(id=request.data.get('loan_id'))
-        except Loan.DoesNotExist:
-            return JsonResponse(
-                {'message': 'Loan Not Found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        if loan.approval_status != LoanApprovalStatus.PENDING:
-            return JsonResponse(
-                {'message': 'Cannot approve loan if it is not pending.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+    try:
+        return run_with_retries(_submit_loan_evaluation, request)
+    except LoanVersionConflict:
+        return _loan_busy_response()
 
-        request_data = request.data.copy()
-        request_data.update({'evaluated_by': request.user.id})
-        serializer = LoanEvaluationSerializer(instance=loan, data=request_data)
-        if not serializer.is_valid():
-            return JsonResponse(
-                {'message': serializer.errors},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        if serializer.validated_data['approval_status'] == LoanApprovalStatus.APPROVED:
-            loan.approve(approved_by=request.user)
-        elif serializer.validated_data['approval_status'] == LoanApprovalStatus.REJECTED:
-            loan.reject(rejected_by=request.user)
+
+def _submit_loan_evaluation(request) -> JsonResponse:
+    try:
+        # We do not want multiple schedules getting created for the same loan.
+        loan = _get_loan_to_update(id=request.data.get('loan_id'))
+    except Loan.DoesNotExist:
+        return JsonResponse(
+            {'message': 'Loan Not Found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if loan.approval_status != LoanApprovalStatus.PENDING:
+        return JsonResponse(
+            {'message': 'Cannot approve loan if it is not pending.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if loan.is_claimed_by_other(request.user):
+        return JsonResponse(
+            {'message': 'Loan is claimed by another reviewer.'},
+            status=status.HTTP_409_CONFLICT
+        )
+
+    request_data = request.data.copy()
+    request_data.update({'evaluated_by': request.user.id})
+    serializer = LoanEvaluationSerializer(instance=loan, data=request_data)
+    if not serializer.is_valid():
+        return JsonResponse(
+            {'message': serializer.errors},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if serializer.validated_data['approval_status'] == LoanApprovalStatus.APPROVED:
+        loan.approve(approved_by=request.user)
+    elif serializer.validated_data['approval_status'] == LoanApprovalStatus.REJECTED:
+        loan.reject(rejected_by=request.user)
     read_serializer = LoanDetailsSerializer(instance=loan)
     return JsonResponse(read_serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([ManageLoanPermission, ])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+@parser_classes([JSONParser, JSONLinesParser])
+def make_bulk_repayment(request) -> JsonResponse:
+    """
+    Records a payment gateway settlement batch: a JSON array (or JSON lines) of
+    {loan_id, amount, payment_request_id} records. Returns a result per record, in order.
+    """
+    if not isinstance(request.data, list):
+        return JsonResponse(
+            {'message': "Expected a list of repayments."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(request.data) > settings.BULK_REPAYMENT_MAX_RECORDS:
+        return JsonResponse(
+            {'message': f"At most {settings.BULK_REPAYMENT_MAX_RECORDS} repayments can be submitted at once."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Validating every record on its own, invalid ones are reported back without failing the rest.
+    record_serializer = BulkRepaymentSerializer()
+    results, records = [None] * len(request.data), []
+    for index, record in enumerate(request.data):
+        try:
+            records.append((index, record_serializer.run_validation(record)))
+        except ValidationError as e:
+            results[index] = {
+                'loan_id': record.get('loan_id') if isinstance(record, dict) else None,
+                'payment_request_id': record.get('payment_request_id') if isinstance(record, dict) else None,
+                'status': BULK_REPAYMENT_FAILED,
+                'message': e.detail,
+            }
+
+    for (index, _), result in zip(records, apply_bulk_repayments([record for _, record in records])):
+        results[index] = result
+    return JsonResponse({'results': results}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([ManageLoanPermission, ])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+def submit_bulk_loan_evaluation(request) -> JsonResponse:
+    """
+    Evaluates a list of {loan_id, approval_status} in one go. Returns a result per evaluation, in order.
+    """
+    if not isinstance(request.data, list):
+        return JsonResponse(
+            {'message': "Expected a list of evaluations."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(request.data) > settings.BULK_EVALUATION_MAX_RECORDS:
+        return JsonResponse(
+            {'message': f"At most {settings.BULK_EVALUATION_MAX_RECORDS} evaluations can be submitted at once."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    evaluation_serializer = BulkEvaluationSerializer()
+    results, evaluations = [None] * len(request.data), []
+    for index, evaluation in enumerate(request.data):
+        try:
+            evaluations.append((index, evaluation_serializer.run_validation(evaluation)))
+        except ValidationError as e:
+            results[index] = {
+                'loan_id': evaluation.get('loan_id') if isinstance(evaluation, dict) else None,
+                'approval_status': evaluation.get('approval_status') if isinstance(evaluation, dict) else None,
+                'status': BULK_EVALUATION_FAILED,
+                'message': e.detail,
+            }
+
+    evaluated = evaluate_loans([evaluation for _, evaluation in evaluations], evaluated_by=request.user)
+    for (index, _), result in zip(evaluations, evaluated):
+        results[index] = result
+    return JsonResponse({'results': results}, status=status.HTTP_200_OK)
+
+
+# ------------------ Async (ASGI) endpoints ------------------
+# The read-only endpoints above as async views, they answer the same. Served under ASGI they
+# do not tie up a thread per request: the queries run in worker threads (see utils.aio).
+
+
+@async_api_view(['GET'], permission_classes=[ApplyLoanPermission, ])
+@read_from_replicas
+async def get_user_loans_async(request) -> HttpResponse:
+    cursor = request.GET.get('cursor')
+    try:
+        page_size = get_page_size(request.GET, settings.LOAN_LIST_PAGE_SIZE, settings.LOAN_LIST_MAX_PAGE_SIZE)
+        content = await run_in_worker(get_customer_response, 'loans', request.user.id, f'{page_size}:{cursor}',
+                                      lambda: _build_user_loans_page(request.user.id, page_size, cursor))
+    except InvalidPage as e:
+        return JsonResponse(
+            {'message': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return HttpResponse(content, content_type='application/json', status=status.HTTP_200_OK)
+
+
+@async_api_view(['GET'], permission_classes=[ApplyLoanPermission, ])
+@read_from_replicas
+async def get_loan_details_async(request, loan_id) -> HttpResponse:
+    cached = await run_in_worker(_lookup_cached_loan_response, 'details', loan_id, _build_loan_details)
+    return _render_cached_loan_response(request, cached)
+
+
+@async_api_view(['GET'], permission_classes=[ApplyLoanPermission, ])
+@read_from_replicas
+async def get_repayment_schedule_async(request, loan_id) -> HttpResponse:
+    cached = await run_in_worker(_lookup_cached_loan_response, 'schedule', loan_id, _build_repayment_schedule)
+    return _render_cached_loan_response(request, cached)
+
+
+@async_api_view(['GET'], permission_classes=[ManageLoanPermission, ])
+@read_from_replicas
+async def get_pending_loans_async(request) -> JsonResponse:
+    try:
+        page = await run_in_worker(
+            _get_pending_loans_page,
+            get_page_size(request.GET, settings.LOAN_LIST_PAGE_SIZE, settings.LOAN_LIST_MAX_PAGE_SIZE),
+            request.GET.get('cursor'),
+        )
+    except InvalidPage as e:
+        return JsonResponse(
+            {'message': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return JsonResponse(page, status=status.HTTP_200_OK)
@@ -0,0 +1,164 @@
+import hashlib
+import time
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core import signing
+from django.core.cache import cache, caches
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework.authentication import BaseAuthentication, BasicAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from userman.models import User
+from utils.aio import run_in_worker
+
+# Cache alias (see CACHES in settings) holding recently verified Basic auth credentials.
+CREDENTIALS_CACHE = 'credentials'
+
+ACCESS_TOKEN_SALT = 'userman.access-token'
+
+
+def _credentials_cache_key(username: str) -> str:
+    # Hashing keeps arbitrary header input from producing invalid cache keys.
+    return 'userman:basic:' + hashlib.sha256(username.encode('utf-8')).hexdigest()
+
+
+def _password_digest(password: str) -> str:
+    # Never keep the raw password around, not even in memory.
+    return salted_hmac('userman.authentication.password', password).hexdigest()
+
+
+def forget_verified_credentials(username: str):
+    caches[CREDENTIALS_CACHE].delete(_credentials_cache_key(username))
+
+
+def _get_verified_user(username: str, password: str) -> Optional[User]:
+    cached = caches[CREDENTIALS_CACHE].get(_credentials_cache_key(username))
+    if cached is not None and constant_time_compare(cached[0], _password_digest(password)):
+        return cached[1]
+    return None
+
+
+def _remember_verified_user(username: str, password: str, user: User):
+    caches[CREDENTIALS_CACHE].set(_credentials_cache_key(username), (_password_digest(password), user))
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    HTTP Basic authentication which remembers successful verifications.
+
+    Every Basic auth request otherwise costs a User SELECT and a full password hash.
+    A verified (username, password digest) pair is kept, along with the user, in the
+    bounded LRU `credentials` cache until its TTL runs out or the entry is invalidated
+    when the user's new password or ban is saved.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        user = _get_verified_user(userid, password)
+        if user is not None:
+            return user, None
+
+        user, auth = super().authenticate_credentials(userid, password, request)
+        _remember_verified_user(userid, password, user)
+        return user, auth
+
+
+def _revocation_cache_key(user_id) -> str:
+    return f'userman:revoked:{user_id}'
+
+
+def revoke_access_tokens(user_id):
+    # Tokens can not outlive ACCESS_TOKEN_MAX_AGE, so neither has the revocation entry to.
+    cache.set(_revocation_cache_key(user_id), int(time.time()), timeout=settings.ACCESS_TOKEN_MAX_AGE)
+
+
+def issue_access_token(user: User) -> str:
+    claims = {
+        'uid': str(user.id),
+        'lvl': user.user_level,
+        'iat': int(time.time()),
+    }
+    return signing.dumps(claims, salt=ACCESS_TOKEN_SALT)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Stateless authentication with a HMAC signed access token: `Authorization: Bearer <token>`.
+
+    The token carries the user id and user level, so no database access is needed to
+    authenticate or to run the permission checks. `request.user` is an unsaved `User`
+    built from those claims, it can be used in queries but has no other fields set.
+    """
+    keyword = 'bearer'
+    www_authenticate_realm = 'api'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+
+        try:
+            claims = signing.loads(auth[1].decode('utf-8'), salt=ACCESS_TOKEN_SALT,
+                                   max_age=settings.ACCESS_TOKEN_MAX_AGE)
+        except signing.SignatureExpired:
+            raise AuthenticationFailed('Token has expired.')
+        except (signing.BadSignature, UnicodeDecodeError):
+            raise AuthenticationFailed('Invalid token.')
+
+        revoked_at = cache.get(_revocation_cache_key(claims['uid']))
+        if revoked_at is not None and claims['iat'] <= revoked_at:
+            raise AuthenticationFailed('Token has been revoked.')
+
+        return User(id=claims['uid'], user_level=claims['lvl']), claims
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="%s"' % self.www_authenticate_realm
+
+
+class _BasicCredentials(BasicAuthentication):
+    """Only parses the Basic auth header, `authenticate` returns the (username, password) it carries."""
+
+    def authenticate_credentials(self, userid, password, request=None):
+        return userid, password
+
+
+def _get_active_user(username: str) -> Optional[User]:
+    # `is_active` is not a field of User, ModelBackend does the same check on the instance.
+    user = User.objects.filter(username=username).first()
+    return user if user is not None and user.is_active else None
+
+
+async def authenticate_async(request):
+    """
+    Authenticates a request to a plain Django async view, like CachedBasicAuthentication
+    followed by SignedTokenAuthentication would. Returns (user, auth), or None when the
+    request carries no credentials.
+
+    Nothing here blocks the event loop: on a credentials cache miss the User is loaded in a
+    worker thread, and the password is hashed in another one (hashlib releases the GIL).
+    """
+    credentials = _BasicCredentials().authenticate(request)
+    if credentials is None:
+        # A HMAC check and a cache lookup, no database access.
+        return SignedTokenAuthentication().authenticate(request)
+
+    username, password = credentials
+    user = _get_verified_user(username, password)
+    if user is not None:
+        return user, None
+
+    user = await run_in_worker(_get_active_user, username)
+    if user is None:
+        # Hash anyway, like ModelBackend, so that response times do not tell which usernames exist.
+        await sync_to_async(make_password, thread_sensitive=False)(password)
+        raise AuthenticationFailed('Invalid username/password.')
+    # Unlike User.check_password, this never upgrades (saves) the stored hash.
+    if not await sync_to_async(check_password, thread_sensitive=False)(password, user.password):
+        raise AuthenticationFailed('Invalid username/password.')
+    _remember_verified_user(username, password, user)
+    return user, None
@@ -0,0 +1,49 @@
+from functools import wraps
+from typing import Iterable, Sequence
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+
+from userman.authentication import authenticate_async
+
+
+def _error(message: str, status_code: int) -> JsonResponse:
+    response = JsonResponse({'detail': message}, status=status_code)
+    if status_code == status.HTTP_401_UNAUTHORIZED:
+        # What DRF answers with, the header of the first authentication class.
+        response['WWW-Authenticate'] = 'Basic realm="api"'
+    return response
+
+
+def async_api_view(methods: Sequence[str], permission_classes: Iterable = ()):
+    """
+    The counterpart of DRF's `api_view`, `authentication_classes` and `permission_classes` for
+    async function views, which DRF does not support. Requests are authenticated with
+    `authenticate_async`, and errors are answered the way DRF would.
+    """
+    permission_classes = list(permission_classes)
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return _error(f'Method "{request.method}" not allowed.', status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                authenticated = await authenticate_async(request)
+            except AuthenticationFailed as e:
+                return _error(str(e.detail), status.HTTP_401_UNAUTHORIZED)
+            # Replaces the session based (and lazily loaded, so blocking) user of AuthenticationMiddleware.
+            request.user, request.auth = authenticated or (AnonymousUser(), None)
+
+            for permission_class in permission_classes:
+                if not permission_class().has_permission(request, view):
+                    if authenticated is None:
+                        return _error('Authentication credentials were not provided.',
+                                      status.HTTP_401_UNAUTHORIZED)
+                    return _error('You do not have permission to perform this action.',
+                                  status.HTTP_403_FORBIDDEN)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,45 @@
+import base64
+import time
+
+from django.core.cache import caches
+from django.core.management import BaseCommand
+from django.db import transaction
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.test import APIRequestFactory
+
+from userman.authentication import CREDENTIALS_CACHE, CachedBasicAuthentication
+from userman.models import User
+from userman.views import get_user_details
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/sec of get_user_details with plain and cached Basic authentication.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+
+    def run(self, authentication_class, requests):
+        view = get_user_details.cls.as_view(authentication_classes=[authentication_class])
+        factory = APIRequestFactory()
+        credentials = base64.b64encode(b'benchuser:benchpass').decode('utf-8')
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = view(factory.get('/user/', HTTP_AUTHORIZATION=f'Basic {credentials}'))
+            assert response.status_code == 200, response.content
+        return requests / (time.perf_counter() - started)
+
+    def handle(self, *args, **options):
+        requests = options['requests']
+        with transaction.atomic():
+            User.objects.create_user(
+                username='benchuser', password='benchpass', phone_number='9876543200', name='Bench User')
+            caches[CREDENTIALS_CACHE].clear()
+
+            plain = self.run(BasicAuthentication, requests)
+            cached = self.run(CachedBasicAuthentication, requests)
+            # The benchmark user is not meant to stay around.
+            transaction.set_rollback(True)
+        caches[CREDENTIALS_CACHE].clear()
+
+        self.stdout.write(f'BasicAuthentication:       {plain:10.1f} requests/sec')
+        self.stdout.write(f'CachedBasicAuthentication: {cached:10.1f} requests/sec ({cached / plain:.1f}x)')
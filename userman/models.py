@@ -3,7 +3,7 @@ from django.contrib.auth.models import (
     PermissionsMixin,
     UserManager,
 )
-from django.db import models
+from django.db import models, transaction
 from reversion import revisions as reversion
 
 from utils.models import BaseUUIDModel
@@ -34,5 +34,27 @@ class User(BaseUUIDModel, AbstractBaseUser, PermissionsMixin):
     # Just for admin access
     is_staff = models.BooleanField(default=False)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The user level as loaded (or last saved), None if deferred.
+        self._saved_user_level = self.__dict__.get('user_level')
+
+    def save(self, *args, **kwargs):
+        # Set by `set_password` until the new hash is saved.
+        password_changed = self._password is not None
+        level_changed = 'user_level' in self.__dict__ and self.user_level != self._saved_user_level
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        self._saved_user_level = self.__dict__.get('user_level')
+        from userman.authentication import forget_verified_credentials, revoke_access_tokens
+        if password_changed or level_changed:
+            # Cached logins (and the user level cached with them) must not outlive the change. Forgotten
+            # again on commit, as requests running meanwhile still verify against the old row.
+            forget_verified_credentials(self.username)
+            transaction.on_commit(lambda: forget_verified_credentials(self.username))
+        if level_changed and not adding:
+            # Issued tokens carry the user level as a claim, a demoted admin's (or a banned user's) would keep it.
+            revoke_access_tokens(self.id)
+
 
 reversion.register(User)
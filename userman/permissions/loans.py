@@ -3,11 +3,17 @@ from rest_framework.permissions import BasePermission
 from userman.models import UserLevel
 
 
+# Note: Only the user level is looked at, so token authenticated requests can be
+# decided from the token claims without loading the user.
+def _user_level(request):
+    return getattr(request.user, 'user_level', None)
+
+
 class ApplyLoanPermission(BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.user_level != UserLevel.BANNED
+        return request.user.is_authenticated and _user_level(request) != UserLevel.BANNED
 
 
 class ManageLoanPermission(BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.user_level == UserLevel.ADMIN
+        return _user_level(request) == UserLevel.ADMIN
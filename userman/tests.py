@@ -1,7 +1,12 @@
+import base64
+
+from django.conf import settings
+from django.core.cache import cache, caches
 from django.test import TestCase
 
 from django.urls import reverse
 
+from userman.authentication import CREDENTIALS_CACHE, _credentials_cache_key
 from userman.models import User, UserLevel
 
 
@@ -50,3 +55,125 @@ class UserValidationTests(TestCase):
         response = self.create_user("someuser", "somepassword", "Batman", "9876543211")
         self.assertEquals(response.status_code, 400)
         self.assertEquals(response.json(), {'message': {'username': ['user with this username already exists.']}})
+
+
+class CachedBasicAuthenticationTests(TestCase):
+    def setUp(self):
+        caches[CREDENTIALS_CACHE].clear()
+        self.user = User.objects.create_user(
+            username='someuser', password='somepassword', phone_number='9876543211', name='Batman')
+
+    def get_user_details(self, password='somepassword'):
+        user_pass = base64.b64encode(f'someuser:{password}'.encode('utf-8')).decode('utf-8')
+        return self.client.get(path=reverse('get_user_details'), HTTP_AUTHORIZATION=f'Basic {user_pass}')
+
+    def test_verified_credentials_are_cached(self):
+        self.assertEquals(self.get_user_details().status_code, 200)
+        # No user lookup and no password check for the repeat request.
+        with self.assertNumQueries(0):
+            response = self.get_user_details()
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()['username'], 'someuser')
+
+    def test_wrong_password_is_not_served_from_cache(self):
+        self.assertEquals(self.get_user_details().status_code, 200)
+        response = self.get_user_details(password='wrongpassword')
+        self.assertEquals(response.status_code, 401)
+        self.assertEquals(response.json(), {'detail': 'Invalid username/password.'})
+
+    def test_set_password_invalidates_cache(self):
+        self.assertEquals(self.get_user_details().status_code, 200)
+        self.user.set_password('newpassword')
+        self.user.save()
+        self.assertEquals(self.get_user_details().status_code, 401)
+        self.assertEquals(self.get_user_details(password='newpassword').status_code, 200)
+
+    def test_old_password_cached_before_the_save_is_forgotten(self):
+        self.user.set_password('newpassword')
+        # Still verified against the old hash in the database, and cached again.
+        self.assertEquals(self.get_user_details().status_code, 200)
+        self.user.save()
+        self.assertEquals(self.get_user_details().status_code, 401)
+
+    def test_demotion_invalidates_cache(self):
+        self.user.user_level = UserLevel.ADMIN
+        self.user.save()
+        user_pass = base64.b64encode(b'someuser:somepassword').decode('utf-8')
+        response = self.client.get(path=reverse('get_pending_loans'), HTTP_AUTHORIZATION=f'Basic {user_pass}')
+        self.assertEquals(response.status_code, 200)
+        self.user.user_level = UserLevel.REGULAR
+        self.user.save()
+        response = self.client.get(path=reverse('get_pending_loans'), HTTP_AUTHORIZATION=f'Basic {user_pass}')
+        self.assertEquals(response.status_code, 403)
+
+    def test_ban_invalidates_cache(self):
+        self.assertEquals(self.get_user_details().status_code, 200)
+        self.user.user_level = UserLevel.BANNED
+        self.user.save()
+        self.assertIsNone(caches[CREDENTIALS_CACHE].get(_credentials_cache_key('someuser')))
+
+
+class SignedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='someuser', password='somepassword', phone_number='9876543211', name='Batman')
+        self.admin = User.objects.create_user(
+            username='someadmin', password='somepassword', phone_number='9876543212', name='Alfred',
+            user_level=UserLevel.ADMIN)
+
+    def issue_token(self, username='someuser'):
+        user_pass = base64.b64encode(f'{username}:somepassword'.encode('utf-8')).decode('utf-8')
+        response = self.client.post(path=reverse('issue_token'), HTTP_AUTHORIZATION=f'Basic {user_pass}')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()['expires_in'], settings.ACCESS_TOKEN_MAX_AGE)
+        return response.json()['token']
+
+    def test_issue_token_requires_credentials(self):
+        response = self.client.post(path=reverse('issue_token'))
+        self.assertEquals(response.status_code, 401)
+
+    def test_token_authenticates_without_user_lookup(self):
+        token = self.issue_token()
+        # Only the loans are fetched, the user comes straight from the token.
+        with self.assertNumQueries(1):
+            response = self.client.get(path=reverse('get_user_loans'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEquals(response.status_code, 200)
+
+    def test_permissions_decided_from_token_claims(self):
+        token = self.issue_token()
+        response = self.client.get(path=reverse('get_pending_loans'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEquals(response.status_code, 403)
+
+        token = self.issue_token(username='someadmin')
+        response = self.client.get(path=reverse('get_pending_loans'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEquals(response.status_code, 200)
+
+    def test_tampered_token(self):
+        token = self.issue_token()
+        response = self.client.get(path=reverse('get_user_loans'), HTTP_AUTHORIZATION=f'Bearer {token}x')
+        self.assertEquals(response.status_code, 401)
+        self.assertEquals(response.json(), {'detail': 'Invalid token.'})
+
+    def test_expired_token(self):
+        token = self.issue_token()
+        with self.settings(ACCESS_TOKEN_MAX_AGE=-1):
+            response = self.client.get(path=reverse('get_user_loans'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEquals(response.status_code, 401)
+        self.assertEquals(response.json(), {'detail': 'Token has expired.'})
+
+    def test_demoted_admin_token_revoked(self):
+        token = self.issue_token(username='someadmin')
+        self.admin.user_level = UserLevel.REGULAR
+        self.admin.save()
+        response = self.client.get(path=reverse('get_pending_loans'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEquals(response.status_code, 401)
+        self.assertEquals(response.json(), {'detail': 'Token has been revoked.'})
+
+    def test_banned_user_token_revoked(self):
+        token = self.issue_token()
+        self.user.user_level = UserLevel.BANNED
+        self.user.save()
+        response = self.client.get(path=reverse('get_user_loans'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEquals(response.status_code, 401)
+        self.assertEquals(response.json(), {'detail': 'Token has been revoked.'})
@@ -1,9 +1,10 @@
 from django.conf.urls import url
 
-from userman.views import register_user, get_user_details
+from userman.views import register_user, get_user_details, issue_token
 
 
 urlpatterns = [
     url(r'register/$', register_user, name='register_user'),
+    url(r'token/$', issue_token, name='issue_token'),
     url(r'$', get_user_details, name='get_user_details'),
 ]
@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.http import JsonResponse
-from rest_framework.authentication import BasicAuthentication
-from rest_framework.decorators import api_view, authentication_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
 
+from .authentication import CachedBasicAuthentication, issue_access_token
 from .serializers import UserCreateSerializer, UserDetailsSerializer
 from rest_framework import status
 
@@ -22,8 +24,18 @@ def register_user(request) -> JsonResponse:
 
 
 @api_view(['GET'])
-@authentication_classes([BasicAuthentication])
+@authentication_classes([CachedBasicAuthentication])
 def get_user_details(request) -> JsonResponse:
     # Validating the request.
     serializer = UserDetailsSerializer(instance=request.user)
     return JsonResponse(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@authentication_classes([CachedBasicAuthentication])
+@permission_classes([IsAuthenticated, ])
+def issue_token(request) -> JsonResponse:
+    return JsonResponse(
+        {'token': issue_access_token(request.user), 'expires_in': settings.ACCESS_TOKEN_MAX_AGE},
+        status=status.HTTP_200_OK
+    )
@@ -0,0 +1,26 @@
+"""
+Helpers for the async views served under ASGI (LoanApp.asgi).
+
+Django 3.1 has no async ORM interface, every query has to run in a thread. `sync_to_async`
+defaults to thread sensitive mode, which runs the sync code of all of a worker's requests
+on one and the same thread, so that queries of concurrent requests would still queue up.
+`run_in_worker` runs them on the threads of the event loop's default executor instead.
+"""
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+
+async def run_in_worker(func, *args, **kwargs):
+    """
+    Awaits `func(*args, **kwargs)` run in a worker thread.
+
+    The thread's connections are closed (handed back to the pool) once `func` returns, as
+    request_finished only closes the connections of the thread it is sent on. Context variables,
+    like the replica picked by utils.routers.read_from_replicas, are visible to `func`.
+    """
+    def run():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return await sync_to_async(run, thread_sensitive=False)()
@@ -0,0 +1,84 @@
+import time
+from typing import Callable, Iterable, Optional
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# How long a rebuild may hold its lock, and how long others wait for it before rebuilding themselves.
+REBUILD_LOCK_TIMEOUT = 10
+REBUILD_WAIT = 2.0
+REBUILD_POLL_INTERVAL = 0.01
+
+
+def _generation_key(scope: str) -> str:
+    return f'generation:{scope}'
+
+
+def get_generations(cache: BaseCache, scopes: Iterable[str]) -> str:
+    """
+    The current generation of every scope, joined up to be part of a cache key.
+
+    Entries keyed on generations are never deleted, bumping a generation just makes them
+    unreachable, so a stale entry written by a request which raced an update can not be read.
+    """
+    scopes = list(scopes)
+    keys = [_generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Evicted or never set: start from a value no earlier generation can have had.
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return '.'.join(str(generations[key]) for key in keys)
+
+
+def _recently_bumped_key(scope: str) -> str:
+    return f'generation:{scope}:recent'
+
+
+def bump_generations(cache: BaseCache, scopes: Iterable[str], recent_for: Optional[int] = None):
+    """Bumps the generation of every scope, and marks it as recently bumped for `recent_for` seconds."""
+    for scope in scopes:
+        try:
+            cache.incr(_generation_key(scope))
+        except ValueError:
+            cache.set(_generation_key(scope), time.time_ns(), timeout=None)
+        if recent_for:
+            cache.set(_recently_bumped_key(scope), True, timeout=recent_for)
+
+
+def recently_bumped(cache: BaseCache, scopes: Iterable[str]) -> bool:
+    return bool(cache.get_many([_recently_bumped_key(scope) for scope in scopes]))
+
+
+def get_or_build(cache: BaseCache, key: str, build: Callable, timeout=DEFAULT_TIMEOUT):
+    """
+    Returns the cached value of `key`, calling `build` to produce (and cache) it on a miss.
+
+    Concurrent misses are coalesced: only the caller which gets the rebuild lock builds the
+    value, the others wait for it to show up in the cache. Should the builder not be done within
+    REBUILD_WAIT seconds, they build it themselves. `build` returning None is not cached.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:rebuilding'
+    if not cache.add(lock_key, 1, timeout=REBUILD_LOCK_TIMEOUT):
+        deadline = time.monotonic() + REBUILD_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(REBUILD_POLL_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+            if cache.get(lock_key) is None:
+                # The builder gave up (nothing to cache), no use waiting any longer.
+                break
+        return build()
+
+    try:
+        value = build()
+        if value is not None:
+            cache.set(key, value, timeout=timeout)
+        return value
+    finally:
+        cache.delete(lock_key)
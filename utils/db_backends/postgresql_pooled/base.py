@@ -0,0 +1,117 @@
+"""
+PostgreSQL backend which takes its connections from a per worker ConnectionPool.
+
+Django still "connects" and "closes" as usual (at the end of every request unless CONN_MAX_AGE
+says otherwise), but closing hands the connection back to the pool, and connecting checks one
+out, so the TCP, TLS and authentication handshakes are only paid when the pool grows. Configured
+with a POOL entry next to the other DATABASES settings, see `DEFAULT_POOL_OPTIONS`.
+"""
+import threading
+from typing import Optional
+
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from utils.db_pool import ConnectionPool
+
+from .creation import DatabaseCreation
+
+DEFAULT_POOL_OPTIONS = {
+    'MAX_SIZE': 10,     # Connections per worker process.
+    'MAX_IDLE': 300,    # Seconds before an unused connection gets closed.
+    'TIMEOUT': 30,      # Seconds to wait for a connection when they are all in use.
+    'PRE_PING': True,   # Check connections are alive before handing them out.
+}
+
+# alias -> (connection parameters, pool) of this worker.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _connect(conn_params: dict, isolation_level):
+    # The connection set up of base.DatabaseWrapper.get_new_connection, which is not bound to any wrapper.
+    connection = base.Database.connect(**conn_params)
+    if isolation_level is not None and isolation_level != connection.isolation_level:
+        connection.set_session(isolation_level=isolation_level)
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+def _ping(connection) -> bool:
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except Exception:
+        return False
+
+
+def get_pool(alias: str, conn_params: dict, settings_dict: dict) -> ConnectionPool:
+    with _pools_lock:
+        params, pool = _pools.get(alias, (None, None))
+        if pool is None or params != conn_params:
+            # Connection parameters only change when tests switch to the test database.
+            if pool is not None:
+                pool.close()
+            options = {**DEFAULT_POOL_OPTIONS, **settings_dict['POOL']}
+            isolation_level = settings_dict['OPTIONS'].get('isolation_level')
+            pool = ConnectionPool(
+                connect=lambda: _connect(conn_params, isolation_level),
+                max_size=options['MAX_SIZE'], max_idle=options['MAX_IDLE'], timeout=options['TIMEOUT'],
+                ping=_ping if options['PRE_PING'] else None,
+            )
+            _pools[alias] = (dict(conn_params), pool)
+        return pool
+
+
+def close_pools(database: str):
+    """Closes the pools of this worker connected to `database`, the connections checked out included once back."""
+    with _pools_lock:
+        aliases = [alias for alias, (params, _) in _pools.items() if params['database'] == database]
+        pools = [_pools.pop(alias)[1] for alias in aliases]
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats() -> dict:
+    """Statistics of the pools of this worker, by database alias."""
+    with _pools_lock:
+        return {alias: pool.stats() for alias, (_, pool) in _pools.items()}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    # The pool the current connection was checked out of, if any.
+    pool: Optional[ConnectionPool] = None
+
+    def get_new_connection(self, conn_params):
+        if self.settings_dict.get('POOL') is None:
+            self.pool = None
+            return super().get_new_connection(conn_params)
+        self.pool = get_pool(self.alias, conn_params, self.settings_dict)
+        connection = self.pool.checkout()
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        connection, reusable = self.connection, not self.connection.closed
+        if reusable and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            # Closed within a transaction (or after an error), none of it may leak to the next user.
+            try:
+                connection.rollback()
+            except Exception:
+                reusable = False
+        if reusable and not connection.autocommit:
+            # Closed within atomic(). Handed out like that, the pre-ping would start a transaction, and
+            # Django's connect() then fails to switch autocommit back on within it.
+            try:
+                connection.autocommit = True
+            except Exception:
+                reusable = False
+        self.pool.checkin(connection, reusable=reusable)
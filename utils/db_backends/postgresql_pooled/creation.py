@@ -0,0 +1,30 @@
+from django.db import connections
+from django.db.backends.postgresql import creation
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """
+    Test database creation which closes the pooled connections to a database before it is dropped
+    or used as a template, Postgres refuses both while anyone is connected. Closing a wrapper only
+    hands its connection back to the pool, so every pool connected to the database gets closed,
+    the ones of mirror (TEST.MIRROR) aliases and other threads' connections included.
+    """
+
+    def _close_pooled_connections(self, database_name: str):
+        from .base import close_pools
+        connections.close_all()
+        close_pools(database_name)
+
+    def _create_test_db(self, verbosity, autoclobber, keepdb=False):
+        # An existing test database gets dropped (autoclobber) and created again.
+        self._close_pooled_connections(self._get_test_db_name())
+        return super()._create_test_db(verbosity, autoclobber, keepdb)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        self._close_pooled_connections(self.connection.settings_dict['NAME'])
+        self._close_pooled_connections(self.get_test_db_clone_settings(suffix)['NAME'])
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        self._close_pooled_connections(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
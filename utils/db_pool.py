@@ -0,0 +1,134 @@
+"""
+A bounded pool of raw DB-API connections, shared by the threads of one worker process.
+
+Connections are handed out last in, first out, so that under light load the same few stay in
+use and the rest idle out. A connection idle for longer than `max_idle` seconds is closed
+rather than handed out again, and a connection which fails its pre-ping is replaced.
+"""
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect: Callable, max_size: int, max_idle: Optional[float] = None, timeout: float = 30,
+                 ping: Optional[Callable] = None):
+        if max_size < 1:
+            raise ValueError('A pool needs room for at least one connection.')
+        self.connect = connect
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.ping = ping
+
+        self._condition = threading.Condition()
+        # (connection, checked in at) pairs, the most recently checked in last.
+        self._idle: List[Tuple[object, float]] = []
+        self._size = 0
+        self._closed = False
+        self._checkouts = self._waits = self._evictions = 0
+        self._wait_time = 0.0
+
+    def _evict_idle(self) -> List:
+        # Idle connections are ordered by check in time, so the expired ones come first.
+        if self.max_idle is None:
+            return []
+        expired_before = time.monotonic() - self.max_idle
+        expired = [connection for connection, checked_in in self._idle if checked_in < expired_before]
+        if expired:
+            del self._idle[:len(expired)]
+            self._size -= len(expired)
+            self._evictions += len(expired)
+        return expired
+
+    def _take(self):
+        """An idle connection (or None to connect a new one) once there is room, under the lock."""
+        deadline, waited_since = None, None
+        while True:
+            expired = self._evict_idle()
+            if self._idle:
+                return self._idle.pop()[0], expired
+            if self._size < self.max_size:
+                self._size += 1
+                return None, expired
+            now = time.monotonic()
+            if waited_since is None:
+                waited_since, deadline = now, now + self.timeout
+                self._waits += 1
+            if now >= deadline or not self._condition.wait(deadline - now):
+                self._wait_time += time.monotonic() - waited_since
+                raise PoolTimeout(f'No connection available within {self.timeout} seconds.')
+            self._wait_time += time.monotonic() - waited_since
+            waited_since = time.monotonic()
+
+    def checkout(self):
+        while True:
+            with self._condition:
+                connection, expired = self._take()
+            for stale in expired:
+                _close_quietly(stale)
+            if connection is None:
+                try:
+                    connection = self.connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+            elif self.ping is not None and not self.ping(connection):
+                # Went away while idle (server restart, failover, network), replace it.
+                _close_quietly(connection)
+                with self._condition:
+                    self._evictions += 1
+                self._release_slot()
+                continue
+            with self._condition:
+                self._checkouts += 1
+            return connection
+
+    def checkin(self, connection, reusable: bool = True):
+        if not reusable or self._closed:
+            _close_quietly(connection)
+            self._release_slot()
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def close(self):
+        """Closes the idle connections, and the checked out ones as they come back."""
+        self._closed = True
+        self.close_idle()
+
+    def close_idle(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for connection, _ in idle:
+            _close_quietly(connection)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time': round(self._wait_time, 6),
+                'evictions': self._evictions,
+            }
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: int  # Seconds since the epoch, the resolution of Last-Modified.
+
+
+def get_validators(key, modified: datetime) -> Validators:
+    """Validators of the resource identified by `key`, which last changed at `modified`."""
+    return Validators(quote_etag(f'{key}-{modified.timestamp():.6f}'), int(modified.timestamp()))
+
+
+def set_validators(response: HttpResponse, validators: Validators) -> HttpResponse:
+    response['ETag'] = validators.etag
+    response['Last-Modified'] = http_date(validators.last_modified)
+    # Clients may keep the response around, but have to revalidate it before every use.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, validators: Validators) -> Optional[HttpResponse]:
+    """
+    Returns a 304 Not Modified response when the request's If-None-Match or If-Modified-Since
+    match `validators`, None when the full response has to be sent.
+    """
+    return get_conditional_response(request, etag=validators.etag, last_modified=validators.last_modified)
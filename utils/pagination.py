@@ -0,0 +1,116 @@
+import base64
+import binascii
+import json
+from typing import List, NamedTuple, Optional
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q, QuerySet
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+class KeysetPage(NamedTuple):
+    items: List
+    next_cursor: Optional[str]
+    previous_cursor: Optional[str]
+
+
+def _encode_cursor(direction, key_value, pk) -> str:
+    position = [direction, key_value.isoformat() if key_value is not None else None, str(pk)]
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, key_value, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if key_value is not None:
+            key_value = parse_datetime(key_value)
+            if key_value is None:
+                raise ValueError
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise InvalidPage('Invalid cursor.')
+    if direction not in (NEXT, PREVIOUS):
+        raise InvalidPage('Invalid cursor.')
+    return direction, key_value, pk
+
+
+def get_page_size(query_params, default: int, maximum: int) -> int:
+    try:
+        page_size = int(query_params.get('page_size', default))
+    except ValueError:
+        page_size = 0
+    if page_size <= 0:
+        raise InvalidPage('page_size should be a positive integer.')
+    return min(page_size, maximum)
+
+
+def _after(key, nullable, key_value, pk) -> Q:
+    # NULL keys sort after every other value.
+    if key_value is None:
+        return Q(**{f'{key}__isnull': True, 'id__gt': pk})
+    after = Q(**{f'{key}__gt': key_value}) | Q(**{key: key_value, 'id__gt': pk})
+    if nullable:
+        after |= Q(**{f'{key}__isnull': True})
+    return after
+
+
+def _before(key, key_value, pk) -> Q:
+    if key_value is None:
+        return Q(**{f'{key}__isnull': True, 'id__lt': pk}) | Q(**{f'{key}__isnull': False})
+    return Q(**{f'{key}__lt': key_value}) | Q(**{key: key_value, 'id__lt': pk})
+
+
+def _position(item, key):
+    # Items are model instances, or rows of `.values()`.
+    if isinstance(item, dict):
+        return item[key], item['id']
+    return getattr(item, key), item.pk
+
+
+def paginate_by_keyset(queryset: QuerySet, key: str, page_size: int, cursor: Optional[str] = None) -> KeysetPage:
+    """
+    Returns the page of `queryset` ordered by (`key`, id) which follows (or precedes) `cursor`.
+
+    Pages are fetched by filtering on the position of the cursor instead of an OFFSET,
+    so with an index on (..., key, id) every page costs the same as the first one.
+    `key` has to be a datetime field, NULL values are ordered last. A queryset of `.values()`
+    works too, as long as the values include `key` and id.
+    """
+    nullable = queryset.model._meta.get_field(key).null
+    direction, key_value, pk = _decode_cursor(cursor) if cursor else (NEXT, None, None)
+    try:
+        pk = queryset.model._meta.pk.to_python(pk)
+    except ValidationError:
+        raise InvalidPage('Invalid cursor.')
+
+    if direction == NEXT:
+        queryset = queryset.order_by(F(key).asc(nulls_last=True), 'id')
+        if cursor:
+            queryset = queryset.filter(_after(key, nullable, key_value, pk))
+    else:
+        queryset = queryset.order_by(F(key).desc(nulls_first=True), '-id')
+        queryset = queryset.filter(_before(key, key_value, pk))
+
+    items = list(queryset[:page_size + 1])
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if direction == PREVIOUS:
+        items.reverse()
+    if not items:
+        return KeysetPage(items, None, None)
+
+    first, last = items[0], items[-1]
+    has_next = has_more if direction == NEXT else True
+    has_previous = bool(cursor) if direction == NEXT else has_more
+    return KeysetPage(
+        items,
+        _encode_cursor(NEXT, *_position(last, key)) if has_next else None,
+        _encode_cursor(PREVIOUS, *_position(first, key)) if has_previous else None,
+    )
@@ -0,0 +1,20 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class JSONLinesParser(BaseParser):
+    """
+    Parses newline delimited JSON (one JSON document per line) into a list.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            return [json.loads(line) for line in stream.read().decode(encoding).splitlines() if line.strip()]
+        except ValueError as exc:
+            raise ParseError('JSON lines parse error - %s' % str(exc))
@@ -0,0 +1,94 @@
+"""
+Routing of the reads of selected endpoints to the read replicas (settings.REPLICA_DATABASES).
+
+Reads only go to a replica within a view decorated with `read_from_replicas`, everything else
+(writes, and every read outside of those views) stays on the primary. A user who just changed
+something is pinned to the primary for PRIMARY_PIN_SECONDS with `pin_to_primary`, so that
+replication lag never shows them their own data from before the change.
+
+Pins live in the default cache. It is only shared by the worker processes with MEMCACHED_SERVERS
+set, otherwise a pin only holds for the requests served by the worker which made the change.
+"""
+import asyncio
+import random
+from contextlib import contextmanager
+from functools import wraps
+from typing import Optional
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# Per request (thread or task): the replica picked for its reads, if any. Being context local,
+# it is also seen by the code an async view runs through sync_to_async.
+_state = Local()
+
+
+def _pin_cache_key(user_id) -> str:
+    return f'routers:pinned:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(_pin_cache_key(user_id), True, timeout=settings.PRIMARY_PIN_SECONDS)
+
+
+def is_pinned_to_primary(user_id) -> bool:
+    return cache.get(_pin_cache_key(user_id)) is not None
+
+
+def get_replica(user_id) -> Optional[str]:
+    """The replica to read from on behalf of `user_id`, None for the primary."""
+    if not settings.REPLICA_DATABASES or (user_id is not None and is_pinned_to_primary(user_id)):
+        return None
+    return random.choice(settings.REPLICA_DATABASES)
+
+
+def current_read_database() -> str:
+    """Where reads of the current request go, for work outliving the view (like streamed responses)."""
+    return getattr(_state, 'replica', None) or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def _reading_from(replica: Optional[str]):
+    previous = getattr(_state, 'replica', None)
+    _state.replica = replica
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def read_from_replicas(view):
+    """
+    Sends the reads of a (read-only, authenticated) function view to a replica. Goes right above the def.
+    Async views are supported as well.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with _reading_from(get_replica(request.user.id)):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with _reading_from(get_replica(request.user.id)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'replica', None)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the very same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication.
+        return db == DEFAULT_DB_ALIAS
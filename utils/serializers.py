@@ -0,0 +1,119 @@
+import decimal
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+
+def _decimal_converter(field: serializers.DecimalField) -> Callable:
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.decimal_places is None:
+        return field.to_representation
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            return field.to_representation(value)
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def _datetime_converter(field: serializers.DateTimeField) -> Callable:
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if not settings.USE_TZ or output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+    def convert(value):
+        if not value or isinstance(value, str) or timezone.is_naive(value):
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def _uuid_converter(field: serializers.UUIDField) -> Optional[Callable]:
+    return str if field.uuid_format == 'hex_verbose' else field.to_representation
+
+
+def _related_converter(field: serializers.PrimaryKeyRelatedField) -> Optional[Callable]:
+    # The JSON encoder takes care of the raw primary key.
+    return None if field.pk_field is None else field.pk_field.to_representation
+
+
+def _field_converter(field: serializers.Field) -> Optional[Callable]:
+    """A function turning a database value into what `field.to_representation` returns, None for the value itself."""
+    if isinstance(field, serializers.DecimalField):
+        return _decimal_converter(field)
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_converter(field)
+    if isinstance(field, serializers.UUIDField):
+        return _uuid_converter(field)
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        return _related_converter(field)
+    # Values read back from the database already are what these would return.
+    if isinstance(field, (serializers.ChoiceField, serializers.CharField, serializers.IntegerField,
+                          serializers.BooleanField)):
+        return None
+    return field.to_representation
+
+
+class ValuesSerializer:
+    """
+    Serializes rows of `.values(*sources)` exactly like `serializer_class` serializes model instances.
+
+    A ModelSerializer goes through its fields' introspection for every single instance. Here the
+    fields are looked at once and turned into plain converter functions, so that serializing a row
+    only costs a function call per field. Only plain model fields are supported as sources.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def _model_fields(self) -> List[Tuple[str, str, str, serializers.Field]]:
+        serializer = self.serializer_class()
+        model_meta = serializer.Meta.model._meta
+        fields = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or '.' in field.source:
+                raise ValueError(f'{self.serializer_class.__name__}.{name} is not a plain model field.')
+            fields.append((name, field.source, model_meta.get_field(field.source).attname, field))
+        return fields
+
+    @property
+    def sources(self) -> List[str]:
+        """The fields to pass to `.values()`."""
+        return [source for _, source, _, _ in self._model_fields]
+
+    def _converters(self) -> List[Tuple[str, str, str, Optional[Callable]]]:
+        # Compiled per call rather than once: the current timezone may have changed in the meantime.
+        return [(name, source, attname, _field_converter(field)) for name, source, attname, field in self._model_fields]
+
+    def serialize(self, rows) -> List[Dict]:
+        """Serializes `rows` of `.values(*self.sources)`, extra keys are ignored."""
+        converters = self._converters()
+        serialized = []
+        for row in rows:
+            item = {}
+            for name, source, _, convert in converters:
+                value = row[source]
+                item[name] = value if convert is None or value is None else convert(value)
+            serialized.append(item)
+        return serialized
+
+    def serialize_instances(self, instances) -> List[Dict]:
+        """Same as `serialize`, for model instances which did not come out of the database."""
+        return self.serialize(
+            {source: getattr(instance, attname) for _, source, attname, _ in self._model_fields}
+            for instance in instances
+        )
@@ -0,0 +1,160 @@
+import base64
+import threading
+import time
+from unittest import skipUnless
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from userman.models import User, UserLevel
+from utils.db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.alive = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.connected = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.connected.append(connection)
+        return connection
+
+    def pool(self, **kwargs):
+        return ConnectionPool(self.connect, ping=lambda connection: connection.alive, **kwargs)
+
+    def test_connections_are_reused(self):
+        pool = self.pool(max_size=2)
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        second = pool.checkout()
+        self.assertIsNot(second, first)
+        self.assertEquals(len(self.connected), 2)
+        self.assertEquals(pool.stats()['checkouts'], 3)
+
+    def test_bounded_with_waits(self):
+        pool = self.pool(max_size=1, timeout=0.05)
+        connection = pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+
+        threading.Timer(0.05, pool.checkin, args=(connection,)).start()
+        pool.timeout = 5
+        self.assertIs(pool.checkout(), connection)
+        stats = pool.stats()
+        self.assertEquals((stats['size'], stats['waits']), (1, 2))
+        self.assertGreater(stats['wait_time'], 0.05)
+
+    def test_dead_connections_are_replaced(self):
+        pool = self.pool(max_size=1)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        connection.alive = False
+        replacement = pool.checkout()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEquals(pool.stats()['evictions'], 1)
+
+        # Connections which can not be reused make room for a new one.
+        pool.checkin(replacement, reusable=False)
+        self.assertTrue(replacement.closed)
+        self.assertEquals(pool.stats()['size'], 0)
+
+    def test_closed_pool_closes_connections_coming_back(self):
+        pool = self.pool(max_size=2)
+        idle, checked_out = pool.checkout(), pool.checkout()
+        pool.checkin(idle)
+        pool.close()
+        self.assertTrue(idle.closed)
+        self.assertFalse(checked_out.closed)
+        pool.checkin(checked_out)
+        self.assertTrue(checked_out.closed)
+        self.assertEquals(pool.stats()['size'], 0)
+
+    def test_idle_connections_are_evicted(self):
+        pool = self.pool(max_size=2, max_idle=0.05)
+        first, second = pool.checkout(), pool.checkout()
+        pool.checkin(first)
+        time.sleep(0.1)
+        pool.checkin(second)
+        self.assertIs(pool.checkout(), second)
+        self.assertTrue(first.closed)
+        stats = pool.stats()
+        self.assertEquals((stats['size'], stats['idle'], stats['evictions']), (1, 0, 1))
+
+    def test_failed_connects_free_their_slot(self):
+        pool = ConnectionPool(lambda: 1 / 0, max_size=1)
+        for _ in range(2):
+            with self.assertRaises(ZeroDivisionError):
+                pool.checkout()
+        self.assertEquals(pool.stats()['size'], 0)
+
+
+class DatabasePoolStatsTests(TestCase):
+    def test_admins_only(self):
+        User.objects.create_user(
+            username='customer1', password='customer1pass', phone_number='9876543211', name='Bruce Wayne')
+        User.objects.create_user(
+            username='admin1', password='admin1pass', phone_number='8876543212', name='Shark',
+            user_level=UserLevel.ADMIN)
+        for username, status_code in (('customer1', 403), ('admin1', 200)):
+            credentials = base64.b64encode(f'{username}:{username}pass'.encode('utf-8')).decode('utf-8')
+            response = self.client.get(
+                path=reverse('get_database_pool_stats'), HTTP_AUTHORIZATION=f'Basic {credentials}')
+            self.assertEquals(response.status_code, status_code)
+        if connection.vendor == 'postgresql':
+            self.assertIn(DEFAULT_DB_ALIAS, response.json()['pools'])
+        else:
+            # Nothing is pooled on SQLite.
+            self.assertEquals(response.json(), {'pools': {}})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Only Postgres connections are pooled.')
+class PooledConnectionTests(TransactionTestCase):
+    def test_connection_closed_within_atomic_is_reused(self):
+        with transaction.atomic():
+            User.objects.count()
+            closed = connection.connection
+            connection.close()
+        self.assertEquals(User.objects.count(), 0)
+        self.assertIs(connection.connection, closed)
+        self.assertTrue(connection.get_autocommit())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Only Postgres connections are pooled.')
+class PooledTestDatabaseTests(TransactionTestCase):
+    """Test databases are dropped (and cloned) the way the test runner does, with pooled connections to them."""
+
+    def tearDown(self):
+        if 'clone' in connections.databases:
+            connections['clone'].close()
+            del connections['clone']
+            del connections.databases['clone']
+
+    def test_databases_with_pooled_connections_can_be_dropped(self):
+        from utils.db_backends.postgresql_pooled.base import pool_stats
+        User.objects.count()
+        # Postgres copies the template only while no one is connected to it, the pooled connections included.
+        connection.creation.clone_test_db(suffix='clone', verbosity=0)
+        clone = connection.creation.get_test_db_clone_settings('clone')
+        # Connected like a TEST.MIRROR alias, the connection is back in its pool after the close.
+        connections.databases['clone'] = clone
+        self.assertEquals(connections['clone'].cursor().connection.get_dsn_parameters()['dbname'], clone['NAME'])
+        connections['clone'].close()
+        self.assertEquals(pool_stats()['clone']['idle'], 1)
+
+        connection.creation.destroy_test_db(verbosity=0, suffix='clone')
+        self.assertNotIn('clone', pool_stats())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_database WHERE datname = %s', [clone['NAME']])
+            self.assertIsNone(cursor.fetchone())
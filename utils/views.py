@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, authentication_classes
+
+from userman.authentication import CachedBasicAuthentication, SignedTokenAuthentication
+from userman.permissions.loans import ManageLoanPermission
+
+POOLED_ENGINE = 'utils.db_backends.postgresql_pooled'
+
+
+@api_view(['GET'])
+@permission_classes([ManageLoanPermission, ])
+@authentication_classes([CachedBasicAuthentication, SignedTokenAuthentication])
+def get_database_pool_stats(request) -> JsonResponse:
+    """Connection pool statistics of the worker serving the request, by database alias."""
+    if not any(database['ENGINE'] == POOLED_ENGINE for database in settings.DATABASES.values()):
+        return JsonResponse({'pools': {}}, status=status.HTTP_200_OK)
+    # Imported only once there are pools, the backend needs psycopg2, which other deployments may not have.
+    from utils.db_backends.postgresql_pooled.base import pool_stats
+    return JsonResponse({'pools': pool_stats()}, status=status.HTTP_200_OK)